@@ -0,0 +1,206 @@
+"""
+Admission control: per-route-class concurrency limits with bounded queues.
+
+Every HTTP request is put in a route class (auth, reads, writes, chatbot,
+admin_analytics) before routing. Each class runs at most `limit` requests at
+once; others wait in a FIFO queue of at most `queue` entries for at most
+`max_wait` seconds. A request is turned away with 503 right away when the
+queue is full or when, at the class's recent service time, it could not be
+started within `max_wait`. Otherwise it gets 503 once it has waited that long.
+
+Health checks, metrics scrapes, CORS preflights and WebSocket connections are
+never queued, so monitoring and live chats keep working while HTTP is shed.
+
+Every admitted request can hold a DB connection (chatbot requests hold theirs
+while LangGraph answers), so each class's limit is its share of the worker's
+DB pool (DB_POOL_MAX_SIZE) and all classes together admit about one request per
+pooled connection. Limits are per worker and can be tuned with
+ADMISSION_<CLASS>_LIMIT, _QUEUE and _WAIT_MS.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+from .telemetry import counter, gauge, histogram
+
+# Same setting as database.DB_POOL_MAX_SIZE (database imports this module)
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+
+# Route class -> (share of the DB pool, queue, max wait ms); shares add up to 1
+DEFAULT_LIMITS = {
+    "auth": (0.1, 32, 3000),
+    "reads": (0.4, 128, 2000),
+    "writes": (0.2, 64, 2000),
+    "chatbot": (0.2, 16, 1000),
+    "admin_analytics": (0.1, 4, 5000),
+}
+
+_BYPASS_PATHS = {"/health", "/internal/metrics"}
+_ADMIN_ANALYTICS_PATHS = {"/api/admin/statistics", "/api/admin/query-stats"}
+
+admission_rejected = counter(
+    "admission_rejected_total",
+    "Requests turned away by admission control",
+    ("route_class", "reason"),
+)
+admission_wait = histogram(
+    "admission_wait_seconds",
+    "Time admitted requests spent queued",
+    ("route_class",),
+)
+
+
+def route_class(scope) -> Optional[str]:
+    """Admission class of a request, or None if it is never queued"""
+    if scope["type"] != "http":
+        return None
+    path, method = scope["path"], scope["method"]
+    if path in _BYPASS_PATHS or method == "OPTIONS":
+        return None
+    if path.startswith(("/api/auth/", "/api/jwt/")):
+        return "auth"
+    if path == "/api/chat/chatbot" and method == "POST":
+        return "chatbot"
+    if path in _ADMIN_ANALYTICS_PATHS:
+        return "admin_analytics"
+    if method in ("GET", "HEAD"):
+        return "reads"
+    return "writes"
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class RouteClassLimiter:
+    def __init__(self, name: str, limit: int, queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long admitted requests hold their slot
+        self.service_time = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue:
+            raise Overloaded("queue_full")
+        # Requests ahead of us finish at roughly `limit` per service time
+        if self.service_time * (len(self._waiters) + 1) / self.limit > self.max_wait:
+            raise Overloaded("predicted_wait")
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return  # The slot was handed over as the deadline passed
+            waiter.cancel()
+            raise Overloaded("deadline")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # Pass on a slot we were given but can't use
+            waiter.cancel()
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self):
+        # Hand the slot straight to the oldest live waiter so it can't be overtaken
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def observe(self, elapsed: float):
+        self.service_time = elapsed if not self.service_time else 0.8 * self.service_time + 0.2 * elapsed
+
+
+def _load_limiters() -> Dict[str, RouteClassLimiter]:
+    limiters = {}
+    for name, (share, queue, wait_ms) in DEFAULT_LIMITS.items():
+        env = f"ADMISSION_{name.upper()}"
+        limiters[name] = RouteClassLimiter(
+            name,
+            limit=int(os.getenv(f"{env}_LIMIT", max(1, round(DB_POOL_MAX_SIZE * share)))),
+            queue=int(os.getenv(f"{env}_QUEUE", queue)),
+            max_wait=float(os.getenv(f"{env}_WAIT_MS", wait_ms)) / 1000,
+        )
+    return limiters
+
+
+limiters = _load_limiters()
+
+
+def _active_stats():
+    return {(name,): limiter.active for name, limiter in limiters.items()}
+
+
+def _queued_stats():
+    return {(name,): limiter.queued for name, limiter in limiters.items()}
+
+
+admission_active = gauge(
+    "admission_active_requests",
+    "Requests currently admitted, by route class",
+    ("route_class",),
+    collect=_active_stats,
+)
+admission_queued = gauge(
+    "admission_queued_requests",
+    "Requests waiting for admission, by route class",
+    ("route_class",),
+    collect=_queued_stats,
+)
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        name = route_class(scope)
+        limiter = limiters.get(name) if name else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        queued_at = time.perf_counter()
+        try:
+            await limiter.acquire()
+        except Overloaded as e:
+            admission_rejected.inc(name, e.reason)
+            response = JSONResponse(
+                {"detail": "Máy chủ đang quá tải, vui lòng thử lại sau"},
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        admission_wait.observe(started - queued_at, name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.observe(time.perf_counter() - started)
+            limiter.release()
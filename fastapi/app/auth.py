@@ -5,11 +5,14 @@ import asyncpg
 import secrets
 import hashlib
 from datetime import datetime, timedelta
-from .database import get_db_connection
+from .database import RequestDB
 from .jwt_auth import get_current_user_jwt, decode_token
+from .user_cache import user_cache
+from .sessions import session_activity
 
 async def get_current_user(
     request: Request,
+    db: RequestDB,
     x_user_id: Optional[str] = Header(None),
     x_session_token: Optional[str] = Header(None),
 ) -> dict:
@@ -28,7 +31,10 @@ async def get_current_user(
                 if payload.get("type") == "access":
                     user_id = payload.get("sub")
                     if user_id:
-                        async with get_db_connection() as conn:
+                        user_dict = user_cache.get(user_id)
+                        if user_dict is None:
+                            generation = user_cache.generation
+                            conn = await db.get()
                             user = await conn.fetchrow(
                                 """
                                 SELECT id, ho_ten, email, so_dien_thoai, dia_chi, role, 
@@ -38,12 +44,16 @@ async def get_current_user(
                                 """,
                                 user_id
                             )
+                            await db.release_unless_shared()
                             
                             if user:
                                 user_dict = dict(user)
                                 user_dict['id'] = str(user_dict['id'])
-                                print(f"[AUTH] User authenticated via JWT: {user_dict.get('ho_ten')} (role: {user_dict.get('role')})")
-                                return user_dict
+                                user_cache.put(user_id, user_dict, generation)
+                        
+                        if user_dict:
+                            print(f"[AUTH] User authenticated via JWT: {user_dict.get('ho_ten')} (role: {user_dict.get('role')})")
+                            return user_dict
         except Exception as e:
             print(f"[AUTH] JWT authentication failed: {e}")
             # Fall through to session auth
@@ -58,61 +68,92 @@ async def get_current_user(
             detail="Authentication required"
         )
     
-    async with get_db_connection() as conn:
-        # Check session if token provided
-        if x_session_token:
-            session = await conn.fetchrow(
-                """
-                SELECT s.*, u.id as user_id, u.ho_ten, u.email, u.so_dien_thoai, 
-                       u.dia_chi, u.role, u.diem_tich_luy, u.ngay_tao
-                FROM user_sessions s
-                JOIN users u ON s.user_id = u.id
-                WHERE s.session_token = $1 
-                  AND s.user_id = $2 
-                  AND s.is_active = true 
-                  AND s.expires_at > NOW()
-                """,
-                x_session_token,
-                x_user_id
-            )
-            
-            if session:
-                # Update last activity
-                await conn.execute(
-                    "UPDATE user_sessions SET last_activity = NOW() WHERE id = $1",
-                    session['id']
-                )
-                
-                user_dict = {
-                    'id': str(session['user_id']),
-                    'ho_ten': session['ho_ten'],
-                    'email': session['email'],
-                    'so_dien_thoai': session['so_dien_thoai'],
-                    'dia_chi': session['dia_chi'],
-                    'role': session['role'],
-                    'diem_tich_luy': session['diem_tich_luy'],
-                    'ngay_tao': session['ngay_tao'],
-                }
-                print(f"[AUTH] User authenticated via session: {user_dict.get('ho_ten')} (role: {user_dict.get('role')})")
-                return user_dict
-        
-        # Fallback to user lookup (for backward compatibility)
-        user = await conn.fetchrow(
-            "SELECT id, ho_ten, email, so_dien_thoai, dia_chi, role, diem_tich_luy, ngay_tao FROM users WHERE id = $1",
+    conn = await db.get()
+    # Check session if token provided
+    if x_session_token:
+        session = await conn.fetchrow(
+            """
+            SELECT s.*, u.id as user_id, u.ho_ten, u.email, u.so_dien_thoai, 
+                   u.dia_chi, u.role, u.diem_tich_luy, u.ngay_tao
+            FROM user_sessions s
+            JOIN users u ON s.user_id = u.id
+            WHERE s.session_token = $1 
+              AND s.user_id = $2 
+              AND s.is_active = true 
+              AND s.expires_at > NOW()
+            """,
+            x_session_token,
             x_user_id
         )
         
-        if not user:
-            print(f"[AUTH] User not found for id: {x_user_id}")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid user"
-            )
-        
-        user_dict = dict(user)
-        user_dict['id'] = str(user_dict['id'])  # Ensure UUID is string
-        print(f"[AUTH] User authenticated: {user_dict.get('ho_ten')} (role: {user_dict.get('role')})")
-        return user_dict
+        if session:
+            await db.release_unless_shared()
+            # Update last activity (written in batches by the session flusher)
+            session_activity.touch(session['id'])
+            
+            user_dict = {
+                'id': str(session['user_id']),
+                'ho_ten': session['ho_ten'],
+                'email': session['email'],
+                'so_dien_thoai': session['so_dien_thoai'],
+                'dia_chi': session['dia_chi'],
+                'role': session['role'],
+                'diem_tich_luy': session['diem_tich_luy'],
+                'ngay_tao': session['ngay_tao'],
+            }
+            print(f"[AUTH] User authenticated via session: {user_dict.get('ho_ten')} (role: {user_dict.get('role')})")
+            return user_dict
+    
+    # Fallback to user lookup (for backward compatibility)
+    user = await conn.fetchrow(
+        "SELECT id, ho_ten, email, so_dien_thoai, dia_chi, role, diem_tich_luy, ngay_tao FROM users WHERE id = $1",
+        x_user_id
+    )
+    await db.release_unless_shared()
+    
+    if not user:
+        print(f"[AUTH] User not found for id: {x_user_id}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid user"
+        )
+    
+    user_dict = dict(user)
+    user_dict['id'] = str(user_dict['id'])  # Ensure UUID is string
+    print(f"[AUTH] User authenticated: {user_dict.get('ho_ten')} (role: {user_dict.get('role')})")
+    return user_dict
+
+async def get_current_claims(
+    request: Request,
+    db: RequestDB,
+    x_user_id: Optional[str] = Header(None),
+    x_session_token: Optional[str] = Header(None),
+) -> dict:
+    """
+    Identity of the caller as {'id', 'role', 'ho_ten'} for endpoints that only
+    need who is calling. Read from the access token without touching the
+    database; tokens without embedded claims and session auth fall back to
+    get_current_user. Role may lag by up to one access-token lifetime, so
+    permission checks that must see a fresh role keep using get_current_user.
+    """
+    authorization = request.headers.get("Authorization")
+    if authorization:
+        parts = authorization.split()
+        if len(parts) == 2 and parts[0].lower() == "bearer":
+            try:
+                payload = decode_token(parts[1])
+            except HTTPException:
+                payload = {}
+            if (
+                payload.get("type") == "access"
+                and payload.get("sub")
+                and payload.get("role")
+                and payload.get("name")
+            ):
+                return {"id": payload["sub"], "role": payload["role"], "ho_ten": payload["name"]}
+    
+    user = await get_current_user(request, db, x_user_id, x_session_token)
+    return {"id": user["id"], "role": user["role"], "ho_ten": user["ho_ten"]}
 
 async def require_admin(current_user: dict = None):
     """Check if user is admin"""
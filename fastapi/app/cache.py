@@ -0,0 +1,353 @@
+"""
+Two-tier shared cache: a small in-process LRU in front of Redis.
+
+Values are stored in Redis as JSON so every worker and container can reuse a
+result computed by any of them. Each worker additionally keeps recently used
+values in memory for up to `local_ttl` seconds (0 skips the local tier, for
+callers that already keep their own in-process copy).
+
+Keys belong to a namespace whose version is part of every Redis key, so
+`invalidate_all()` drops the whole namespace with one INCR; it also publishes
+on the invalidation bus so every worker evicts its local tier and forgets the
+version it had read (versions are reused for a few seconds). `get_or_load()`
+runs at most one loader per key in this process and, through a short Redis
+lock, usually only one across all workers.
+
+Without REDIS_HOST (or without the redis package) an in-memory stand-in with
+the same interface is used, which also serves tests. That tier is then private
+to each worker, so bus events evict it along with the local tier.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+from fastapi.encoders import jsonable_encoder
+
+from .invalidation import invalidation_bus
+from .telemetry import counter
+
+REDIS_HOST = os.getenv("REDIS_HOST")
+REDIS_PORT = int(os.getenv("REDIS_PORT") or "6379")
+DEFAULT_TTL = float(os.getenv("REDIS_TTL") or "300")
+LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL_SECONDS", "5"))
+LOCAL_MAX_ENTRIES = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "1000"))
+# How long other workers wait for a fill in progress before loading themselves
+FILL_LOCK_SECONDS = float(os.getenv("CACHE_FILL_LOCK_SECONDS", "10"))
+# How long a namespace version read from Redis is reused; invalidation events
+# drop it sooner, this bounds staleness if one is missed
+VERSION_TTL = float(os.getenv("CACHE_VERSION_TTL_SECONDS", "5"))
+
+# Put on a single-flight future when its leader was cancelled: waiters load themselves
+_RETRY = object()
+
+T = TypeVar("T")
+
+cache_lookups = counter(
+    "cache_lookups_total",
+    "Shared cache lookups by namespace and the tier that answered",
+    ("namespace", "result"),
+)
+
+
+class InMemoryRedis:
+    """The subset of the redis.asyncio API used here, kept in process memory"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], str]] = {}
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._live(key)
+
+    async def set(self, key: str, value, ex: float = None, px: int = None, nx: bool = False):
+        if nx and self._live(key) is not None:
+            return None
+        ttl = ex if ex is not None else (px / 1000 if px is not None else None)
+        self._data[key] = (time.monotonic() + ttl if ttl else None, str(value))
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    async def incr(self, key: str) -> int:
+        value = int(self._live(key) or 0) + 1
+        expires_at = self._data.get(key, (None, None))[0]
+        self._data[key] = (expires_at, str(value))
+        return value
+
+    async def aclose(self):
+        self._data.clear()
+
+    def delete_matching(self, pattern: "re.Pattern") -> int:
+        """Drop every key the pattern fully matches (synchronous, for bus handlers)"""
+        keys = [key for key in self._data if pattern.fullmatch(key)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+
+def _create_backend():
+    if REDIS_HOST:
+        try:
+            import redis.asyncio as redis  # Only needed when REDIS_HOST is configured
+        except ImportError:
+            print("[CACHE] redis package not installed, using in-memory cache")
+        else:
+            print(f"[CACHE] Using Redis at {REDIS_HOST}:{REDIS_PORT}")
+            return redis.Redis(
+                host=REDIS_HOST, port=REDIS_PORT, decode_responses=True, socket_timeout=0.5
+            )
+    return InMemoryRedis()
+
+
+class LocalLRU:
+    """Per-worker front tier with per-entry expiry"""
+
+    def __init__(self, max_entries: int = LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+
+class SharedCache:
+    def __init__(self):
+        self.remote = _create_backend()
+        self.local = LocalLRU()
+        self.namespaces: Dict[str, "Namespace"] = {}
+
+    def namespace(
+        self,
+        name: str,
+        ttl: float = DEFAULT_TTL,
+        local_ttl: float = LOCAL_TTL,
+        decode: Optional[Callable[[Any], Any]] = None,
+    ) -> "Namespace":
+        namespace = Namespace(self, name, ttl, min(local_ttl, ttl), decode)
+        self.namespaces[name] = namespace
+        invalidation_bus.subscribe(name, namespace.evict_local)
+        return namespace
+
+    async def close(self):
+        try:
+            await self.remote.aclose()
+        except Exception as e:
+            print(f"[CACHE] Failed to close backend: {e}")
+
+
+class Namespace(Generic[T]):
+    """
+    A group of keys sharing a TTL and a version. `decode` turns the JSON value
+    read back from Redis into T (e.g. a model); values are JSON-encoded with
+    jsonable_encoder on the way in. Values returned from the local tier are
+    shared between callers and must not be mutated.
+    """
+
+    def __init__(self, cache: SharedCache, name: str, ttl: float, local_ttl: float,
+                 decode: Optional[Callable[[Any], T]] = None):
+        self.cache = cache
+        self.name = name
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.decode = decode or (lambda value: value)
+        # Bumped by invalidate_all(); a fill that raced one is not stored locally
+        self._generation = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._version = None
+        self._version_expires_at = 0.0
+
+    @property
+    def _version_key(self) -> str:
+        return f"cache:{self.name}:version"
+
+    def _local_key(self, key: str) -> str:
+        return f"{self.name}:{key}"
+
+    async def _remote_key(self, key: str) -> str:
+        version = self._version
+        if version is None or self._version_expires_at < time.monotonic():
+            generation = self._generation
+            version = await self.cache.remote.get(self._version_key) or 0
+            # A version read across an invalidation may already be outdated
+            if generation == self._generation:
+                self._version = version
+                self._version_expires_at = time.monotonic() + VERSION_TTL
+        return f"cache:{self.name}:v{version}:{key}"
+
+    async def get(self, key: str) -> Optional[T]:
+        """Cached value or None; a Redis failure is treated as a miss"""
+        if self.local_ttl > 0:
+            found, value = self.cache.local.get(self._local_key(key))
+            if found:
+                cache_lookups.inc(self.name, "local")
+                return value
+        try:
+            raw = await self.cache.remote.get(await self._remote_key(key))
+        except Exception as e:
+            print(f"[CACHE] {self.name}: read failed for {key}: {e}")
+            raw = None
+        if raw is None:
+            cache_lookups.inc(self.name, "miss")
+            return None
+        cache_lookups.inc(self.name, "remote")
+        value = self.decode(json.loads(raw))
+        if self.local_ttl > 0:
+            self.cache.local.set(self._local_key(key), value, self.local_ttl)
+        return value
+
+    async def set(self, key: str, value: T, ttl: Optional[float] = None) -> T:
+        """Store a value; returns it as readers will see it (after the JSON round trip)"""
+        try:
+            remote_key = await self._remote_key(key)
+        except Exception as e:
+            print(f"[CACHE] {self.name}: write failed for {key}: {e}")
+            remote_key = None
+        return await self._store(key, remote_key, value, ttl or self.ttl, self._generation)
+
+    async def _store(self, key: str, remote_key: Optional[str], value: T, ttl: float,
+                     generation: int) -> T:
+        raw = json.dumps(jsonable_encoder(value), ensure_ascii=False, separators=(",", ":"))
+        stored = self.decode(json.loads(raw))
+        # A value loaded before an invalidation must not reach the local tier
+        if self.local_ttl > 0 and generation == self._generation:
+            self.cache.local.set(self._local_key(key), stored, min(ttl, self.local_ttl))
+        # The in-memory stand-in's version only moves with this worker's own
+        # invalidations, so a fill that raced another worker's must not be kept
+        if isinstance(self.cache.remote, InMemoryRedis) and generation != self._generation:
+            remote_key = None
+        if remote_key is not None:
+            try:
+                await self.cache.remote.set(remote_key, raw, px=int(ttl * 1000))
+            except Exception as e:
+                print(f"[CACHE] {self.name}: write failed for {key}: {e}")
+        return stored
+
+    async def delete(self, key: str):
+        """Drop one key. Racing fills may write it back; use invalidate_all() after writes"""
+        self.cache.local.delete(self._local_key(key))
+        try:
+            await self.cache.remote.delete(await self._remote_key(key))
+        except Exception as e:
+            print(f"[CACHE] {self.name}: delete failed for {key}: {e}")
+        await invalidation_bus.publish(self.name, key)
+
+    def evict_local(self, key: Optional[str] = None):
+        """Drop this worker's copy of one key, or of the whole namespace"""
+        if isinstance(self.cache.remote, InMemoryRedis):
+            # Not shared with other workers, so it would keep what they invalidated
+            suffix = re.escape(key) if key is not None else ".*"
+            self.cache.remote.delete_matching(re.compile(rf"cache:{re.escape(self.name)}:v\d+:{suffix}"))
+        if key is not None:
+            self.cache.local.delete(self._local_key(key))
+            return
+        self._generation += 1
+        self._version = None
+        self._inflight.clear()
+        self.cache.local.delete_prefix(self._local_key(""))
+
+    async def invalidate_all(self):
+        """
+        Drop every key in the namespace by moving to a new version, and evict
+        the local tier on every worker. Fills that started earlier write under
+        the old version, so they cannot bring back stale data.
+        """
+        try:
+            await self.cache.remote.incr(self._version_key)
+        except Exception as e:
+            print(f"[CACHE] {self.name}: version bump failed: {e}")
+        await invalidation_bus.publish(self.name)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[T]],
+                          ttl: Optional[float] = None) -> T:
+        """Cached value, or the result of one shared `loader()` call on a miss"""
+        value = await self.get(key)
+        if value is not None:
+            return value
+        while key in self._inflight:
+            value = await asyncio.shield(self._inflight[key])
+            if value is not _RETRY:
+                return value
+        future = self._inflight[key] = asyncio.get_event_loop().create_future()
+        try:
+            value = await self._fill(key, loader, ttl or self.ttl)
+        except asyncio.CancelledError:
+            # Only this caller went away (e.g. its client disconnected)
+            future.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise it; don't log it as unretrieved
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _fill(self, key: str, loader: Callable[[], Awaitable[T]], ttl: float) -> T:
+        generation = self._generation
+        remote_key = lock_key = None
+        try:
+            remote_key = await self._remote_key(key)
+            lock_key = f"{remote_key}:lock"
+            if not await self.cache.remote.set(lock_key, "1", px=int(FILL_LOCK_SECONDS * 1000), nx=True):
+                # Another worker is filling this key; wait for its result
+                lock_key = None
+                deadline = time.monotonic() + FILL_LOCK_SECONDS
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    raw = await self.cache.remote.get(remote_key)
+                    if raw is not None:
+                        cache_lookups.inc(self.name, "remote")
+                        return self.decode(json.loads(raw))
+        except Exception as e:
+            print(f"[CACHE] {self.name}: fill lock failed for {key}: {e}")
+            lock_key = None
+
+        try:
+            return await self._store(key, remote_key, await loader(), ttl, generation)
+        finally:
+            if lock_key:
+                try:
+                    await self.cache.remote.delete(lock_key)
+                except Exception:
+                    pass  # Expires on its own
+
+
+shared_cache = SharedCache()
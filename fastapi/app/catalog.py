@@ -0,0 +1,166 @@
+"""
+In-process reference catalog for rarely changing lookup tables
+(medicine types, pharmacies and active classification criteria).
+
+Each table is loaded once, kept in memory together with a pre-encoded JSON
+body and an ETag, and reloaded lazily after an invalidation or once its TTL
+has passed. Writers call `invalidate()`, which drops the shared copy and
+publishes on the invalidation bus so that every uvicorn worker marks its
+local copy stale.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from .cache import shared_cache
+from .database import get_db_connection
+from .invalidation import invalidation_bus
+
+# Seconds a loaded table is trusted. Criteria are edited directly in the
+# database, where nothing calls invalidate(), so they expire quickly
+CATALOG_TTLS = {"loai_thuoc": 3600, "nha_thuoc": 3600, "tieu_chi_phan_loai": 60}
+
+# Rows are shared between workers through Redis; the local tier is this module
+catalog_caches = {
+    table: shared_cache.namespace(f"catalog:{table}", ttl=ttl, local_ttl=0)
+    for table, ttl in CATALOG_TTLS.items()
+}
+
+
+class CatalogTable:
+    """Versioned snapshot of one reference table"""
+
+    def __init__(self, table: str, order_by: str, where: Optional[str] = None):
+        self.table = table
+        self.order_by = order_by
+        self.where = where
+        self.version = 0
+        self.rows: List[dict] = []
+        self.ids: Set[UUID] = set()
+        self.body = b"[]"
+        self.etag = ""
+        self._generation = 0
+        self._loaded_generation = -1
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_generation != self._generation or self._expires_at < time.monotonic()
+
+    def mark_stale(self):
+        self._generation += 1
+
+    async def ensure_fresh(self):
+        """Reload the snapshot if it was invalidated since the last load"""
+        if not self.is_stale:
+            return
+        async with self._lock:
+            if not self.is_stale:
+                return
+            generation = self._generation
+            snapshot = await catalog_caches[self.table].get_or_load("snapshot", self._fetch_snapshot)
+            records = snapshot["rows"]
+            # Expire with the shared copy: it may have been filled by another worker a while ago
+            age = max(0.0, time.time() - snapshot["loaded_at"])
+            expires_at = time.monotonic() + CATALOG_TTLS[self.table] - age
+            body = json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+            self.rows = records
+            self.ids = {UUID(row["id"]) for row in records}
+            self.body = body
+            self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            self.version += 1
+            # A concurrent invalidation during the load keeps the table stale
+            self._loaded_generation = generation
+            self._expires_at = expires_at
+            print(f"[CATALOG] Loaded {len(records)} rows from {self.table} (v{self.version})")
+
+    async def fetch_existing(self, record_ids: Iterable[UUID]) -> Set[UUID]:
+        """Which of the ids are rows of the table right now (bypassing the snapshot)"""
+        where = f" AND {self.where}" if self.where else ""
+        async with get_db_connection() as conn:
+            rows = await conn.fetch(
+                f"SELECT id FROM {self.table} WHERE id = ANY($1::uuid[]){where}",
+                list(record_ids)
+            )
+        return {row["id"] for row in rows}
+
+    async def _fetch_snapshot(self) -> dict:
+        where = f" WHERE {self.where}" if self.where else ""
+        async with get_db_connection() as conn:
+            rows = await conn.fetch(
+                f"SELECT * FROM {self.table}{where} ORDER BY {self.order_by}"
+            )
+        return {"loaded_at": time.time(), "rows": jsonable_encoder([dict(row) for row in rows])}
+
+
+class ReferenceCatalog:
+    """Holds the catalog tables; each follows its cache namespace's invalidations"""
+
+    def __init__(self):
+        self.tables: Dict[str, CatalogTable] = {
+            "loai_thuoc": CatalogTable("loai_thuoc", "ten_hoat_chat"),
+            "nha_thuoc": CatalogTable("nha_thuoc", "ten_nha_thuoc"),
+            "tieu_chi_phan_loai": CatalogTable(
+                "tieu_chi_phan_loai", "ngay_tao ASC", where="hoat_dong = true"
+            ),
+        }
+        for table, entry in self.tables.items():
+            invalidation_bus.subscribe(
+                catalog_caches[table].name, lambda key, entry=entry: entry.mark_stale()
+            )
+
+    def get(self, table: str) -> CatalogTable:
+        return self.tables[table]
+
+    async def start(self):
+        """Load every table"""
+        for entry in self.tables.values():
+            entry.mark_stale()
+            await entry.ensure_fresh()
+
+    async def snapshot(self, table: str) -> CatalogTable:
+        entry = self.tables[table]
+        await entry.ensure_fresh()
+        return entry
+
+    async def contains(self, table: str, record_id: UUID) -> bool:
+        """O(1) existence check; a miss is confirmed with one primary-key query"""
+        return not await self.missing(table, [record_id])
+
+    async def missing(self, table: str, record_ids: Iterable[UUID]) -> Set[UUID]:
+        """Return the subset of ids that do not exist in the table"""
+        entry = await self.snapshot(table)
+        wanted = {UUID(str(record_id)) for record_id in record_ids}
+        absent = wanted - entry.ids
+        if absent:
+            # The row may have been created on another worker before its NOTIFY
+            # arrived. Ask the table instead of reloading it, so unknown ids
+            # cost an index lookup rather than a full reload each
+            absent -= await entry.fetch_existing(absent)
+        return absent
+
+    async def invalidate(self, table: str):
+        """Drop the local and shared copies and tell the other workers to do the same"""
+        await catalog_caches[table].invalidate_all()
+
+
+catalog = ReferenceCatalog()
+
+
+def catalog_response(request: Request, entry: CatalogTable) -> Response:
+    """Serve a catalog table from its pre-encoded body with ETag revalidation"""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in tags or entry.etag in tags or f"W/{entry.etag}" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
@@ -0,0 +1,115 @@
+"""
+Single-flight coalescing of identical concurrent GET requests.
+
+For the routes it is configured with, the middleware lets the first request
+(the leader) run normally while recording its response messages. Identical
+requests arriving before it finishes (followers) wait and get a replay of the
+same response instead of running the handler and its queries again.
+
+Requests are identical when method, path and query string match, plus the
+request headers the response depends on: conditional headers always, and the
+credentials too for PER_USER routes. A follower whose leader fails or produces
+an oversized response runs the request itself.
+"""
+import asyncio
+import copy
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .telemetry import counter
+
+PUBLIC = "public"
+PER_USER = "user"
+
+# Responses larger than this are streamed to the leader only
+MAX_BODY_BYTES = int(os.getenv("COALESCE_MAX_BODY_BYTES", str(1024 * 1024)))
+
+_CONDITIONAL_HEADERS = (b"if-none-match", b"if-modified-since")
+_CREDENTIAL_HEADERS = (b"authorization", b"x-user-id", b"x-session-token", b"cookie")
+
+coalesced_requests = counter(
+    "http_coalesced_requests_total",
+    "Requests to coalesced routes, by whether they ran (leader) or replayed (follower)",
+    ("route", "role"),
+)
+
+
+class CoalescingMiddleware:
+    def __init__(self, app, routes: Dict[str, str]):
+        self.app = app
+        self.routes = routes
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _key(self, scope, mode: str) -> str:
+        wanted = _CONDITIONAL_HEADERS + (_CREDENTIAL_HEADERS if mode == PER_USER else ())
+        digest = hashlib.sha256()
+        digest.update(scope["method"].encode())
+        digest.update(b"\0" + scope["path"].encode() + b"\0" + scope.get("query_string", b""))
+        for name, value in sorted(scope["headers"]):
+            if name in wanted:
+                digest.update(b"\0" + name + b"=" + value)
+        return digest.hexdigest()
+
+    async def __call__(self, scope, receive, send):
+        mode = self.routes.get(scope.get("path")) if scope["type"] == "http" else None
+        if mode is None or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        key = self._key(scope, mode)
+        flight = self._inflight.get(key)
+        if flight is not None:
+            result = await asyncio.shield(flight)
+            if result is not None:
+                coalesced_requests.inc(scope["path"], "follower")
+                messages, leader_scope = result
+                _copy_route(leader_scope, scope)
+                # Outer middleware (CORS) edits messages in place; each replay gets its own copy
+                for message in messages:
+                    await send(copy.deepcopy(message))
+                return
+            # Leader failed or its response was not kept; serve this one normally
+            await self.app(scope, receive, send)
+            return
+
+        flight = self._inflight[key] = asyncio.get_event_loop().create_future()
+        coalesced_requests.inc(scope["path"], "leader")
+        await self._lead(scope, receive, send, key, flight)
+
+    async def _lead(self, scope, receive, send, key: str, flight: asyncio.Future):
+        messages: Optional[List[dict]] = []
+        size = 0
+        complete = False
+
+        async def capture(message):
+            nonlocal messages, size, complete
+            if messages is not None:
+                size += len(message.get("body", b""))
+                if size > MAX_BODY_BYTES:
+                    messages = None
+                else:
+                    # Copied before the leader's own send passes it through outer middleware
+                    messages.append(copy.deepcopy(message))
+                    if message["type"] == "http.response.body" and not message.get("more_body"):
+                        complete = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+            result: Optional[Tuple[List[dict], dict]] = None
+            if messages is not None and complete:
+                result = (messages, scope)
+            flight.set_result(result)
+
+
+def _copy_route(source, target):
+    """Give a replayed request the matched route, for metrics labelled by route"""
+    if "route" in source:
+        target["route"] = source["route"]
+    context = source.get("fastapi", {}).get("effective_route_context")
+    if context is not None:
+        target.setdefault("fastapi", {})["effective_route_context"] = context
@@ -1,9 +1,16 @@
 import os
+import json
 import asyncio
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import Annotated, Any, AsyncGenerator, Awaitable, Callable, List, Optional
+import time
 import asyncpg
 from asyncpg.pool import Pool
+from fastapi import Depends, Request
+
+from .telemetry import db_pool_acquire_wait
+from .query_stats import InstrumentedConnection, should_sample
+from .timeouts import POOL_STATEMENT_TIMEOUT, apply_statement_timeout
 
 DATABASE_URL = os.getenv(
     "DATABASE_URL", 
@@ -12,6 +19,20 @@ DATABASE_URL = os.getenv(
 
 # Global connection pool
 _pool: Pool | None = None
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+
+# Connections one fan_out() call may hold at once, so a single request can't drain the pool
+FANOUT_MAX_CONCURRENCY = int(os.getenv("DB_FANOUT_MAX_CONCURRENCY", "3"))
+
+async def init_connection(connection: asyncpg.Connection):
+    """Decode json/jsonb columns (e.g. json_agg results) straight into Python objects"""
+    for type_name in ("json", "jsonb"):
+        await connection.set_type_codec(
+            type_name,
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema="pg_catalog"
+        )
 
 async def get_pool() -> Pool:
     """Get or create database connection pool"""
@@ -25,9 +46,14 @@ async def get_pool() -> Pool:
             try:
                 _pool = await asyncpg.create_pool(
                     DATABASE_URL,
-                    min_size=2,
-                    max_size=10,
-                    command_timeout=60
+                    min_size=min(2, DB_POOL_MAX_SIZE),
+                    max_size=DB_POOL_MAX_SIZE,
+                    command_timeout=60,
+                    init=init_connection,
+                    # Session default, restored by RESET ALL on release; setup only
+                    # sends a SET when the acquiring request needs another timeout
+                    server_settings={"statement_timeout": str(POOL_STATEMENT_TIMEOUT)},
+                    setup=apply_statement_timeout
                 )
                 print(f"✅ Connected to database successfully")
                 break
@@ -47,9 +73,145 @@ async def close_pool():
         await _pool.close()
         _pool = None
 
+async def _acquire(pool: Pool) -> asyncpg.Connection:
+    started = time.perf_counter()
+    connection = await pool.acquire()
+    db_pool_acquire_wait.observe(time.perf_counter() - started)
+    return connection
+
+def _maybe_instrument(connection: asyncpg.Connection, instrument: Optional[bool] = None):
+    if instrument or (instrument is None and should_sample()):
+        return InstrumentedConnection(connection)
+    return connection
+
 @asynccontextmanager
-async def get_db_connection() -> AsyncGenerator[asyncpg.Connection, None]:
-    """Context manager for database connections"""
+async def get_db_connection(instrument: Optional[bool] = None) -> AsyncGenerator[asyncpg.Connection, None]:
+    """
+    Context manager for database connections.
+    `instrument=True` records per-statement stats (see query_stats); by default
+    a DB_QUERY_SAMPLE_RATE fraction of connections is instrumented.
+    """
     pool = await get_pool()
-    async with pool.acquire() as connection:
-        yield connection
+    connection = await _acquire(pool)
+    try:
+        yield _maybe_instrument(connection, instrument)
+    finally:
+        await pool.release(connection)
+
+class RequestConnection:
+    """
+    One pooled connection per request, acquired on first use and released when
+    the handler returns. Auth dependencies and the handler receive the same
+    instance (FastAPI caches dependencies per request), so an authenticated
+    request holds at most one connection instead of acquiring one per step.
+    When the handler itself doesn't take RequestDB (`shared` is False), auth
+    hands the connection back right after its lookup, so it is never held
+    alongside one the handler opens with get_db_connection().
+    """
+    
+    def __init__(self, shared: bool = True):
+        self._connection: Optional[asyncpg.Connection] = None
+        self._transaction = None
+        self.read_only = False
+        self.shared = shared
+    
+    async def get(self) -> asyncpg.Connection:
+        """The request's connection, acquiring it from the pool on the first call"""
+        if self._connection is None:
+            self._connection = await _acquire(await get_pool())
+            if self.read_only:
+                await self._begin_read_only()
+        return _maybe_instrument(self._connection)
+    
+    async def use_read_only(self):
+        """Run the rest of the request in a READ ONLY transaction (one consistent snapshot)"""
+        self.read_only = True
+        if self._connection is not None and self._transaction is None:
+            await self._begin_read_only()
+    
+    async def _begin_read_only(self):
+        self._transaction = self._connection.transaction(isolation="repeatable_read", readonly=True)
+        await self._transaction.start()
+    
+    async def release_unless_shared(self):
+        """Called by auth dependencies once they are done with the connection"""
+        if not self.shared:
+            await self.release()
+    
+    async def release(self, failed: bool = False):
+        connection, transaction = self._connection, self._transaction
+        self._connection = self._transaction = None
+        if connection is None:
+            return
+        try:
+            if transaction is not None:
+                if failed:
+                    await transaction.rollback()
+                else:
+                    await transaction.commit()
+        finally:
+            await (await get_pool()).release(connection)
+
+# Route -> whether its endpoint declares RequestDB / ReadOnlyDB itself
+_routes_taking_request_db: dict = {}
+
+def _handler_takes_request_db(scope) -> bool:
+    route = scope.get("route")
+    dependant = getattr(route, "dependant", None)
+    if dependant is None:
+        return True
+    takes = _routes_taking_request_db.get(id(route))
+    if takes is None:
+        takes = _routes_taking_request_db[id(route)] = any(
+            dependency.call in (request_connection, read_only_request_connection)
+            for dependency in dependant.dependencies
+        )
+    return takes
+
+async def request_connection(request: Request) -> AsyncGenerator[RequestConnection, None]:
+    db = RequestConnection(shared=_handler_takes_request_db(request.scope))
+    try:
+        yield db
+    except BaseException:
+        await db.release(failed=True)
+        raise
+    await db.release()
+
+async def read_only_request_connection(
+    db: RequestConnection = Depends(request_connection, scope="function"),
+) -> RequestConnection:
+    await db.use_read_only()
+    return db
+
+# Shared per-request connection; declare handler parameters as `db: RequestDB`
+RequestDB = Annotated[RequestConnection, Depends(request_connection, scope="function")]
+# Same connection, with the handler's queries in a read-only snapshot transaction
+ReadOnlyDB = Annotated[RequestConnection, Depends(read_only_request_connection)]
+
+async def fan_out(
+    *queries: Callable[[asyncpg.Connection], Awaitable[Any]],
+    max_concurrency: Optional[int] = None
+) -> List[Any]:
+    """
+    Run independent read queries concurrently, each on its own pooled connection.
+    Each query is a callable taking a connection, e.g.
+    `lambda conn: conn.fetchval("SELECT COUNT(*) FROM users")`.
+    Results come back in argument order; the first failure cancels the rest.
+    """
+    pool = await get_pool()
+    limit = asyncio.Semaphore(max_concurrency or FANOUT_MAX_CONCURRENCY)
+    
+    async def run(query):
+        async with limit:
+            connection = await _acquire(pool)
+            try:
+                return await query(_maybe_instrument(connection))
+            finally:
+                await pool.release(connection)
+    
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(run(query)) for query in queries]
+    except ExceptionGroup as errors:
+        raise errors.exceptions[0]
+    return [task.result() for task in tasks]
@@ -0,0 +1,130 @@
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+Writers publish `(namespace, key)` events on one channel; a key of None means
+the whole namespace. Every worker keeps a single LISTEN connection and hands
+each event to the handlers subscribed to its namespace, which evict their
+local copies. Publishing through the writer's own connection inside a
+transaction delivers the event only when (and if) the transaction commits.
+
+Events sent while the listener is disconnected are lost, so on disconnect and
+again after reconnecting every subscriber is flushed (called with key None).
+"""
+import asyncio
+import json
+import os
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+
+from .database import DATABASE_URL, get_db_connection
+
+INVALIDATION_CHANNEL = "cache_invalidate"
+# The listener is pinged this often so a silently dropped connection is noticed
+PING_INTERVAL = float(os.getenv("INVALIDATION_PING_SECONDS", "30"))
+
+Handler = Callable[[Optional[str]], None]
+
+
+class InvalidationBus:
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._listener: Optional[asyncpg.Connection] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._ping_task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def subscribe(self, namespace: str, handler: Handler):
+        """Call `handler(key)` for every event in `namespace` (key None = everything)"""
+        self._handlers.setdefault(namespace, []).append(handler)
+
+    def dispatch(self, namespace: str, key: Optional[str] = None):
+        """Evict in this worker only"""
+        for handler in self._handlers.get(namespace, ()):
+            try:
+                handler(key)
+            except Exception as e:
+                print(f"[INVALIDATION] Handler for {namespace} failed: {e}")
+
+    def flush(self):
+        for namespace in self._handlers:
+            self.dispatch(namespace)
+
+    async def publish(self, namespace: str, key=None, conn=None):
+        """
+        Evict locally right away and tell every worker (including this one,
+        after commit when `conn` is inside a transaction) to evict too.
+        """
+        key = None if key is None else str(key)
+        self.dispatch(namespace, key)
+        payload = json.dumps({"ns": namespace, "key": key})
+        try:
+            if conn is not None:
+                await conn.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, payload)
+            else:
+                async with get_db_connection() as own_conn:
+                    await own_conn.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, payload)
+        except Exception as e:
+            if conn is not None:
+                raise
+            print(f"[INVALIDATION] Failed to publish {namespace}/{key}: {e}")
+
+    async def start(self):
+        self._closing = False
+        await self._connect_listener()
+        if self._ping_task is None and PING_INTERVAL > 0:
+            self._ping_task = asyncio.get_event_loop().create_task(self._ping_loop())
+
+    async def stop(self):
+        self._closing = True
+        for task in (self._reconnect_task, self._ping_task):
+            if task:
+                task.cancel()
+        self._reconnect_task = self._ping_task = None
+        if self._listener and not self._listener.is_closed():
+            await self._listener.close()
+        self._listener = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+            self.dispatch(event["ns"], event.get("key"))
+        except (ValueError, KeyError, TypeError):
+            print(f"[INVALIDATION] Ignoring malformed event: {payload!r}")
+
+    def _on_termination(self, connection):
+        # Events may have been missed while disconnected
+        self.flush()
+        if not self._closing and (self._reconnect_task is None or self._reconnect_task.done()):
+            self._reconnect_task = asyncio.get_event_loop().create_task(self._reconnect())
+
+    async def _connect_listener(self):
+        self._listener = await asyncpg.connect(DATABASE_URL)
+        self._listener.add_termination_listener(self._on_termination)
+        await self._listener.add_listener(INVALIDATION_CHANNEL, self._on_notify)
+        print(f"[INVALIDATION] Listening on channel {INVALIDATION_CHANNEL}")
+
+    async def _reconnect(self):
+        while not self._closing:
+            try:
+                await self._connect_listener()
+                self.flush()
+                return
+            except (OSError, asyncpg.PostgresError) as e:
+                print(f"[INVALIDATION] Listener reconnect failed: {e}")
+                await asyncio.sleep(2)
+
+    async def _ping_loop(self):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            listener = self._listener
+            if listener is None or listener.is_closed():
+                continue
+            try:
+                await listener.execute("SELECT 1", timeout=5)
+            except Exception as e:
+                print(f"[INVALIDATION] Listener ping failed, reconnecting: {e}")
+                listener.terminate()  # Runs _on_termination
+
+
+invalidation_bus = InvalidationBus()
@@ -1,23 +1,45 @@
 """JWT Authentication module"""
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
+import hashlib
 import os
+import time
 
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Header
 
-from .database import get_db_connection
-from .utils.password import verify_password as verify_password_bcrypt
+from .database import RequestDB
+from .telemetry import counter, gauge
+from .user_cache import user_cache
+from .utils.password import verify_password_async
 
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 30
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash using existing bcrypt implementation"""
+# Embed role and name in access tokens so get_current_claims needs no DB lookup
+EMBED_CLAIMS = os.getenv("JWT_EMBED_CLAIMS", "true").lower() in ("1", "true", "yes")
+# Verified tokens remembered per worker (0 disables the cache)
+TOKEN_CACHE_SIZE = int(os.getenv("JWT_TOKEN_CACHE_SIZE", "10000"))
+
+# sha256(token) -> verified payload, least recently used first
+_token_cache: "OrderedDict[bytes, dict]" = OrderedDict()
+token_cache_lookups = counter(
+    "jwt_token_cache_lookups_total",
+    "Verified-token cache lookups by result (hit, miss, expired)",
+    ("result",),
+)
+gauge(
+    "jwt_token_cache_entries",
+    "Verified tokens currently cached",
+    collect=lambda: {(): len(_token_cache)},
+)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash on the bcrypt worker pool"""
     try:
         # Truncate password to 72 bytes if needed (bcrypt limit)
         password_bytes = plain_password.encode('utf-8')
@@ -27,7 +49,9 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         else:
             truncated_password = plain_password
         
-        return verify_password_bcrypt(truncated_password, hashed_password)
+        return await verify_password_async(truncated_password, hashed_password)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[JWT_AUTH] Password verification error: {e}")
         return False
@@ -46,6 +70,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def access_token_claims(user) -> dict:
+    """Claims for a user's access token; role/name go stale until the token is refreshed"""
+    claims = {"sub": str(user["id"])}
+    if EMBED_CLAIMS:
+        claims.update({"role": user["role"], "name": user["ho_ten"]})
+    return claims
+
+
 def create_refresh_token(data: dict) -> str:
     """Create a JWT refresh token"""
     to_encode = data.copy()
@@ -55,20 +87,47 @@ def create_refresh_token(data: dict) -> str:
     return encoded_jwt
 
 
+def _invalid_token(reason: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=f"Invalid token: {reason}",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
 def decode_token(token: str) -> dict:
-    """Decode and verify a JWT token"""
+    """
+    Decode and verify a JWT token.
+    Successfully verified tokens are cached by digest until their exp, so
+    repeated requests with the same token skip the signature check.
+    """
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    payload = _token_cache.get(digest)
+    if payload is not None:
+        # Same whole-second comparison jose uses, so cached and fresh checks agree
+        if payload.get("exp", 0) >= int(time.time()):
+            _token_cache.move_to_end(digest)
+            token_cache_lookups.inc("hit")
+            return dict(payload)
+        del _token_cache[digest]
+        token_cache_lookups.inc("expired")
+        raise _invalid_token("Signature has expired.")
+    
+    token_cache_lookups.inc("miss")
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Invalid token: {str(e)}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _invalid_token(str(e))
+    
+    if TOKEN_CACHE_SIZE > 0 and "exp" in payload:
+        _token_cache[digest] = payload
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return dict(payload)
 
 
 async def get_current_user_jwt(
+    db: RequestDB,
     authorization: Optional[str] = Header(None),
 ) -> dict:
     """Get current user from JWT token in Authorization header"""
@@ -109,28 +168,35 @@ async def get_current_user_jwt(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
     # Fetch user from database
-    async with get_db_connection() as conn:
-        user = await conn.fetchrow(
-            """
-            SELECT id, ho_ten, email, so_dien_thoai, dia_chi, role, 
-                   diem_tich_luy, ngay_tao
-            FROM users 
-            WHERE id = $1
-            """,
-            user_id
+    generation = user_cache.generation
+    conn = await db.get()
+    user = await conn.fetchrow(
+        """
+        SELECT id, ho_ten, email, so_dien_thoai, dia_chi, role, 
+               diem_tich_luy, ngay_tao
+        FROM users 
+        WHERE id = $1
+        """,
+        user_id
+    )
+    await db.release_unless_shared()
+    
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-        
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        user_dict = dict(user)
-        user_dict['id'] = str(user_dict['id'])
-        return user_dict
+    
+    user_dict = dict(user)
+    user_dict['id'] = str(user_dict['id'])
+    user_cache.put(user_id, user_dict, generation)
+    return user_dict
 
 
 async def require_admin(current_user: dict) -> dict:
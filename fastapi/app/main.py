@@ -1,7 +1,17 @@
-from fastapi import FastAPI
+import os
+import asyncpg
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+from typing import Optional
 from .database import get_pool, close_pool
+from .catalog import catalog
+from .cache import shared_cache
+from .invalidation import invalidation_bus
+from .sessions import session_activity
+from . import user_stats, telemetry, coalescing, admission, timeouts
+from .utils import password
 from .routes import (
     jwt_auth,
     websocket,
@@ -29,15 +39,50 @@ async def lifespan(app: FastAPI):
     print("=" * 60)
     await get_pool()
     print("[MAIN] Database connection pool ready")
+    await invalidation_bus.start()
+    await catalog.start()
+    print("[MAIN] Reference catalog loaded")
+    await password.benchmark()
+    metrics.metrics_snapshot.start()
+    user_stats.start_reconciler()
+    session_activity.start()
     print("[MAIN] Application ready to serve requests")
     yield
     # Shutdown
     print("[MAIN] Application shutting down...")
+    await session_activity.stop()
+    await user_stats.stop_reconciler()
+    await metrics.metrics_snapshot.stop()
+    await invalidation_bus.stop()
+    await shared_cache.close()
     await close_pool()
     print("[MAIN] Database connection pool closed")
 
 app = FastAPI(title="Medicine Recycling API", lifespan=lifespan)
 
+# Per-route-class concurrency limits; sheds load with 503 instead of queueing forever
+app.add_middleware(admission.AdmissionMiddleware)
+
+# Identical concurrent GETs on hot read endpoints share one handler run
+# (outside admission so followers don't take slots, inside CORS so CORS
+# headers are still computed per request)
+app.add_middleware(
+    coalescing.CoalescingMiddleware,
+    routes={
+        "/api/metrics": coalescing.PER_USER,
+        "/api/loai-thuoc": coalescing.PUBLIC,
+        "/api/nha-thuoc": coalescing.PUBLIC,
+        "/api/voucher": coalescing.PER_USER,
+        "/api/feedback": coalescing.PUBLIC,
+    },
+)
+
+# Stops GET handlers (and their queries) whose client has gone away
+app.add_middleware(timeouts.DisconnectCancellationMiddleware)
+
+# Statements stopped by the route class statement_timeout answer 504
+app.add_exception_handler(asyncpg.QueryCanceledError, timeouts.statement_timeout_handler)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -45,8 +90,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+# Request metrics (registered last so it wraps everything, including CORS)
+app.add_middleware(telemetry.MetricsMiddleware)
+
 # Include routers
 # JWT Authentication
 app.include_router(jwt_auth.router, prefix="/api/jwt", tags=["jwt-auth"])
@@ -80,3 +129,12 @@ async def health():
 async def ping():
     print("[MAIN] Ping requested")
     return {"message": "pong"}
+
+# Not proxied by nginx; scraped directly from the container network
+INTERNAL_METRICS_TOKEN = os.getenv("INTERNAL_METRICS_TOKEN")
+
+@app.get("/internal/metrics", include_in_schema=False)
+async def internal_metrics(authorization: Optional[str] = Header(None)):
+    if INTERNAL_METRICS_TOKEN and authorization != f"Bearer {INTERNAL_METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return PlainTextResponse(telemetry.registry.render(), media_type=telemetry.CONTENT_TYPE)
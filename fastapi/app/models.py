@@ -70,6 +70,9 @@ class SubmissionCreate(BaseModel):
     duong_dan_chung_nhan: Optional[str] = None
     ghi_chu: Optional[str] = None
 
+class SubmissionBatchCreate(BaseModel):
+    items: List[SubmissionCreate]
+
 class SubmissionUpdate(BaseModel):
     id_loai_thuoc: Optional[UUID] = None
     id_nha_thuoc: Optional[UUID] = None
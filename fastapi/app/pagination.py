@@ -0,0 +1,46 @@
+"""
+Keyset pagination helpers.
+
+A cursor encodes the (timestamp, id) sort key of the last row of a page, so the
+next page is fetched with `WHERE (ts, id) < (cursor_ts, cursor_id)` and can use
+an index instead of scanning and discarding OFFSET rows.
+"""
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort_ts: datetime, row_id: UUID) -> str:
+    raw = f"{sort_ts.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[Optional[datetime], Optional[UUID]]:
+    """Return the (timestamp, id) pair of a cursor, or (None, None) for the first page"""
+    if not cursor:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        sort_ts, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(sort_ts), UUID(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+
+
+def paginate(rows: List[dict], limit: int, response: Response) -> List[dict]:
+    """
+    Trim a page fetched with LIMIT limit + 1 and expose the next cursor.
+    Rows must carry their sort key in `sort_key`, which is removed here.
+    """
+    page = rows[:limit]
+    if len(rows) > limit and page:
+        last = page[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last["sort_key"], last["id"])
+    for row in page:
+        row.pop("sort_key", None)
+    return page
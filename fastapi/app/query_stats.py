@@ -0,0 +1,165 @@
+"""
+Per-statement query statistics.
+
+`get_db_connection()` hands out an `InstrumentedConnection` for a sampled
+fraction of acquisitions (DB_QUERY_SAMPLE_RATE, 0 disables it). The wrapper
+times fetch/fetchrow/fetchval/execute/executemany and records latency, rows and
+the calling route under the normalized SQL text. Statements slower than
+DB_SLOW_QUERY_MS are printed as slow queries.
+
+Statistics are per worker and exposed through `GET /api/admin/query-stats`.
+"""
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Dict, List
+
+from .telemetry import current_route
+
+SAMPLE_RATE = float(os.getenv("DB_QUERY_SAMPLE_RATE", "0"))
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+MAX_STATEMENTS = int(os.getenv("DB_QUERY_STATS_MAX_STATEMENTS", "500"))
+
+# Latencies kept per statement for percentiles
+LATENCY_WINDOW = 1000
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![$\w.])\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace and replace inline literals so equivalent statements share a key"""
+    query = _STRING_LITERAL.sub("?", query)
+    query = _NUMBER_LITERAL.sub("?", query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class StatementStats:
+    __slots__ = ("query", "calls", "errors", "total_time", "max_time", "rows", "latencies", "routes")
+
+    def __init__(self, query: str):
+        self.query = query
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.routes: Dict[str, int] = {}
+
+    def to_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+        top_routes = sorted(self.routes.items(), key=lambda item: item[1], reverse=True)[:5]
+        return {
+            "query": self.query,
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": round(self.total_time * 1000, 3),
+            "mean_ms": round(self.total_time * 1000 / self.calls, 3) if self.calls else 0,
+            "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+            "max_ms": round(self.max_time * 1000, 3),
+            "routes": [{"route": route, "calls": calls} for route, calls in top_routes],
+        }
+
+
+class QueryStats:
+    def __init__(self, max_statements: int = MAX_STATEMENTS):
+        self.max_statements = max_statements
+        self.statements: Dict[str, StatementStats] = {}
+        self.started_at = time.time()
+
+    def record(self, query: str, elapsed: float, rows: int, route: str, failed: bool = False):
+        key = normalize_sql(query)
+        entry = self.statements.get(key)
+        if entry is None:
+            if len(self.statements) >= self.max_statements:
+                # Make room by dropping the statement that costs the least in total
+                cheapest = min(self.statements.values(), key=lambda stats: stats.total_time)
+                del self.statements[cheapest.query]
+            entry = self.statements[key] = StatementStats(key)
+        entry.calls += 1
+        entry.errors += failed
+        entry.total_time += elapsed
+        entry.max_time = max(entry.max_time, elapsed)
+        entry.rows += rows
+        entry.latencies.append(elapsed)
+        entry.routes[route] = entry.routes.get(route, 0) + 1
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            print(f"[DB] Slow query ({elapsed * 1000:.0f}ms, {rows} rows, {route}): {key[:300]}")
+
+    def top(self, limit: int = 20, order_by: str = "total") -> List[dict]:
+        rows = [stats.to_dict() for stats in self.statements.values()]
+        sort_key = "p99_ms" if order_by == "p99" else "total_ms"
+        rows.sort(key=lambda row: row[sort_key], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        self.statements = {}
+        self.started_at = time.time()
+
+
+query_stats = QueryStats()
+
+
+def should_sample() -> bool:
+    return SAMPLE_RATE > 0 and (SAMPLE_RATE >= 1 or random.random() < SAMPLE_RATE)
+
+
+def _rows_from_status(status) -> int:
+    # asyncpg returns command tags such as "UPDATE 3" or "INSERT 0 1"
+    try:
+        return int(str(status).rsplit(" ", 1)[-1])
+    except ValueError:
+        return 0
+
+
+class InstrumentedConnection:
+    """Proxy around an asyncpg connection that records every statement it runs"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    async def _timed(self, method, query, args, kwargs, count_rows):
+        started = time.perf_counter()
+        try:
+            result = await method(query, *args, **kwargs)
+        except Exception:
+            query_stats.record(query, time.perf_counter() - started, 0, current_route(), failed=True)
+            raise
+        query_stats.record(query, time.perf_counter() - started, count_rows(result), current_route())
+        return result
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed(self._connection.fetch, query, args, kwargs, len)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed(
+            self._connection.fetchrow, query, args, kwargs, lambda row: 0 if row is None else 1
+        )
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed(
+            self._connection.fetchval, query, args, kwargs, lambda value: 0 if value is None else 1
+        )
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(self._connection.execute, query, args, kwargs, _rows_from_status)
+
+    async def executemany(self, query, *args, **kwargs):
+        return await self._timed(self._connection.executemany, query, args, kwargs, lambda _: 0)
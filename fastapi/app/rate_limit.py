@@ -0,0 +1,168 @@
+"""
+Token-bucket rate limiting for expensive or abuse-prone endpoints.
+
+Each limit is a FastAPI dependency keyed by client IP or by user. A bucket holds
+up to `burst` tokens and refills at `rate` tokens per second; a request takes
+one token or is rejected with 429 and a Retry-After header.
+
+Buckets live in Redis when REDIS_HOST is set, so every worker and container
+shares them; otherwise (or while Redis is unreachable) each worker keeps its
+own buckets in memory.
+"""
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from .jwt_auth import decode_token
+from .telemetry import counter
+
+REDIS_HOST = os.getenv("REDIS_HOST")
+REDIS_PORT = int(os.getenv("REDIS_PORT") or "6379")
+# nginx sets X-Real-IP; only trust it when the API is reached through the proxy
+TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "true").lower() in ("1", "true", "yes")
+MEMORY_MAX_KEYS = int(os.getenv("RATE_LIMIT_MEMORY_MAX_KEYS", "100000"))
+
+rate_limit_rejections = counter(
+    "rate_limit_rejections_total",
+    "Requests rejected by a rate limit",
+    ("limit",),
+)
+
+
+class MemoryBackend:
+    """Per-worker buckets; least recently used keys are dropped beyond max_keys"""
+
+    def __init__(self, max_keys: int = MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Take one token; returns 0 when allowed, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# KEYS[1] bucket; ARGV rate, burst, now (seconds). Returns wait in ms (0 = allowed)
+_TAKE_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return wait
+"""
+
+
+class RedisBackend:
+    """Buckets shared by all workers, updated atomically by a Lua script"""
+
+    def __init__(self, host: str, port: int):
+        import redis.asyncio as redis  # Only needed when REDIS_HOST is configured
+
+        self.client = redis.Redis(host=host, port=port, socket_timeout=0.5)
+        self.script = self.client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        wait_ms = await self.script(keys=[key], args=[rate, burst, time.time()])
+        return int(wait_ms) / 1000
+
+
+class TokenBucketLimiter:
+    def __init__(self):
+        self.memory = MemoryBackend()
+        self._redis: Optional[RedisBackend] = None
+        if REDIS_HOST:
+            try:
+                self._redis = RedisBackend(REDIS_HOST, REDIS_PORT)
+                print(f"[RATE_LIMIT] Using Redis at {REDIS_HOST}:{REDIS_PORT}")
+            except ImportError:
+                print("[RATE_LIMIT] redis package not installed, using in-memory buckets")
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        if self._redis is not None:
+            try:
+                return await self._redis.take(key, rate, burst)
+            except Exception as e:
+                # Fail over to local buckets rather than blocking or opening the endpoint
+                print(f"[RATE_LIMIT] Redis unavailable, using in-memory buckets: {e}")
+        return await self.memory.take(key, rate, burst)
+
+
+limiter = TokenBucketLimiter()
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_PROXY:
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip.strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _token_subject(request: Request) -> Optional[str]:
+    parts = (request.headers.get("authorization") or "").split()
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        return None
+    try:
+        payload = decode_token(parts[1])
+    except HTTPException:
+        return None
+    return payload.get("sub") if payload.get("type") == "access" else None
+
+
+class RateLimit:
+    """
+    Dependency enforcing one token bucket, e.g.
+    `dependencies=[Depends(RateLimit("login", rate=5 / 60, burst=5))]`.
+    `per="user"` keys by the bearer token's subject (falling back to the IP).
+    Rate and burst can be overridden with RATE_LIMIT_<NAME>_RATE / _BURST.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, per: str = "ip"):
+        env = f"RATE_LIMIT_{name.upper()}"
+        self.name = name
+        self.rate = float(os.getenv(f"{env}_RATE", rate))
+        self.burst = int(os.getenv(f"{env}_BURST", burst))
+        self.per = per
+
+    async def take(self, subject: str) -> float:
+        """Take a token for `subject` ("user:<id>" or "ip:<addr>"); returns 0 or seconds to wait"""
+        wait = await limiter.take(f"ratelimit:{self.name}:{subject}", self.rate, self.burst)
+        if wait > 0:
+            rate_limit_rejections.inc(self.name)
+        return wait
+
+    async def __call__(self, request: Request):
+        subject = _token_subject(request) if self.per == "user" else None
+        wait = await self.take(f"user:{subject}" if subject else f"ip:{client_ip(request)}")
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Quá nhiều yêu cầu, vui lòng thử lại sau",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
@@ -0,0 +1,76 @@
+"""
+Monthly rollups for dashboard trends.
+
+`monthly_rollups` holds rows per (dimension, subject, month) and is kept
+current by triggers on ho_so_xu_ly, voucher_usage and diem_thuong, so a trend
+of N months is an index range read regardless of table sizes. Global series
+are spread over up to 16 shard rows per month to keep concurrent writers off
+a single row; readers sum them.
+
+Rebuild every rollup from the source tables with:
+
+    python -m app.rollups rebuild
+"""
+import asyncio
+import sys
+from datetime import date
+from typing import Dict
+from uuid import UUID
+
+import asyncpg
+
+from .database import DATABASE_URL
+
+# subject_id used for global (not per-user) series
+GLOBAL_SUBJECT = UUID(int=0)
+
+SUBMISSIONS = "submissions"
+VOUCHER_REDEMPTIONS = "voucher_redemptions"
+POINTS = "points"
+
+
+async def read_monthly_totals(
+    conn,
+    dimension: str,
+    start: date,
+    end: date,
+    subject_id: UUID = GLOBAL_SUBJECT,
+) -> Dict[str, int]:
+    """Return {'YYYY-MM': total} for the months between start and end (inclusive)"""
+    rows = await conn.fetch(
+        """
+        SELECT to_char(month, 'YYYY-MM') AS month_key, SUM(total) AS total
+        FROM monthly_rollups
+        WHERE dimension = $1 AND subject_id = $2 AND month BETWEEN $3 AND $4
+        GROUP BY month
+        """,
+        dimension, subject_id, start, end
+    )
+    return {row["month_key"]: int(row["total"]) for row in rows}
+
+
+async def rebuild(conn):
+    """Recompute all rollups from the source tables"""
+    async with conn.transaction():
+        await conn.execute("SELECT rebuild_monthly_rollups()")
+
+
+async def main(argv) -> int:
+    if argv[1:] != ["rebuild"]:
+        print("Usage: python -m app.rollups rebuild")
+        return 2
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        await rebuild(conn)
+        rows = await conn.fetch(
+            "SELECT dimension, COUNT(DISTINCT month) AS months FROM monthly_rollups GROUP BY dimension ORDER BY dimension"
+        )
+    finally:
+        await conn.close()
+    for row in rows:
+        print(f"[ROLLUPS] {row['dimension']}: {row['months']} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv)))
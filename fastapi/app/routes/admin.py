@@ -1,16 +1,26 @@
 """
 Admin management routes
 """
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
 from typing import List, Optional
 from datetime import datetime
-from uuid import uuid4
+from uuid import UUID, uuid4
 from pydantic import BaseModel
-from ..database import get_db_connection
+from ..database import fan_out, get_db_connection
 from ..auth import get_current_user, require_admin
+from ..catalog import catalog
+from ..pagination import decode_cursor, paginate
+from ..query_stats import SAMPLE_RATE, SLOW_QUERY_MS, query_stats
+from ..user_cache import user_cache
+from .vouchers import voucher_cache
 
 router = APIRouter()
 
+VALID_CRITERIA_RESULTS = ['DAT', 'KHONG_DAT', 'XEM_XET']
+
+# Largest page the classification results listing returns per request
+MAX_PAGE_SIZE = 500
+
 # ============================================================
 # MODELS
 # ============================================================
@@ -48,6 +58,70 @@ class ClassificationResultRequest(BaseModel):
     bang_chung_url: Optional[str] = None
     ghi_chu: Optional[str] = None
 
+# ============================================================
+# HELPERS
+# ============================================================
+
+async def save_criteria_details(conn, ket_qua_id: str, details: List[dict], replace: bool = False) -> int:
+    """Write per-criterion evaluations of one classification result with a single upsert.
+    
+    Criteria ids are checked against the cached active criteria first; the
+    rest (inactive or newer than the cache) are looked up in the table. With
+    replace=True, details of criteria absent from the new list are removed.
+    """
+    by_criteria = {}
+    for detail in details:
+        try:
+            criteria_id = UUID(str(detail.get('id_tieu_chi')))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"id_tieu_chi không hợp lệ: {detail.get('id_tieu_chi')}")
+        by_criteria[criteria_id] = detail  # Last evaluation of a criterion wins
+    
+    criteria_ids = list(by_criteria.keys())
+    active = (await catalog.snapshot("tieu_chi_phan_loai")).ids
+    unknown = [criteria_id for criteria_id in criteria_ids if criteria_id not in active]
+    if unknown:
+        found = await conn.fetch(
+            "SELECT id FROM tieu_chi_phan_loai WHERE id = ANY($1::uuid[])",
+            unknown
+        )
+        missing = set(unknown) - {row['id'] for row in found}
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Không tìm thấy tiêu chí: {', '.join(str(m) for m in missing)}")
+    
+    if replace:
+        await conn.execute(
+            "DELETE FROM chi_tiet_danh_gia WHERE id_ket_qua = $1 AND id_tieu_chi <> ALL($2::uuid[])",
+            ket_qua_id,
+            criteria_ids
+        )
+    
+    if not criteria_ids:
+        return 0
+    
+    rows = list(by_criteria.values())
+    await conn.execute(
+        """
+        INSERT INTO chi_tiet_danh_gia 
+        (id_ket_qua, id_tieu_chi, ket_qua, gia_tri_do, bang_chung_url, ghi_chu)
+        SELECT $1::uuid, v.id_tieu_chi, v.ket_qua, v.gia_tri_do, v.bang_chung_url, v.ghi_chu
+        FROM unnest($2::uuid[], $3::text[], $4::text[], $5::text[], $6::text[])
+             AS v(id_tieu_chi, ket_qua, gia_tri_do, bang_chung_url, ghi_chu)
+        ON CONFLICT (id_ket_qua, id_tieu_chi) DO UPDATE
+        SET ket_qua = EXCLUDED.ket_qua,
+            gia_tri_do = EXCLUDED.gia_tri_do,
+            bang_chung_url = EXCLUDED.bang_chung_url,
+            ghi_chu = EXCLUDED.ghi_chu
+        """,
+        ket_qua_id,
+        criteria_ids,
+        [d.get('ket_qua') for d in rows],
+        [d.get('gia_tri_do') or None for d in rows],
+        [d.get('bang_chung_url') or None for d in rows],
+        [d.get('ghi_chu') or None for d in rows]
+    )
+    return len(criteria_ids)
+
 # ============================================================
 # SUBMISSION MANAGEMENT
 # ============================================================
@@ -121,7 +195,8 @@ async def handle_submission_action(
             await conn.execute(
                 """
                 UPDATE ho_so_xu_ly
-                SET ket_qua = $1, ghi_chu = $2
+                SET ket_qua = $1, ghi_chu = $2,
+                    id_nguoi_nhan_duyet = NULL, han_nhan_duyet = NULL
                 WHERE id = $3
                 """,
                 new_status,
@@ -132,11 +207,10 @@ async def handle_submission_action(
             # Save classifications if provided
             if action_data.classifications:
                 # Validate classifications
-                valid_ket_qua = ['DAT', 'KHONG_DAT', 'XEM_XET']
                 for classification in action_data.classifications:
                     if not classification.get('id_tieu_chi'):
                         raise HTTPException(status_code=400, detail="Thiếu id_tieu_chi trong classification")
-                    if classification.get('ket_qua') not in valid_ket_qua:
+                    if classification.get('ket_qua') not in VALID_CRITERIA_RESULTS:
                         raise HTTPException(status_code=400, detail=f"Kết quả không hợp lệ: {classification.get('ket_qua')}")
                 
                 # Calculate overall result from criteria results
@@ -170,28 +244,7 @@ async def handle_submission_action(
                 )
                 
                 # Insert detailed criteria evaluations
-                for classification in action_data.classifications:
-                    # Verify criteria exists
-                    criteria_check = await conn.fetchrow(
-                        "SELECT id FROM tieu_chi_phan_loai WHERE id = $1",
-                        classification.get('id_tieu_chi')
-                    )
-                    if not criteria_check:
-                        raise HTTPException(status_code=404, detail=f"Không tìm thấy tiêu chí: {classification.get('id_tieu_chi')}")
-                    
-                    await conn.execute(
-                        """
-                        INSERT INTO chi_tiet_danh_gia 
-                        (id_ket_qua, id_tieu_chi, ket_qua, gia_tri_do, bang_chung_url, ghi_chu)
-                        VALUES ($1, $2, $3, $4, $5, $6)
-                        """,
-                        ket_qua_id,
-                        classification.get('id_tieu_chi'),
-                        classification.get('ket_qua'),
-                        classification.get('gia_tri_do') or None,
-                        classification.get('bang_chung_url') or None,
-                        classification.get('ghi_chu') or None
-                    )
+                await save_criteria_details(conn, ket_qua_id, action_data.classifications)
             
             # Calculate and award points if approved
             points_awarded = 0
@@ -214,6 +267,7 @@ async def handle_submission_action(
                     points_awarded,
                     submission['user_id']
                 )
+                user_cache.invalidate(submission['user_id'])
                 
                 # Record points in diem_thuong
                 await conn.execute(
@@ -300,64 +354,55 @@ async def handle_submission_action(
 
 @router.get("/classification-results")
 async def get_classification_results(
+    response: Response,
     submission_id: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
     current_user: dict = Depends(get_current_user)
 ):
     """Get classification results with detailed criteria evaluations (Admin/CTV only)"""
     if current_user['role'] not in ['ADMIN', 'CONGTACVIEN']:
         raise HTTPException(status_code=403, detail="Chỉ Admin/Cộng tác viên mới có quyền")
     
+    # Criteria details are aggregated per result, so each page is one round trip
+    query = """
+        SELECT kq.*, u.ho_ten as ten_nguoi_danh_gia,
+               hs.id as ho_so_id, hs.ket_qua as ho_so_ket_qua,
+               kq.thoi_gian_danh_gia AS sort_key,
+               COALESCE(ct.items, '[]'::jsonb) AS chi_tiet
+        FROM ket_qua_phan_loai kq
+        LEFT JOIN users u ON kq.nguoi_danh_gia = u.id
+        JOIN ho_so_xu_ly hs ON kq.id_ho_so_xu_ly = hs.id
+        LEFT JOIN LATERAL (
+            SELECT jsonb_agg(to_jsonb(ct) || jsonb_build_object(
+                'ten_tieu_chi', tc.ten_tieu_chi,
+                'ma_tieu_chi', tc.ma_tieu_chi,
+                'kieu_du_lieu', tc.kieu_du_lieu
+            ) ORDER BY tc.ngay_tao) AS items
+            FROM chi_tiet_danh_gia ct
+            JOIN tieu_chi_phan_loai tc ON ct.id_tieu_chi = tc.id
+            WHERE ct.id_ket_qua = kq.id
+        ) ct ON true
+    """
+    
     async with get_db_connection() as conn:
         if submission_id:
-            # Get overall result
-            result = await conn.fetchrow("""
-                SELECT kq.*, u.ho_ten as ten_nguoi_danh_gia
-                FROM ket_qua_phan_loai kq
-                LEFT JOIN users u ON kq.nguoi_danh_gia = u.id
-                WHERE kq.id_ho_so_xu_ly = $1
-            """, submission_id)
-            
-            if not result:
+            row = await conn.fetchrow(query + " WHERE kq.id_ho_so_xu_ly = $1", submission_id)
+            if not row:
                 return []
-            
-            # Get criteria details
-            details = await conn.fetch("""
-                SELECT ct.*, tc.ten_tieu_chi, tc.ma_tieu_chi, tc.kieu_du_lieu
-                FROM chi_tiet_danh_gia ct
-                JOIN tieu_chi_phan_loai tc ON ct.id_tieu_chi = tc.id
-                WHERE ct.id_ket_qua = $1
-            """, result['id'])
-            
-            result_dict = dict(result)
-            result_dict['chi_tiet'] = [dict(d) for d in details]
-            return [result_dict]
-        else:
-            # Get all results
-            results = await conn.fetch("""
-                SELECT kq.*, u.ho_ten as ten_nguoi_danh_gia, 
-                       hs.id as ho_so_id, hs.ket_qua as ho_so_ket_qua
-                FROM ket_qua_phan_loai kq
-                LEFT JOIN users u ON kq.nguoi_danh_gia = u.id
-                JOIN ho_so_xu_ly hs ON kq.id_ho_so_xu_ly = hs.id
-                ORDER BY kq.thoi_gian_danh_gia DESC
-                LIMIT 100
-            """)
-            
-            result_list = []
-            for result in results:
-                # Get criteria details for each result
-                details = await conn.fetch("""
-                    SELECT ct.*, tc.ten_tieu_chi, tc.ma_tieu_chi
-                    FROM chi_tiet_danh_gia ct
-                    JOIN tieu_chi_phan_loai tc ON ct.id_tieu_chi = tc.id
-                    WHERE ct.id_ket_qua = $1
-                """, result['id'])
-                
-                result_dict = dict(result)
-                result_dict['chi_tiet'] = [dict(d) for d in details]
-                result_list.append(result_dict)
-            
-            return result_list
+            result = dict(row)
+            result.pop('sort_key')
+            return [result]
+        
+        cursor_ts, cursor_id = decode_cursor(cursor)
+        params = [limit + 1]
+        if cursor_ts:
+            query += " WHERE (kq.thoi_gian_danh_gia, kq.id) < ($2, $3)"
+            params += [cursor_ts, cursor_id]
+        query += " ORDER BY kq.thoi_gian_danh_gia DESC, kq.id DESC LIMIT $1"
+        
+        rows = await conn.fetch(query, *params)
+        return paginate([dict(row) for row in rows], limit, response)
 
 @router.post("/classification-results")
 async def create_classification_result(
@@ -375,7 +420,7 @@ async def create_classification_result(
     if not submission_id or not ket_qua_tong:
         raise HTTPException(status_code=400, detail="Thiếu id_ho_so_xu_ly hoặc ket_qua_tong")
     
-    if ket_qua_tong not in ['DAT', 'KHONG_DAT', 'XEM_XET']:
+    if ket_qua_tong not in VALID_CRITERIA_RESULTS:
         raise HTTPException(status_code=400, detail="Kết quả tổng không hợp lệ")
     
     async with get_db_connection() as conn:
@@ -397,22 +442,11 @@ async def create_classification_result(
             """, ket_qua_id, submission_id, ket_qua_tong, current_user['id'], ghi_chu_chung)
             
             # Insert criteria details
-            for detail in chi_tiet_list:
-                if detail.get('ket_qua') not in ['DAT', 'KHONG_DAT', 'XEM_XET']:
-                    continue
-                
-                await conn.execute("""
-                    INSERT INTO chi_tiet_danh_gia 
-                    (id_ket_qua, id_tieu_chi, ket_qua, gia_tri_do, bang_chung_url, ghi_chu)
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                """, 
-                    ket_qua_id,
-                    detail.get('id_tieu_chi'),
-                    detail.get('ket_qua'),
-                    detail.get('gia_tri_do'),
-                    detail.get('bang_chung_url'),
-                    detail.get('ghi_chu')
-                )
+            await save_criteria_details(
+                conn,
+                ket_qua_id,
+                [d for d in chi_tiet_list if d.get('ket_qua') in VALID_CRITERIA_RESULTS]
+            )
             
             # Get created result with details
             result = await conn.fetchrow("SELECT * FROM ket_qua_phan_loai WHERE id = $1", ket_qua_id)
@@ -440,7 +474,7 @@ async def update_classification_result(
     chi_tiet_list = data.get('chi_tiet', [])
     ghi_chu_chung = data.get('ghi_chu_chung')
     
-    if ket_qua_tong and ket_qua_tong not in ['DAT', 'KHONG_DAT', 'XEM_XET']:
+    if ket_qua_tong and ket_qua_tong not in VALID_CRITERIA_RESULTS:
         raise HTTPException(status_code=400, detail="Kết quả tổng không hợp lệ")
     
     async with get_db_connection() as conn:
@@ -458,28 +492,14 @@ async def update_classification_result(
                 WHERE id = $3
             """, ket_qua_tong, ghi_chu_chung, result_id)
             
-            # Update criteria details if provided
+            # Update criteria details if provided (upsert, drop criteria no longer listed)
             if chi_tiet_list:
-                # Delete old details
-                await conn.execute("DELETE FROM chi_tiet_danh_gia WHERE id_ket_qua = $1", result_id)
-                
-                # Insert new details
-                for detail in chi_tiet_list:
-                    if detail.get('ket_qua') not in ['DAT', 'KHONG_DAT', 'XEM_XET']:
-                        continue
-                    
-                    await conn.execute("""
-                        INSERT INTO chi_tiet_danh_gia 
-                        (id_ket_qua, id_tieu_chi, ket_qua, gia_tri_do, bang_chung_url, ghi_chu)
-                        VALUES ($1, $2, $3, $4, $5, $6)
-                    """, 
-                        result_id,
-                        detail.get('id_tieu_chi'),
-                        detail.get('ket_qua'),
-                        detail.get('gia_tri_do'),
-                        detail.get('bang_chung_url'),
-                        detail.get('ghi_chu')
-                    )
+                await save_criteria_details(
+                    conn,
+                    result_id,
+                    [d for d in chi_tiet_list if d.get('ket_qua') in VALID_CRITERIA_RESULTS],
+                    replace=True
+                )
             
             # Get updated result
             result = await conn.fetchrow("SELECT * FROM ket_qua_phan_loai WHERE id = $1", result_id)
@@ -583,6 +603,7 @@ async def create_voucher(
         )
         
         row = await conn.fetchrow("SELECT * FROM voucher WHERE id = $1", voucher_id)
+        await voucher_cache.invalidate_all()
         return dict(row)
 
 @router.put("/vouchers/{voucher_id}")
@@ -635,6 +656,7 @@ async def update_voucher(
         )
         
         row = await conn.fetchrow("SELECT * FROM voucher WHERE id = $1", voucher_id)
+        await voucher_cache.invalidate_all()
         return dict(row)
 
 @router.delete("/vouchers/{voucher_id}")
@@ -666,10 +688,12 @@ async def delete_voucher(
                 "UPDATE voucher SET trang_thai = 'inactive' WHERE id = $1",
                 voucher_id
             )
+            await voucher_cache.invalidate_all()
             return {"ok": True, "message": "Voucher đã được đánh dấu không hoạt động (đã có người sử dụng)"}
         else:
             # Hard delete
             await conn.execute("DELETE FROM voucher WHERE id = $1", voucher_id)
+            await voucher_cache.invalidate_all()
             return {"ok": True, "message": "Đã xóa voucher"}
 
 # ============================================================
@@ -831,6 +855,7 @@ async def approve_collaborator_request(
                     "UPDATE users SET role = 'CONGTACVIEN', yeu_cau_cong_tac_vien = false WHERE id = $1",
                     user_id
                 )
+                user_cache.invalidate(user_id)
                 
                 # Send notification to user
                 await conn.execute("""
@@ -877,23 +902,17 @@ async def get_admin_statistics(
     if current_user['role'] not in ['ADMIN', 'CONGTACVIEN']:
         raise HTTPException(status_code=403, detail="Chỉ Admin/Cộng tác viên mới có quyền")
     
-    async with get_db_connection() as conn:
-        # Submissions stats
-        submissions_stats = await conn.fetchrow(
+    # Independent aggregates run concurrently on separate connections
+    status_rows, vouchers_stats, users_stats, points_stats, classification_stats = await fan_out(
+        # Grouping on the indexed enum column lets Postgres count from the index alone
+        lambda conn: conn.fetch(
             """
-            SELECT 
-                COUNT(*) FILTER (WHERE ket_qua = 'pending') as pending,
-                COUNT(*) FILTER (WHERE ket_qua = 'approved') as approved,
-                COUNT(*) FILTER (WHERE ket_qua = 'rejected') as rejected,
-                COUNT(*) FILTER (WHERE ket_qua = 'returned_to_pharmacy') as returned,
-                COUNT(*) FILTER (WHERE ket_qua = 'recalled') as recalled,
-                COUNT(*) as total
+            SELECT ket_qua::text AS ket_qua, COUNT(*)::int AS total
             FROM ho_so_xu_ly
+            GROUP BY ket_qua
             """
-        )
-        
-        # Vouchers stats
-        vouchers_stats = await conn.fetchrow(
+        ),
+        lambda conn: conn.fetchrow(
             """
             SELECT 
                 COUNT(*) FILTER (WHERE trang_thai = 'active') as active,
@@ -902,10 +921,8 @@ async def get_admin_statistics(
                 COALESCE(SUM(so_luong_con_lai), 0) as total_remaining
             FROM voucher
             """
-        )
-        
-        # Users stats
-        users_stats = await conn.fetchrow(
+        ),
+        lambda conn: conn.fetchrow(
             """
             SELECT 
                 COUNT(*) as total,
@@ -915,10 +932,8 @@ async def get_admin_statistics(
                 COALESCE(SUM(diem_tich_luy), 0) as total_points
             FROM users
             """
-        )
-        
-        # Points stats
-        points_stats = await conn.fetchrow(
+        ),
+        lambda conn: conn.fetchrow(
             """
             SELECT 
                 COUNT(*) as total_transactions,
@@ -926,10 +941,8 @@ async def get_admin_statistics(
                 COUNT(*) FILTER (WHERE trang_thai = 'COMPLETED') as completed_transactions
             FROM diem_thuong
             """
-        )
-        
-        # Classification stats
-        classification_stats = await conn.fetchrow(
+        ),
+        lambda conn: conn.fetchrow(
             """
             SELECT 
                 COUNT(*) as total,
@@ -938,13 +951,52 @@ async def get_admin_statistics(
                 COUNT(*) FILTER (WHERE ket_qua_tong = 'XEM_XET') as xem_xet
             FROM ket_qua_phan_loai
             """
-        )
-        
-        return {
-            "submissions": dict(submissions_stats),
-            "vouchers": dict(vouchers_stats),
-            "users": dict(users_stats),
-            "points": dict(points_stats),
-            "classifications": dict(classification_stats)
-        }
+        ),
+    )
+    
+    status_counts = {row['ket_qua']: row['total'] for row in status_rows}
+    submissions_stats = {
+        "pending": status_counts.get('pending', 0),
+        "approved": status_counts.get('approved', 0),
+        "rejected": status_counts.get('rejected', 0),
+        "returned": status_counts.get('returned_to_pharmacy', 0),
+        "recalled": status_counts.get('recalled', 0),
+        "total": sum(status_counts.values()),
+    }
+    
+    return {
+        "submissions": submissions_stats,
+        "vouchers": dict(vouchers_stats),
+        "users": dict(users_stats),
+        "points": dict(points_stats),
+        "classifications": dict(classification_stats)
+    }
+
+
+# ============================================================
+# QUERY STATISTICS
+# ============================================================
 
+@router.get("/query-stats")
+async def get_query_stats(
+    limit: int = Query(20, ge=1, le=200),
+    order_by: str = Query("total", pattern="^(total|p99)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Top statements of this worker by total time or p99 latency (Admin only)"""
+    await require_admin(current_user)
+    return {
+        "sample_rate": SAMPLE_RATE,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "since": datetime.fromtimestamp(query_stats.started_at).isoformat(),
+        "statements": query_stats.top(limit, order_by),
+    }
+
+@router.delete("/query-stats")
+async def reset_query_stats(
+    current_user: dict = Depends(get_current_user)
+):
+    """Clear the collected statement statistics (Admin only)"""
+    await require_admin(current_user)
+    query_stats.reset()
+    return {"message": "Query statistics reset"}
@@ -3,20 +3,27 @@ from typing import List, Optional
 from uuid import UUID, uuid4
 import httpx
 import os
+import time
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 
-from ..auth import get_current_user
-from ..database import get_db_connection
+from ..auth import get_current_user, get_current_claims
+from ..database import ReadOnlyDB, get_db_connection
 from ..models import ChatMessage, ChatMessageCreate
+from ..rate_limit import RateLimit
+from ..telemetry import langgraph_call_duration, langgraph_call_errors
 
 router = APIRouter()
 
 LANGGRAPH_URL = os.getenv("LANGGRAPH_URL", "http://langgraph:8001")
 
+# Shared by the REST endpoint and WebSocket chatbot messages
+chatbot_rate_limit = RateLimit("chatbot", rate=0.5, burst=10, per="user")
+
 
 async def _call_langgraph_chatbot(message: str, user_id: str, session_id: str, chat_history: list = None) -> str:
     """Call LangGraph chatbot service"""
+    started = time.perf_counter()
     try:
         async with httpx.AsyncClient(timeout=30.0) as client:
             response = await client.post(
@@ -34,14 +41,19 @@ async def _call_langgraph_chatbot(message: str, user_id: str, session_id: str, c
                 return data.get("response", "Xin lỗi, tôi không thể trả lời lúc này.")
             else:
                 print(f"[CHATBOT] LangGraph error: {response.status_code}")
+                langgraph_call_errors.inc("chat", f"http_{response.status_code}")
                 return "Xin lỗi, chatbot đang bận. Vui lòng thử lại sau."
     
     except httpx.TimeoutException:
         print("[CHATBOT] LangGraph timeout")
+        langgraph_call_errors.inc("chat", "timeout")
         return "Yêu cầu mất quá nhiều thời gian. Vui lòng thử lại."
     except Exception as e:
         print(f"[CHATBOT] Error calling LangGraph: {e}")
+        langgraph_call_errors.inc("chat", "error")
         return "Đã xảy ra lỗi khi kết nối với chatbot. Vui lòng thử lại."
+    finally:
+        langgraph_call_duration.observe(time.perf_counter() - started, "chat")
 
 
 
@@ -86,6 +98,7 @@ async def _get_or_create_conversation_id(
 
 @router.get("/messages", response_model=list[ChatMessage])
 async def list_messages(
+    db: ReadOnlyDB,
     user_id: Optional[UUID] = Query(None),
     conversation_type: Optional[str] = Query(None),  # 'admin' or 'chatbot'
     current_user: dict = Depends(get_current_user),
@@ -96,143 +109,143 @@ async def list_messages(
     - Admin: Must provide user_id to get messages with specific user
     """
     try:
-        async with get_db_connection() as conn:
-            if current_user["role"] == "ADMIN":
-                # Admin: Must provide user_id for user chat, or use conversation_type for admin/chatbot
-                if user_id:
-                    # Chat with specific user
-                    rows = await conn.fetch(
-                        """
-                        SELECT m.id,
-                               m.sender_id,
-                               m.recipient_id,
-                               m.content,
-                               m.message_type,
-                               m.conversation_id,
-                               m.created_at,
-                               sender.ho_ten AS sender_name,
-                               sender.role AS sender_role,
-                               recipient.ho_ten AS recipient_name,
-                               COALESCE(md.is_read, false) AS is_read
-                        FROM message m
-                        LEFT JOIN users sender ON sender.id = m.sender_id
-                        LEFT JOIN users recipient ON recipient.id = m.recipient_id
-                        LEFT JOIN message_detail md ON md.message_id = m.id AND md.user_id = $1
-                        WHERE m.message_type = 'user_chat'
-                          AND (
-                            (m.sender_id = $1 AND m.recipient_id = $2)
-                            OR (m.sender_id = $2 AND m.recipient_id = $1)
-                          )
-                        ORDER BY m.created_at ASC
-                        """,
-                        current_user["id"],
-                        user_id,
-                    )
-                elif conversation_type == "chatbot":
-                    # Admin chatbot conversation
-                    rows = await conn.fetch(
-                        """
-                        SELECT m.id,
-                               m.sender_id,
-                               m.recipient_id,
-                               m.content,
-                               m.message_type,
-                               m.conversation_id,
-                               m.created_at,
-                               sender.ho_ten AS sender_name,
-                               sender.role AS sender_role,
-                               NULL AS recipient_name,
-                               COALESCE(md.is_read, false) AS is_read
-                        FROM message m
-                        LEFT JOIN users sender ON sender.id = m.sender_id
-                        LEFT JOIN message_detail md ON md.message_id = m.id AND md.user_id = $1
-                        WHERE m.message_type = 'chatbot'
-                          AND m.sender_id = $1
-                        ORDER BY m.created_at ASC
-                        """,
-                        current_user["id"],
-                    )
-                else:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="user_id or conversation_type='chatbot' is required for admin",
-                    )
+        conn = await db.get()
+        if current_user["role"] == "ADMIN":
+            # Admin: Must provide user_id for user chat, or use conversation_type for admin/chatbot
+            if user_id:
+                # Chat with specific user
+                rows = await conn.fetch(
+                    """
+                    SELECT m.id,
+                           m.sender_id,
+                           m.recipient_id,
+                           m.content,
+                           m.message_type,
+                           m.conversation_id,
+                           m.created_at,
+                           sender.ho_ten AS sender_name,
+                           sender.role AS sender_role,
+                           recipient.ho_ten AS recipient_name,
+                           COALESCE(md.is_read, false) AS is_read
+                    FROM message m
+                    LEFT JOIN users sender ON sender.id = m.sender_id
+                    LEFT JOIN users recipient ON recipient.id = m.recipient_id
+                    LEFT JOIN message_detail md ON md.message_id = m.id AND md.user_id = $1
+                    WHERE m.message_type = 'user_chat'
+                      AND (
+                        (m.sender_id = $1 AND m.recipient_id = $2)
+                        OR (m.sender_id = $2 AND m.recipient_id = $1)
+                      )
+                    ORDER BY m.created_at ASC
+                    """,
+                    current_user["id"],
+                    user_id,
+                )
+            elif conversation_type == "chatbot":
+                # Admin chatbot conversation
+                rows = await conn.fetch(
+                    """
+                    SELECT m.id,
+                           m.sender_id,
+                           m.recipient_id,
+                           m.content,
+                           m.message_type,
+                           m.conversation_id,
+                           m.created_at,
+                           sender.ho_ten AS sender_name,
+                           sender.role AS sender_role,
+                           NULL AS recipient_name,
+                           COALESCE(md.is_read, false) AS is_read
+                    FROM message m
+                    LEFT JOIN users sender ON sender.id = m.sender_id
+                    LEFT JOIN message_detail md ON md.message_id = m.id AND md.user_id = $1
+                    WHERE m.message_type = 'chatbot'
+                      AND m.sender_id = $1
+                    ORDER BY m.created_at ASC
+                    """,
+                    current_user["id"],
+                )
             else:
-                # Regular user or CTV
-                if conversation_type == "chatbot":
-                    # Chatbot conversation
-                    rows = await conn.fetch(
-                        """
-                        SELECT m.id,
-                               m.sender_id,
-                               m.recipient_id,
-                               m.content,
-                               m.message_type,
-                               m.conversation_id,
-                               m.created_at,
-                               sender.ho_ten AS sender_name,
-                               sender.role AS sender_role,
-                               NULL AS recipient_name,
-                               COALESCE(md.is_read, false) AS is_read
-                        FROM message m
-                        LEFT JOIN users sender ON sender.id = m.sender_id
-                        LEFT JOIN message_detail md ON md.message_id = m.id AND md.user_id = $1
-                        WHERE m.message_type = 'chatbot'
-                          AND m.sender_id = $1
-                        ORDER BY m.created_at ASC
-                        """,
-                        current_user["id"],
-                    )
-                else:
-                    # Chat with admin (default)
-                    admin_ids = await _fetch_admin_ids(conn)
-                    if not admin_ids:
-                        return []
-
-                    rows = await conn.fetch(
-                        """
-                        SELECT m.id,
-                               m.sender_id,
-                               m.recipient_id,
-                               m.content,
-                               m.message_type,
-                               m.conversation_id,
-                               m.created_at,
-                               sender.ho_ten AS sender_name,
-                               sender.role AS sender_role,
-                               recipient.ho_ten AS recipient_name,
-                               COALESCE(md.is_read, false) AS is_read
-                        FROM message m
-                        LEFT JOIN users sender ON sender.id = m.sender_id
-                        LEFT JOIN users recipient ON recipient.id = m.recipient_id
-                        LEFT JOIN message_detail md ON md.message_id = m.id AND md.user_id = $1
-                        WHERE m.message_type = 'user_chat'
-                          AND (
-                            (m.sender_id = $1 AND m.recipient_id = ANY($2::uuid[]))
-                            OR (m.recipient_id = $1 AND m.sender_id = ANY($2::uuid[]))
-                          )
-                        ORDER BY m.created_at ASC
-                        """,
-                        current_user["id"],
-                        admin_ids,
-                    )
+                raise HTTPException(
+                    status_code=400,
+                    detail="user_id or conversation_type='chatbot' is required for admin",
+                )
+        else:
+            # Regular user or CTV
+            if conversation_type == "chatbot":
+                # Chatbot conversation
+                rows = await conn.fetch(
+                    """
+                    SELECT m.id,
+                           m.sender_id,
+                           m.recipient_id,
+                           m.content,
+                           m.message_type,
+                           m.conversation_id,
+                           m.created_at,
+                           sender.ho_ten AS sender_name,
+                           sender.role AS sender_role,
+                           NULL AS recipient_name,
+                           COALESCE(md.is_read, false) AS is_read
+                    FROM message m
+                    LEFT JOIN users sender ON sender.id = m.sender_id
+                    LEFT JOIN message_detail md ON md.message_id = m.id AND md.user_id = $1
+                    WHERE m.message_type = 'chatbot'
+                      AND m.sender_id = $1
+                    ORDER BY m.created_at ASC
+                    """,
+                    current_user["id"],
+                )
+            else:
+                # Chat with admin (default)
+                admin_ids = await _fetch_admin_ids(conn)
+                if not admin_ids:
+                    return []
 
-            return [
-                ChatMessage(
-                    id=row["id"],
-                    sender_id=row["sender_id"],
-                    recipient_id=row["recipient_id"],
-                    content=row["content"],
-                    message_type=row["message_type"],
-                    conversation_id=row["conversation_id"],
-                    created_at=row["created_at"],
-                    sender_name=row["sender_name"],
-                    sender_role=row["sender_role"],
-                    recipient_name=row["recipient_name"],
-                    is_read=row["is_read"],
+                rows = await conn.fetch(
+                    """
+                    SELECT m.id,
+                           m.sender_id,
+                           m.recipient_id,
+                           m.content,
+                           m.message_type,
+                           m.conversation_id,
+                           m.created_at,
+                           sender.ho_ten AS sender_name,
+                           sender.role AS sender_role,
+                           recipient.ho_ten AS recipient_name,
+                           COALESCE(md.is_read, false) AS is_read
+                    FROM message m
+                    LEFT JOIN users sender ON sender.id = m.sender_id
+                    LEFT JOIN users recipient ON recipient.id = m.recipient_id
+                    LEFT JOIN message_detail md ON md.message_id = m.id AND md.user_id = $1
+                    WHERE m.message_type = 'user_chat'
+                      AND (
+                        (m.sender_id = $1 AND m.recipient_id = ANY($2::uuid[]))
+                        OR (m.recipient_id = $1 AND m.sender_id = ANY($2::uuid[]))
+                      )
+                    ORDER BY m.created_at ASC
+                    """,
+                    current_user["id"],
+                    admin_ids,
                 )
-                for row in rows
-            ]
+
+        return [
+            ChatMessage(
+                id=row["id"],
+                sender_id=row["sender_id"],
+                recipient_id=row["recipient_id"],
+                content=row["content"],
+                message_type=row["message_type"],
+                conversation_id=row["conversation_id"],
+                created_at=row["created_at"],
+                sender_name=row["sender_name"],
+                sender_role=row["sender_role"],
+                recipient_name=row["recipient_name"],
+                is_read=row["is_read"],
+            )
+            for row in rows
+        ]
     except Exception as e:
         print(f"[CHAT] Error in list_messages: {e}")
         import traceback
@@ -371,6 +384,7 @@ async def create_message(
 
 @router.get("/conversations")
 async def get_conversations(
+    db: ReadOnlyDB,
     current_user: dict = Depends(get_current_user),
 ):
     """
@@ -378,106 +392,107 @@ async def get_conversations(
     - Admin: Returns list of users they've chatted with + chatbot
     - User/CTV: Returns admin and chatbot conversations
     """
-    async with get_db_connection() as conn:
-        if current_user["role"] == "ADMIN":
-            # Get unique users admin has chatted with
-            rows = await conn.fetch(
-                """
-                SELECT DISTINCT 
-                    CASE 
-                        WHEN m.sender_id = $1 THEN m.recipient_id
-                        ELSE m.sender_id
-                    END AS user_id,
-                    u.ho_ten,
-                    u.email,
-                    u.so_dien_thoai,
-                    MAX(m.created_at) AS last_message_at
-                FROM message m
-                JOIN users u ON (
-                    CASE 
-                        WHEN m.sender_id = $1 THEN u.id = m.recipient_id
-                        ELSE u.id = m.sender_id
-                    END
-                )
-                WHERE m.message_type = 'user_chat'
-                  AND (m.sender_id = $1 OR m.recipient_id = $1)
-                  AND u.role != 'ADMIN'
-                GROUP BY user_id, u.ho_ten, u.email, u.so_dien_thoai
-                ORDER BY last_message_at DESC
-                """,
-                current_user["id"],
+    conn = await db.get()
+    if current_user["role"] == "ADMIN":
+        # Get unique users admin has chatted with
+        rows = await conn.fetch(
+            """
+            SELECT DISTINCT 
+                CASE 
+                    WHEN m.sender_id = $1 THEN m.recipient_id
+                    ELSE m.sender_id
+                END AS user_id,
+                u.ho_ten,
+                u.email,
+                u.so_dien_thoai,
+                MAX(m.created_at) AS last_message_at
+            FROM message m
+            JOIN users u ON (
+                CASE 
+                    WHEN m.sender_id = $1 THEN u.id = m.recipient_id
+                    ELSE u.id = m.sender_id
+                END
             )
+            WHERE m.message_type = 'user_chat'
+              AND (m.sender_id = $1 OR m.recipient_id = $1)
+              AND u.role != 'ADMIN'
+            GROUP BY user_id, u.ho_ten, u.email, u.so_dien_thoai
+            ORDER BY last_message_at DESC
+            """,
+            current_user["id"],
+        )
 
-            conversations = [
-                {
-                    "id": str(row["user_id"]),
-                    "name": row["ho_ten"],
-                    "type": "user",
-                    "userId": str(row["user_id"]),
-                    "lastMessageTime": row["last_message_at"].isoformat() if row["last_message_at"] else None,
-                }
-                for row in rows
-            ]
+        conversations = [
+            {
+                "id": str(row["user_id"]),
+                "name": row["ho_ten"],
+                "type": "user",
+                "userId": str(row["user_id"]),
+                "lastMessageTime": row["last_message_at"].isoformat() if row["last_message_at"] else None,
+            }
+            for row in rows
+        ]
+
+        # Always include chatbot
+        conversations.insert(0, {
+            "id": "chatbot",
+            "name": "AI Chatbot",
+            "type": "chatbot",
+        })
 
-            # Always include chatbot
-            conversations.insert(0, {
+        return conversations
+    else:
+        # User/CTV: Always return admin and chatbot
+        return [
+            {
+                "id": "admin",
+                "name": "Quản trị viên",
+                "type": "admin",
+            },
+            {
                 "id": "chatbot",
                 "name": "AI Chatbot",
                 "type": "chatbot",
-            })
-
-            return conversations
-        else:
-            # User/CTV: Always return admin and chatbot
-            return [
-                {
-                    "id": "admin",
-                    "name": "Quản trị viên",
-                    "type": "admin",
-                },
-                {
-                    "id": "chatbot",
-                    "name": "AI Chatbot",
-                    "type": "chatbot",
-                },
-            ]
+            },
+        ]
 
 
 @router.get("/chatbot", response_model=list[dict])
 async def get_chatbot_messages(
+    db: ReadOnlyDB,
     current_user: dict = Depends(get_current_user),
 ):
     """Get chatbot conversation history"""
-    async with get_db_connection() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT m.id,
-                   m.sender_id,
-                   m.content,
-                   m.created_at,
-                   sender.ho_ten AS sender_name
-            FROM message m
-            LEFT JOIN users sender ON sender.id = m.sender_id
-            WHERE m.message_type = 'chatbot'
-              AND m.sender_id = $1
-            ORDER BY m.created_at ASC
-            """,
-            current_user["id"],
-        )
+    conn = await db.get()
+    rows = await conn.fetch(
+        """
+        SELECT m.id,
+               m.sender_id,
+               m.content,
+               m.created_at,
+               sender.ho_ten AS sender_name
+        FROM message m
+        LEFT JOIN users sender ON sender.id = m.sender_id
+        WHERE m.message_type = 'chatbot'
+          AND m.sender_id = $1
+        ORDER BY m.created_at ASC
+        """,
+        current_user["id"],
+    )
 
-        return [
-            {
-                "id": str(row["id"]),
-                "sender_id": str(row["sender_id"]),
-                "content": row["content"],
-                "created_at": row["created_at"].isoformat(),
-                "sender_name": row["sender_name"],
-            }
-            for row in rows
-        ]
+    return [
+        {
+            "id": str(row["id"]),
+            "sender_id": str(row["sender_id"]),
+            "content": row["content"],
+            "created_at": row["created_at"].isoformat(),
+            "sender_name": row["sender_name"],
+        }
+        for row in rows
+    ]
 
 
-@router.post("/chatbot")
+@router.post("/chatbot", dependencies=[Depends(chatbot_rate_limit)])
 async def send_chatbot_message(
     payload: ChatMessageCreate,
     current_user: dict = Depends(get_current_user),
@@ -578,7 +593,7 @@ async def send_chatbot_message(
 @router.post("/messages/{message_id}/read")
 async def mark_message_read(
     message_id: UUID,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_claims),
 ):
     """Mark a message as read"""
     async with get_db_connection() as conn:
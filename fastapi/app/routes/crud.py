@@ -1,9 +1,11 @@
 """
 Comprehensive CRUD routes for all tables
 """
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from ..database import get_db_connection
 from ..auth import get_current_user, require_admin
+from ..catalog import catalog, catalog_response
+from ..user_cache import user_cache
 from uuid import uuid4
 from datetime import datetime
 from typing import Optional, List, Dict, Any
@@ -94,9 +96,9 @@ async def delete_record(table_name: str, record_id: str):
 # ============================================================
 
 @router.get("/nha-thuoc")
-async def list_pharmacies():
+async def list_pharmacies(request: Request):
     """List all pharmacies"""
-    return await get_all_records("nha_thuoc", "ten_nha_thuoc")
+    return catalog_response(request, await catalog.snapshot("nha_thuoc"))
 
 @router.get("/nha-thuoc/{pharmacy_id}")
 async def get_pharmacy(pharmacy_id: str):
@@ -110,7 +112,9 @@ async def create_pharmacy(
 ):
     """Create pharmacy (Admin only)"""
     await require_admin(current_user)
-    return await create_record("nha_thuoc", data)
+    record = await create_record("nha_thuoc", data)
+    await catalog.invalidate("nha_thuoc")
+    return record
 
 @router.put("/nha-thuoc/{pharmacy_id}")
 async def update_pharmacy(
@@ -120,7 +124,9 @@ async def update_pharmacy(
 ):
     """Update pharmacy (Admin only)"""
     await require_admin(current_user)
-    return await update_record("nha_thuoc", pharmacy_id, data)
+    record = await update_record("nha_thuoc", pharmacy_id, data)
+    await catalog.invalidate("nha_thuoc")
+    return record
 
 @router.delete("/nha-thuoc/{pharmacy_id}")
 async def delete_pharmacy(
@@ -129,16 +135,18 @@ async def delete_pharmacy(
 ):
     """Delete pharmacy (Admin only)"""
     await require_admin(current_user)
-    return await delete_record("nha_thuoc", pharmacy_id)
+    result = await delete_record("nha_thuoc", pharmacy_id)
+    await catalog.invalidate("nha_thuoc")
+    return result
 
 # ============================================================
 # LOAI THUOC (Medicine Types) CRUD
 # ============================================================
 
 @router.get("/loai-thuoc")
-async def list_medicine_types():
+async def list_medicine_types(request: Request):
     """List all medicine types"""
-    return await get_all_records("loai_thuoc", "ten_hoat_chat")
+    return catalog_response(request, await catalog.snapshot("loai_thuoc"))
 
 @router.get("/loai-thuoc/{type_id}")
 async def get_medicine_type(type_id: str):
@@ -152,7 +160,9 @@ async def create_medicine_type(
 ):
     """Create medicine type (Admin only)"""
     await require_admin(current_user)
-    return await create_record("loai_thuoc", data)
+    record = await create_record("loai_thuoc", data)
+    await catalog.invalidate("loai_thuoc")
+    return record
 
 @router.put("/loai-thuoc/{type_id}")
 async def update_medicine_type(
@@ -162,7 +172,9 @@ async def update_medicine_type(
 ):
     """Update medicine type (Admin only)"""
     await require_admin(current_user)
-    return await update_record("loai_thuoc", type_id, data)
+    record = await update_record("loai_thuoc", type_id, data)
+    await catalog.invalidate("loai_thuoc")
+    return record
 
 @router.delete("/loai-thuoc/{type_id}")
 async def delete_medicine_type(
@@ -171,7 +183,9 @@ async def delete_medicine_type(
 ):
     """Delete medicine type (Admin only)"""
     await require_admin(current_user)
-    return await delete_record("loai_thuoc", type_id)
+    result = await delete_record("loai_thuoc", type_id)
+    await catalog.invalidate("loai_thuoc")
+    return result
 
 # ============================================================
 # THONG BAO (Notifications) CRUD
@@ -309,6 +323,7 @@ async def award_points(
                 data['diem'],
                 data['id_nguoi_nop']
             )
+            user_cache.invalidate(data['id_nguoi_nop'])
             
             return point_record
 
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from ..models import ForumPost, ForumPostCreate, ForumCommentCreate
 from ..database import get_db_connection
-from ..auth import get_current_user
+from ..auth import get_current_user, get_current_claims
 from datetime import datetime
 from typing import Optional, List
 from uuid import uuid4
@@ -190,7 +190,7 @@ async def create_post(
 async def create_comment(
     post_id: str,
     comment: ForumCommentCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """Add comment to post"""
     async with get_db_connection() as conn:
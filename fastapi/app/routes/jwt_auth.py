@@ -7,6 +7,7 @@ from uuid import uuid4
 
 from ..jwt_auth import (
     verify_password,
+    access_token_claims,
     create_access_token,
     create_refresh_token,
     decode_token,
@@ -14,7 +15,8 @@ from ..jwt_auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
 )
 from ..database import get_db_connection
-from ..utils.password import hash_password
+from ..utils.password import hash_password_async, needs_rehash
+from ..rate_limit import RateLimit
 
 router = APIRouter()
 
@@ -45,7 +47,11 @@ class RefreshTokenRequest(BaseModel):
     refresh_token: str
 
 
-@router.post("/register", response_model=JWTLoginResponse)
+@router.post(
+    "/register",
+    response_model=JWTLoginResponse,
+    dependencies=[Depends(RateLimit("register", rate=5 / 3600, burst=5))],
+)
 async def jwt_register(user_data: JWTRegisterRequest):
     """Register new user with JWT"""
     # Validate input
@@ -61,6 +67,9 @@ async def jwt_register(user_data: JWTRegisterRequest):
             detail="Password must be at least 6 characters"
         )
     
+    # Hash before taking a connection so it isn't held during bcrypt
+    password_hash = await hash_password_async(user_data.password)
+    
     async with get_db_connection() as conn:
         # Check if user already exists
         if user_data.email:
@@ -85,9 +94,6 @@ async def jwt_register(user_data: JWTRegisterRequest):
                     detail="Phone number already registered"
                 )
         
-        # Hash password
-        password_hash = hash_password(user_data.password)
-        
         # Create user
         user_id = str(uuid4())
         user = await conn.fetchrow(
@@ -106,12 +112,11 @@ async def jwt_register(user_data: JWTRegisterRequest):
         )
         
         # Create tokens
-        token_data = {"sub": str(user['id'])}
         access_token = create_access_token(
-            token_data,
+            access_token_claims(user),
             expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         )
-        refresh_token = create_refresh_token(token_data)
+        refresh_token = create_refresh_token({"sub": str(user['id'])})
         
         # Prepare user data
         user_response = {
@@ -133,7 +138,11 @@ async def jwt_register(user_data: JWTRegisterRequest):
         }
 
 
-@router.post("/login", response_model=JWTLoginResponse)
+@router.post(
+    "/login",
+    response_model=JWTLoginResponse,
+    dependencies=[Depends(RateLimit("login", rate=10 / 60, burst=10))],
+)
 async def jwt_login(credentials: JWTLoginRequest):
     """Login with JWT - returns access and refresh tokens"""
     if not credentials.email and not credentials.phone:
@@ -160,46 +169,57 @@ async def jwt_login(credentials: JWTLoginRequest):
                 "SELECT * FROM users WHERE so_dien_thoai = $1",
                 credentials.phone
             )
-        
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid credentials"
-            )
-        
-        # Verify password
-        if not verify_password(credentials.password, user['password_hash']):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid credentials"
-            )
-        
-        # Create tokens
-        token_data = {"sub": str(user['id'])}
-        access_token = create_access_token(
-            token_data,
-            expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials"
         )
-        refresh_token = create_refresh_token(token_data)
-        
-        # Prepare user data
-        user_data = {
-            "id": str(user['id']),
-            "ho_ten": user['ho_ten'],
-            "email": user['email'],
-            "so_dien_thoai": user['so_dien_thoai'],
-            "dia_chi": user['dia_chi'],
-            "role": user['role'],
-            "diem_tich_luy": user['diem_tich_luy'],
-            "ngay_tao": user['ngay_tao'].isoformat() if user['ngay_tao'] else None,
-        }
-        
-        return {
-            "access_token": access_token,
-            "refresh_token": refresh_token,
-            "token_type": "bearer",
-            "user": user_data
-        }
+    
+    # Verify password (off the event loop, without holding a connection)
+    if not await verify_password(credentials.password, user['password_hash']):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials"
+        )
+    
+    # Upgrade hashes made with an older cost while we have the plaintext
+    if needs_rehash(user['password_hash']):
+        try:
+            new_hash = await hash_password_async(credentials.password)
+            async with get_db_connection() as conn:
+                await conn.execute(
+                    "UPDATE users SET password_hash = $1 WHERE id = $2 AND password_hash = $3",
+                    new_hash, user['id'], user['password_hash']
+                )
+        except Exception as e:
+            print(f"[JWT_AUTH] Password rehash skipped for {user['id']}: {e}")
+    
+    # Create tokens
+    access_token = create_access_token(
+        access_token_claims(user),
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token = create_refresh_token({"sub": str(user['id'])})
+    
+    # Prepare user data
+    user_data = {
+        "id": str(user['id']),
+        "ho_ten": user['ho_ten'],
+        "email": user['email'],
+        "so_dien_thoai": user['so_dien_thoai'],
+        "dia_chi": user['dia_chi'],
+        "role": user['role'],
+        "diem_tich_luy": user['diem_tich_luy'],
+        "ngay_tao": user['ngay_tao'].isoformat() if user['ngay_tao'] else None,
+    }
+    
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "user": user_data
+    }
 
 
 @router.post("/refresh")
@@ -222,10 +242,19 @@ async def refresh_access_token(request: RefreshTokenRequest):
                 detail="Invalid token payload"
             )
         
-        # Create new access token
-        token_data = {"sub": user_id}
+        # Create new access token with the user's current role and name
+        async with get_db_connection() as conn:
+            user = await conn.fetchrow(
+                "SELECT id, role, ho_ten FROM users WHERE id = $1",
+                user_id
+            )
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
         access_token = create_access_token(
-            token_data,
+            access_token_claims(user),
             expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         )
         
@@ -1,16 +1,25 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional, Tuple
+from uuid import UUID
 
 import logging
-from fastapi import APIRouter, Header, HTTPException
+import os
+from fastapi import APIRouter, Header, HTTPException, Query
 
+from .. import rollups
 from ..auth import get_current_user
-from ..database import get_db_connection
+from ..database import fan_out, get_db_connection
+from ..jwt_auth import decode_token
 from ..models import DashboardMetrics
+from ..snapshot import SnapshotCache
+from ..cache import shared_cache
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Longest range served by /metrics/trends (10 years)
+MAX_TREND_MONTHS = 120
+
 def subtract_months(date_obj: datetime, months_back: int) -> datetime:
     year = date_obj.year
     month = date_obj.month - months_back
@@ -19,9 +28,9 @@ def subtract_months(date_obj: datetime, months_back: int) -> datetime:
         year -= 1
     return date_obj.replace(year=year, month=month, day=1)
 
-def build_month_series(months: int = 6) -> List[Tuple[str, str]]:
-    """Return a list of (key, label) for the last N months (oldest -> newest)."""
-    base = datetime.utcnow().replace(day=1)
+def build_month_series(months: int = 6, end: Optional[date] = None) -> List[Tuple[str, str]]:
+    """Return a list of (key, label) for N months ending at `end` (default: this month), oldest -> newest."""
+    base = (end or datetime.utcnow().date()).replace(day=1)
     series: List[Tuple[str, str]] = []
     for offset in range(months - 1, -1, -1):
         target = subtract_months(base, offset)
@@ -30,81 +39,47 @@ def build_month_series(months: int = 6) -> List[Tuple[str, str]]:
         series.append((key, label))
     return series
 
-@router.get("/metrics", response_model=DashboardMetrics)
-async def get_metrics(
-    authorization: Optional[str] = Header(default=None),
-):
-    """Get dashboard metrics (public, with optional user context)"""
-    current_user = None
-    
-    # Try to get user from JWT token
-    if authorization and authorization.startswith("Bearer "):
-        try:
-            from ..jwt_auth import decode_token
-            token = authorization.split(" ")[1]
-            payload = decode_token(token)
-            if payload and payload.get("type") == "access":
-                user_id = payload.get("sub")
-                async with get_db_connection() as conn:
-                    user_row = await conn.fetchrow(
-                        "SELECT * FROM users WHERE id = $1", user_id
-                    )
-                    if user_row:
-                        current_user = dict(user_row)
-        except Exception as e:
-            logger.exception(f"Failed to resolve current user from JWT: {e}")
-            current_user = None
-
-    async with get_db_connection() as conn:
-        total_submissions = await conn.fetchval(
-            "SELECT COUNT(*) FROM ho_so_xu_ly"
-        ) or 0
-
-        pending_submissions = await conn.fetchval(
-            "SELECT COUNT(*) FROM ho_so_xu_ly WHERE ket_qua = 'pending'"
-        ) or 0
-
-        total_users = await conn.fetchval("SELECT COUNT(*) FROM users") or 0
-
-        total_vouchers = await conn.fetchval(
-            "SELECT COUNT(*) FROM voucher WHERE so_luong_con_lai > 0"
-        ) or 0
-
-        processed_submissions = total_submissions - pending_submissions
-
-        month_series = build_month_series(6)
-
-        submission_rows = await conn.fetch(
+async def read_trend(
+    conn,
+    dimension: str,
+    month_series: List[Tuple[str, str]],
+    subject_id: UUID = rollups.GLOBAL_SUBJECT,
+) -> List[dict]:
+    """Fill a month series from the monthly rollups (cost grows with the range, not the data)"""
+    start = date.fromisoformat(f"{month_series[0][0]}-01")
+    end = date.fromisoformat(f"{month_series[-1][0]}-01")
+    totals = await rollups.read_monthly_totals(conn, dimension, start, end, subject_id)
+    return [
+        {"label": label, "value": totals.get(key, 0)}
+        for key, label in month_series
+    ]
+
+async def compute_global_metrics() -> dict:
+    """Aggregate the public part of the dashboard (shared by every caller)"""
+    month_series = build_month_series(6)
+    (
+        status_rows,
+        total_users,
+        total_vouchers,
+        submission_trend,
+        voucher_trend,
+        medicine_rows,
+        role_rows,
+    ) = await fan_out(
+        lambda conn: conn.fetch(
             """
-            SELECT to_char(date_trunc('month', thoi_gian_xu_ly), 'YYYY-MM') AS month_key,
-                   COUNT(*)::int AS total
+            SELECT trang_thai, COUNT(*)::int AS total
             FROM ho_so_xu_ly
-            WHERE thoi_gian_xu_ly >= date_trunc('month', CURRENT_DATE) - INTERVAL '5 months'
-            GROUP BY month_key
+            GROUP BY trang_thai
             """
-        )
-        submission_map = {row["month_key"]: row["total"] for row in submission_rows}
-        submission_trend = [
-            {"label": label, "value": submission_map.get(key, 0)}
-            for key, label in month_series
-        ]
-
-        voucher_rows = await conn.fetch(
-            """
-            SELECT to_char(date_trunc('month', redeemed_at), 'YYYY-MM') AS month_key,
-                   COUNT(*)::int AS total
-            FROM voucher_usage
-            WHERE redeemed_at >= date_trunc('month', CURRENT_DATE) - INTERVAL '5 months'
-            GROUP BY month_key
-            """
-        )
-        voucher_map = {row["month_key"]: row["total"] for row in voucher_rows}
-        voucher_trend = [
-            {"label": label, "value": voucher_map.get(key, 0)}
-            for key, label in month_series
-        ]
-
-        medicine_rows = await conn.fetch(
+        ),
+        lambda conn: conn.fetchval("SELECT COUNT(*) FROM users"),
+        lambda conn: conn.fetchval(
+            "SELECT COUNT(*) FROM voucher WHERE so_luong_con_lai > 0"
+        ),
+        lambda conn: read_trend(conn, rollups.SUBMISSIONS, month_series),
+        lambda conn: read_trend(conn, rollups.VOUCHER_REDEMPTIONS, month_series),
+        lambda conn: conn.fetch(
             """
             SELECT COALESCE(lt.ten_hoat_chat, 'Khác') AS label,
                    COUNT(*)::int AS total
@@ -114,93 +89,155 @@ async def get_metrics(
             ORDER BY total DESC
             LIMIT 6
             """
-        )
-        medicine_distribution = [
-            {"label": row["label"], "value": row["total"]} for row in medicine_rows
-        ]
-
-        role_rows = await conn.fetch(
+        ),
+        lambda conn: conn.fetch(
             """
             SELECT role, COUNT(*)::int AS total
             FROM users
             GROUP BY role
             """
-        )
-        user_role_distribution = [
+        ),
+    )
+
+    status_counts = {row["trang_thai"]: row["total"] for row in status_rows}
+    total_submissions = sum(status_counts.values())
+    pending_submissions = status_counts.get("PENDING", 0)
+
+    return {
+        "totalSubmissions": total_submissions,
+        "pendingSubmissions": pending_submissions,
+        "totalUsers": total_users or 0,
+        "totalVouchers": total_vouchers or 0,
+        "processedSubmissions": total_submissions - pending_submissions,
+        "submissionTrend": submission_trend,
+        "voucherTrend": voucher_trend,
+        "userRoleDistribution": [
             {"label": row["role"], "value": row["total"]} for row in role_rows
-        ]
-
-        user_stats = None
-        if current_user:
-            user_id = current_user["id"]
-            status_rows = await conn.fetch(
-                """
-                SELECT ket_qua, COUNT(*)::int AS total
-                FROM ho_so_xu_ly
-                WHERE id_nguoi_nop = $1
-                GROUP BY ket_qua
-                """,
-                user_id,
-            )
-            status_map = {row["ket_qua"]: row["total"] for row in status_rows}
-
-            vouchers_used = (
-                await conn.fetchval(
-                    "SELECT COUNT(*) FROM voucher_usage WHERE user_id = $1", user_id
-                )
-            ) or 0
-
-            monthly_point_rows = await conn.fetch(
-                """
-                SELECT to_char(date_trunc('month', ngay_cong), 'YYYY-MM') AS month_key,
-                       COALESCE(SUM(diem), 0)::int AS total
-                FROM diem_thuong
-                WHERE id_nguoi_nop = $1
-                  AND ngay_cong >= date_trunc('month', CURRENT_DATE) - INTERVAL '5 months'
-                GROUP BY month_key
-                """,
-                user_id,
-            )
-            points_map = {
-                row["month_key"]: row["total"] for row in monthly_point_rows
-            }
-            monthly_points = [
-                {"label": label, "value": points_map.get(key, 0)}
-                for key, label in month_series
-            ]
-
-            points = current_user.get("diem_tich_luy", 0) or 0
-            if points >= 500:
-                level = "Platinum"
-            elif points >= 300:
-                level = "Gold"
-            elif points >= 150:
-                level = "Silver"
-            else:
-                level = "Bronze"
-
-            user_stats = {
-                "points": points,
-                "level": level,
-                "submissions": sum(status_map.values()),
-                "approved": status_map.get("approved", 0),
-                "pending": status_map.get("pending", 0),
-                "rejected": status_map.get("rejected", 0),
-                "returned": status_map.get("returned_to_pharmacy", 0),
-                "recalled": status_map.get("recalled", 0),
-                "vouchersUsed": vouchers_used,
-                "monthlyPoints": monthly_points,
-            }
+        ],
+        "medicineDistribution": [
+            {"label": row["label"], "value": row["total"]} for row in medicine_rows
+        ],
+    }
+
+METRICS_REFRESH_SECONDS = float(os.getenv("METRICS_REFRESH_SECONDS", "30"))
+
+# Shared through the cache so one worker computes the figures for all of them
+metrics_cache = shared_cache.namespace("metrics", ttl=METRICS_REFRESH_SECONDS)
+
+
+async def load_global_metrics() -> dict:
+    return await metrics_cache.get_or_load("global", compute_global_metrics)
+
+# Global dashboard figures are recomputed in the background and served from memory
+metrics_snapshot = SnapshotCache(
+    "metrics",
+    load_global_metrics,
+    refresh_interval=METRICS_REFRESH_SECONDS,
+    max_age=float(os.getenv("METRICS_MAX_AGE_SECONDS", "60")),
+    max_stale=float(os.getenv("METRICS_MAX_STALE_SECONDS", "600")),
+)
 
+async def compute_user_stats(user_id) -> Optional[dict]:
+    """Per-user block of the dashboard: one primary-key read of the user's counters"""
+    month_series = build_month_series(6)
+    start = date.fromisoformat(f"{month_series[0][0]}-01")
+    end = date.fromisoformat(f"{month_series[-1][0]}-01")
+    async with get_db_connection() as conn:
+        row = await conn.fetchrow(
+            """
+            SELECT u.diem_tich_luy,
+                   COALESCE(us.pending, 0) AS pending,
+                   COALESCE(us.approved, 0) AS approved,
+                   COALESCE(us.rejected, 0) AS rejected,
+                   COALESCE(us.returned, 0) AS returned,
+                   COALESCE(us.recalled, 0) AS recalled,
+                   COALESCE(us.vouchers_used, 0) AS vouchers_used,
+                   (
+                       SELECT json_object_agg(to_char(r.month, 'YYYY-MM'), r.total)
+                       FROM (
+                           SELECT month, SUM(total) AS total
+                           FROM monthly_rollups
+                           WHERE dimension = $2 AND subject_id = u.id
+                             AND month BETWEEN $3 AND $4
+                           GROUP BY month
+                       ) r
+                   ) AS monthly_points
+            FROM users u
+            LEFT JOIN user_stats us ON us.user_id = u.id
+            WHERE u.id = $1
+            """,
+            user_id, rollups.POINTS, start, end,
+        )
+    if not row:
+        return None
+
+    points_map = row["monthly_points"] or {}
+    monthly_points = [
+        {"label": label, "value": points_map.get(key, 0)}
+        for key, label in month_series
+    ]
+
+    points = row["diem_tich_luy"] or 0
+    if points >= 500:
+        level = "Platinum"
+    elif points >= 300:
+        level = "Gold"
+    elif points >= 150:
+        level = "Silver"
+    else:
+        level = "Bronze"
+
+    return {
+        "points": points,
+        "level": level,
+        "submissions": row["pending"] + row["approved"] + row["rejected"] + row["returned"] + row["recalled"],
+        "approved": row["approved"],
+        "pending": row["pending"],
+        "rejected": row["rejected"],
+        "returned": row["returned"],
+        "recalled": row["recalled"],
+        "vouchersUsed": row["vouchers_used"],
+        "monthlyPoints": monthly_points,
+    }
+
+@router.get("/metrics", response_model=DashboardMetrics)
+async def get_metrics(
+    authorization: Optional[str] = Header(default=None),
+):
+    """Get dashboard metrics (public, with optional user context)"""
+    user_id = None
+    
+    # Try to get user from JWT token
+    if authorization and authorization.startswith("Bearer "):
+        try:
+            token = authorization.split(" ")[1]
+            payload = decode_token(token)
+            if payload and payload.get("type") == "access":
+                user_id = UUID(payload.get("sub"))
+        except Exception as e:
+            logger.exception(f"Failed to resolve current user from JWT: {e}")
+            user_id = None
+
+    snapshot = await metrics_snapshot.get()
+    user_stats = await compute_user_stats(user_id) if user_id else None
+    return {**snapshot.value, "userStats": user_stats}
+
+@router.get("/metrics/trends")
+async def get_trends(
+    months: int = Query(12, ge=1, le=MAX_TREND_MONTHS),
+    end: Optional[str] = Query(None, description="Last month of the range, YYYY-MM"),
+):
+    """Submission and voucher trends over an arbitrary month range (public)"""
+    end_month = None
+    if end:
+        try:
+            end_month = datetime.strptime(end, "%Y-%m").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid end month. Expected YYYY-MM")
+
+    month_series = build_month_series(months, end_month)
+    async with get_db_connection() as conn:
         return {
-            "totalSubmissions": total_submissions,
-            "pendingSubmissions": pending_submissions,
-            "totalUsers": total_users,
-            "totalVouchers": total_vouchers,
-            "processedSubmissions": processed_submissions,
-            "submissionTrend": submission_trend,
-            "voucherTrend": voucher_trend,
-            "userRoleDistribution": user_role_distribution,
-            "medicineDistribution": medicine_distribution,
-            "userStats": user_stats,
+            "submissionTrend": await read_trend(conn, rollups.SUBMISSIONS, month_series),
+            "voucherTrend": await read_trend(conn, rollups.VOUCHER_REDEMPTIONS, month_series),
         }
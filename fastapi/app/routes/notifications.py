@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from ..models import Notification, NotificationCreate
-from ..database import get_db_connection
-from ..auth import get_current_user
+from ..database import ReadOnlyDB, get_db_connection
+from ..auth import get_current_claims
 from uuid import uuid4
 from datetime import datetime
 
@@ -9,25 +9,26 @@ router = APIRouter()
 
 @router.get("", response_model=list[Notification])
 async def list_notifications(
-    current_user: dict = Depends(get_current_user)
+    db: ReadOnlyDB,
+    current_user: dict = Depends(get_current_claims)
 ):
     """List notifications for current user - only show notifications sent to this specific user"""
-    async with get_db_connection() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT * FROM thong_bao 
-            WHERE id_nguoi_nhan = $1
-            ORDER BY ngay_tao DESC
-            LIMIT 100
-            """,
-            current_user['id']
-        )
-        return [dict(row) for row in rows]
+    conn = await db.get()
+    rows = await conn.fetch(
+        """
+        SELECT * FROM thong_bao 
+        WHERE id_nguoi_nhan = $1
+        ORDER BY ngay_tao DESC
+        LIMIT 100
+        """,
+        current_user['id']
+    )
+    return [dict(row) for row in rows]
 
 @router.post("", response_model=Notification, status_code=status.HTTP_201_CREATED)
 async def create_notification(
     notification: NotificationCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """Create notification"""
     async with get_db_connection() as conn:
@@ -52,7 +53,7 @@ async def create_notification(
 @router.post("/{notification_id}/read")
 async def mark_notification_read(
     notification_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """Mark notification as read - only for notifications sent to this user"""
     async with get_db_connection() as conn:
@@ -70,7 +71,7 @@ async def mark_notification_read(
 @router.delete("/{notification_id}")
 async def delete_notification(
     notification_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """Delete notification - only for notifications sent to this user"""
     async with get_db_connection() as conn:
@@ -87,7 +88,7 @@ async def delete_notification(
 @router.put("/{notification_id}/archive")
 async def archive_notification(
     notification_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """Archive notification (mark as read) - only for notifications sent to this user"""
     async with get_db_connection() as conn:
@@ -104,7 +105,7 @@ async def archive_notification(
 
 @router.put("/read-all")
 async def mark_all_read(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """Mark all notifications as read - only for notifications sent to this user"""
     async with get_db_connection() as conn:
@@ -120,7 +121,7 @@ async def mark_all_read(
 
 @router.delete("/clear")
 async def clear_notifications(
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """Clear all read notifications - only for notifications sent to this user"""
     async with get_db_connection() as conn:
@@ -1,13 +1,28 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
 from typing import List, Optional
-from datetime import datetime
-from uuid import uuid4
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
 from ..database import get_db_connection
 from ..auth import get_current_user, require_admin
+from ..catalog import catalog
+from ..pagination import decode_cursor, paginate
+from ..user_cache import user_cache
 from pydantic import BaseModel
+import os
 
 router = APIRouter()
 
+# Maximum number of submissions handled by one bulk decision request
+MAX_BULK_ITEMS = int(os.getenv("BULK_ACTION_MAX_ITEMS", "500"))
+
+# Largest page the review queue returns per request
+MAX_PAGE_SIZE = 200
+
+# Work-queue mode: how long a claimed submission stays reserved for its reviewer,
+# and how many submissions one reviewer may hold at once
+LEASE_SECONDS = int(os.getenv("REVIEW_LEASE_SECONDS", "900"))
+MAX_OPEN_LEASES = int(os.getenv("REVIEW_MAX_OPEN_LEASES", "20"))
+
 # ============================================================
 # MODELS
 # ============================================================
@@ -32,6 +47,28 @@ class SubmissionApprovalRequest(BaseModel):
     classifications: List[ClassificationResult]
     ghi_chu: Optional[str] = None
 
+class BulkDecisionItem(BaseModel):
+    submission_id: str
+    ket_qua: Optional[str] = None  # Overrides the shared verdict
+    ghi_chu: Optional[str] = None
+    points: Optional[int] = None  # Admin only, like the admin submission action
+
+class BulkDecisionRequest(BaseModel):
+    ket_qua: Optional[str] = None  # Shared verdict: "approved" or "rejected"
+    ghi_chu: Optional[str] = None
+    submission_ids: Optional[List[str]] = None
+    items: Optional[List[BulkDecisionItem]] = None
+
+class ClaimRequest(BaseModel):
+    count: int = 5
+
+class ReleaseClaimsRequest(BaseModel):
+    submission_ids: Optional[List[str]] = None  # Release everything when omitted
+
+def calculate_submission_points(so_luong: Optional[int]) -> int:
+    """Default reward for an approved submission"""
+    return max(10, ((so_luong or 0) // 10) * 10)
+
 # ============================================================
 # ENDPOINTS
 # ============================================================
@@ -42,26 +79,32 @@ async def get_active_criteria(current_user: dict = Depends(get_current_user)):
     if current_user['role'] not in ['ADMIN', 'CONGTACVIEN']:
         raise HTTPException(status_code=403, detail="Chỉ Admin/Cộng tác viên mới có quyền")
     
-    async with get_db_connection() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT id::text, ma_tieu_chi, ten_tieu_chi, mo_ta, kieu_du_lieu, hoat_dong
-            FROM tieu_chi_phan_loai
-            WHERE hoat_dong = true
-            ORDER BY ngay_tao ASC
-            """
-        )
-        return [dict(row) for row in rows]
+    entry = await catalog.snapshot("tieu_chi_phan_loai")
+    return [{**row, 'id': str(row['id'])} for row in entry.rows]
 
 @router.get("/pending")
-async def get_pending_submissions(current_user: dict = Depends(get_current_user)):
-    """Get all pending submissions for approval (Admin/CTV only)"""
+async def get_pending_submissions(
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get pending submissions for approval, newest first (Admin/CTV only)"""
     if current_user['role'] not in ['ADMIN', 'CONGTACVIEN']:
         raise HTTPException(status_code=403, detail="Chỉ Admin/Cộng tác viên mới có quyền")
     
+    cursor_ts, cursor_id = decode_cursor(cursor)
+    
+    params = [limit + 1]
+    keyset = ""
+    if cursor_ts:
+        keyset = "AND (hs.thoi_gian_xu_ly, hs.id) < ($2, $3)"
+        params += [cursor_ts, cursor_id]
+    
     async with get_db_connection() as conn:
+        # Existing classifications are aggregated per row, so the page is one round trip
         rows = await conn.fetch(
-            """
+            f"""
             SELECT 
                 hs.id,
                 hs.id_nguoi_nop,
@@ -76,43 +119,204 @@ async def get_pending_submissions(current_user: dict = Depends(get_current_user)
                 hs.ket_qua,
                 hs.ghi_chu,
                 hs.thoi_gian_xu_ly::text,
-                hs.duong_dan_chung_nhan
+                hs.duong_dan_chung_nhan,
+                CASE WHEN hs.han_nhan_duyet > NOW() THEN hs.id_nguoi_nhan_duyet END AS id_nguoi_nhan_duyet,
+                CASE WHEN hs.han_nhan_duyet > NOW() THEN hs.han_nhan_duyet::text END AS han_nhan_duyet,
+                hs.thoi_gian_xu_ly AS sort_key,
+                COALESCE(cls.items, '[]'::json) AS classifications
             FROM ho_so_xu_ly hs
             JOIN users u ON hs.id_nguoi_nop = u.id
             JOIN nha_thuoc nt ON hs.id_nha_thuoc = nt.id
             JOIN loai_thuoc lt ON hs.id_loai_thuoc = lt.id
-            WHERE hs.ket_qua = 'pending'
-            ORDER BY hs.thoi_gian_xu_ly DESC
-            """
+            LEFT JOIN LATERAL (
+                SELECT json_agg(json_build_object(
+                    'id', kq.id,
+                    'id_tieu_chi', ct.id_tieu_chi,
+                    'ten_tieu_chi', tc.ten_tieu_chi,
+                    'ket_qua', ct.ket_qua,
+                    'gia_tri_do', ct.gia_tri_do,
+                    'bang_chung_url', ct.bang_chung_url,
+                    'ghi_chu', ct.ghi_chu,
+                    'thoi_gian_danh_gia', kq.thoi_gian_danh_gia::text
+                ) ORDER BY tc.ngay_tao) AS items
+                FROM ket_qua_phan_loai kq
+                JOIN chi_tiet_danh_gia ct ON ct.id_ket_qua = kq.id
+                JOIN tieu_chi_phan_loai tc ON ct.id_tieu_chi = tc.id
+                WHERE kq.id_ho_so_xu_ly = hs.id
+            ) cls ON true
+            WHERE hs.ket_qua = 'pending' {keyset}
+            ORDER BY hs.thoi_gian_xu_ly DESC, hs.id DESC
+            LIMIT $1
+            """,
+            *params
         )
         
-        submissions = []
-        for row in rows:
-            sub = dict(row)
+        return paginate([dict(row) for row in rows], limit, response)
+
+# ============================================================
+# WORK QUEUE (REVIEW LEASES)
+# ============================================================
+
+async def fetch_open_leases(conn, reviewer_id) -> List[dict]:
+    """Pending submissions currently leased to the reviewer, oldest first"""
+    rows = await conn.fetch(
+        """
+        SELECT 
+            hs.id,
+            hs.id_nguoi_nop,
+            u.ho_ten,
+            u.email,
+            nt.ten_nha_thuoc,
+            lt.ten_hoat_chat,
+            lt.thuong_hieu,
+            hs.so_luong,
+            hs.don_vi_tinh,
+            hs.han_dung::text,
+            hs.ket_qua,
+            hs.ghi_chu,
+            hs.thoi_gian_xu_ly::text,
+            hs.duong_dan_chung_nhan,
+            hs.han_nhan_duyet::text
+        FROM ho_so_xu_ly hs
+        JOIN users u ON hs.id_nguoi_nop = u.id
+        JOIN nha_thuoc nt ON hs.id_nha_thuoc = nt.id
+        JOIN loai_thuoc lt ON hs.id_loai_thuoc = lt.id
+        WHERE hs.ket_qua = 'pending'
+          AND hs.id_nguoi_nhan_duyet = $1
+          AND hs.han_nhan_duyet > NOW()
+        ORDER BY hs.thoi_gian_xu_ly ASC, hs.id ASC
+        """,
+        reviewer_id
+    )
+    return [dict(row) for row in rows]
+
+@router.post("/claim")
+async def claim_submissions(
+    request: ClaimRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Lease up to `count` unassigned pending submissions to the caller (Admin/CTV only).
+    Also renews the caller's open leases. Each reviewer gets at most a fair share of
+    the queue, based on the open-lease counts of the reviewers currently working it.
+    """
+    if current_user['role'] not in ['ADMIN', 'CONGTACVIEN']:
+        raise HTTPException(status_code=403, detail="Chỉ Admin/Cộng tác viên mới có quyền")
+    if request.count < 1:
+        raise HTTPException(status_code=400, detail="Số lượng hồ sơ phải lớn hơn 0")
+    
+    reviewer_id = current_user['id']
+    async with get_db_connection() as conn:
+        async with conn.transaction():
+            # Serialize claims of the same reviewer so the caps hold
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1::text))", str(reviewer_id))
             
-            # Get existing classifications
-            class_rows = await conn.fetch(
+            renewed = await conn.fetch(
                 """
-                SELECT 
-                    kq.id,
-                    kq.id_tieu_chi,
-                    tc.ten_tieu_chi,
-                    kq.ket_qua,
-                    kq.gia_tri_do,
-                    kq.bang_chung_url,
-                    kq.ghi_chu,
-                    kq.thoi_gian_danh_gia::text
-                FROM ket_qua_phan_loai kq
-                JOIN tieu_chi_phan_loai tc ON kq.id_tieu_chi = tc.id
-                WHERE kq.id_ho_so_xu_ly = $1
-                ORDER BY kq.thoi_gian_danh_gia DESC
+                UPDATE ho_so_xu_ly
+                SET han_nhan_duyet = NOW() + make_interval(secs => $2)
+                WHERE ket_qua = 'pending'
+                  AND id_nguoi_nhan_duyet = $1
+                  AND han_nhan_duyet > NOW()
+                RETURNING id
                 """,
-                sub['id']
+                reviewer_id, LEASE_SECONDS
             )
-            sub['classifications'] = [dict(r) for r in class_rows]
-            submissions.append(sub)
+            open_leases = len(renewed)
+            
+            queue = await conn.fetchrow(
+                """
+                SELECT
+                    COUNT(*) FILTER (WHERE id_nguoi_nhan_duyet IS NULL OR han_nhan_duyet <= NOW()) AS available,
+                    COUNT(*) FILTER (WHERE han_nhan_duyet > NOW()) AS leased,
+                    COUNT(DISTINCT id_nguoi_nhan_duyet) FILTER (
+                        WHERE han_nhan_duyet > NOW() AND id_nguoi_nhan_duyet <> $1
+                    ) AS other_reviewers
+                FROM ho_so_xu_ly
+                WHERE ket_qua = 'pending'
+                """,
+                reviewer_id
+            )
+            fair_share = -(-(queue['available'] + queue['leased']) // (queue['other_reviewers'] + 1))
+            allowance = min(
+                request.count,
+                MAX_OPEN_LEASES - open_leases,
+                fair_share - open_leases,
+            )
+            
+            claimed = []
+            if allowance > 0:
+                claimed = await conn.fetch(
+                    """
+                    WITH picked AS (
+                        SELECT id
+                        FROM ho_so_xu_ly
+                        WHERE ket_qua = 'pending'
+                          AND (id_nguoi_nhan_duyet IS NULL OR han_nhan_duyet <= NOW())
+                        ORDER BY thoi_gian_xu_ly ASC, id ASC
+                        LIMIT $2
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    UPDATE ho_so_xu_ly hs
+                    SET id_nguoi_nhan_duyet = $1,
+                        han_nhan_duyet = NOW() + make_interval(secs => $3)
+                    FROM picked
+                    WHERE hs.id = picked.id
+                    RETURNING hs.id
+                    """,
+                    reviewer_id, allowance, LEASE_SECONDS
+                )
         
-        return submissions
+        items = await fetch_open_leases(conn, reviewer_id)
+    
+    print(f"[APPROVAL] {current_user['ho_ten']} claimed {len(claimed)} submissions, holding {len(items)}")
+    return {
+        "claimed": len(claimed),
+        "open_leases": len(items),
+        "lease_seconds": LEASE_SECONDS,
+        "items": items,
+    }
+
+@router.get("/claims")
+async def get_my_claims(current_user: dict = Depends(get_current_user)):
+    """Get the submissions currently leased to the caller (Admin/CTV only)"""
+    if current_user['role'] not in ['ADMIN', 'CONGTACVIEN']:
+        raise HTTPException(status_code=403, detail="Chỉ Admin/Cộng tác viên mới có quyền")
+    
+    async with get_db_connection() as conn:
+        return await fetch_open_leases(conn, current_user['id'])
+
+@router.post("/claims/release")
+async def release_claims(
+    request: ReleaseClaimsRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Hand leased submissions back to the queue without deciding them (Admin/CTV only)"""
+    if current_user['role'] not in ['ADMIN', 'CONGTACVIEN']:
+        raise HTTPException(status_code=403, detail="Chỉ Admin/Cộng tác viên mới có quyền")
+    
+    query = """
+        UPDATE ho_so_xu_ly
+        SET id_nguoi_nhan_duyet = NULL, han_nhan_duyet = NULL
+        WHERE ket_qua = 'pending' AND id_nguoi_nhan_duyet = $1
+    """
+    params = [current_user['id']]
+    if request.submission_ids is not None:
+        try:
+            ids = [UUID(sid) for sid in request.submission_ids]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ID hồ sơ không hợp lệ")
+        query += " AND id = ANY($2::uuid[])"
+        params.append(ids)
+    
+    async with get_db_connection() as conn:
+        result = await conn.execute(query, *params)
+    
+    return {"released": int(result.split()[-1])}
+
+# ============================================================
+# SUBMISSION REVIEW
+# ============================================================
 
 @router.get("/{submission_id}")
 async def get_submission_detail(
@@ -200,6 +404,7 @@ async def approve_submission(
                 FROM ho_so_xu_ly hs
                 JOIN users u ON hs.id_nguoi_nop = u.id
                 WHERE hs.id = $1 AND hs.ket_qua = 'pending'
+                FOR UPDATE OF hs
                 """,
                 submission_id
             )
@@ -207,11 +412,18 @@ async def approve_submission(
             if not submission:
                 raise HTTPException(status_code=404, detail="Hồ sơ không tồn tại hoặc đã được xử lý")
             
-            # Update submission status
+            # The row is locked above, so the lease can't change before the UPDATE
+            lease_holder = submission['id_nguoi_nhan_duyet']
+            if (lease_holder is not None and str(lease_holder) != current_user['id']
+                    and submission['han_nhan_duyet'] > datetime.now(timezone.utc)):
+                raise HTTPException(status_code=409, detail="Hồ sơ đang được người khác duyệt")
+            
+            # Update submission status and release its lease
             await conn.execute(
                 """
                 UPDATE ho_so_xu_ly
-                SET ket_qua = $1, ghi_chu = $2
+                SET ket_qua = $1, ghi_chu = $2,
+                    id_nguoi_nhan_duyet = NULL, han_nhan_duyet = NULL
                 WHERE id = $3
                 """,
                 approval_data.ket_qua,
@@ -240,13 +452,14 @@ async def approve_submission(
             
             # Award points if approved
             if approval_data.ket_qua == 'approved':
-                points_awarded = max(10, (submission['so_luong'] // 10) * 10)
+                points_awarded = calculate_submission_points(submission['so_luong'])
                 
                 await conn.execute(
                     "UPDATE users SET diem_tich_luy = diem_tich_luy + $1 WHERE id = $2",
                     points_awarded,
                     submission['user_id']
                 )
+                user_cache.invalidate(submission['user_id'])
                 
                 await conn.execute(
                     "UPDATE ho_so_xu_ly SET diem_da_trao = $1 WHERE id = $2",
@@ -296,6 +509,208 @@ async def approve_submission(
                 "points_awarded": points_awarded
             }
 
+@router.post("/bulk-action")
+async def bulk_decide_submissions(
+    request: BulkDecisionRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Approve or reject many pending submissions in one transaction (Admin/CTV only)"""
+    if current_user['role'] not in ['ADMIN', 'CONGTACVIEN']:
+        raise HTTPException(status_code=403, detail="Chỉ Admin/Cộng tác viên mới có quyền")
+    
+    def dedupe_key(submission_id: str) -> str:
+        try:
+            return str(UUID(submission_id))
+        except ValueError:
+            return submission_id
+    
+    # Explicit per-item decisions take precedence over the shared id list;
+    # the first entry for an id wins
+    items = []
+    seen = set()
+    for item in list(request.items or []) + [
+        BulkDecisionItem(submission_id=sid) for sid in request.submission_ids or []
+    ]:
+        key = dedupe_key(item.submission_id)
+        if key not in seen:
+            seen.add(key)
+            items.append(item)
+    if not items:
+        raise HTTPException(status_code=400, detail="Danh sách hồ sơ trống")
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {MAX_BULK_ITEMS} hồ sơ mỗi lần")
+    
+    # Resolve the verdict of each item; invalid items are reported, not fatal
+    results = {}
+    decisions = {}
+    for item in items:
+        verdict = item.ket_qua or request.ket_qua
+        if verdict not in ['approved', 'rejected']:
+            results[item.submission_id] = {"ok": False, "error": "Trạng thái không hợp lệ"}
+            continue
+        # Collaborators always award the default points
+        if item.points is not None and current_user['role'] != 'ADMIN':
+            results[item.submission_id] = {"ok": False, "error": "Chỉ Admin mới được chỉ định số điểm"}
+            continue
+        try:
+            submission_uuid = UUID(item.submission_id)
+        except ValueError:
+            results[item.submission_id] = {"ok": False, "error": "ID hồ sơ không hợp lệ"}
+            continue
+        decisions[submission_uuid] = {
+            "ket_qua": verdict,
+            "ghi_chu": item.ghi_chu if item.ghi_chu is not None else request.ghi_chu,
+            "points": item.points,
+        }
+    
+    async with get_db_connection() as conn:
+        async with conn.transaction():
+            # Lock the still-pending rows; rows locked or leased by another reviewer are skipped
+            rows = await conn.fetch(
+                """
+                SELECT id, id_nguoi_nop, so_luong
+                FROM ho_so_xu_ly
+                WHERE id = ANY($1::uuid[]) AND ket_qua = 'pending'
+                  AND (id_nguoi_nhan_duyet IS NULL OR id_nguoi_nhan_duyet = $2
+                       OR han_nhan_duyet <= NOW())
+                FOR UPDATE SKIP LOCKED
+                """,
+                list(decisions.keys()), current_user['id']
+            )
+            
+            ids, verdicts, notes, points, user_ids = [], [], [], [], []
+            for row in rows:
+                decision = decisions[row['id']]
+                awarded = 0
+                if decision['ket_qua'] == 'approved':
+                    if decision['points'] is not None and decision['points'] >= 0:
+                        awarded = decision['points']
+                    else:
+                        awarded = calculate_submission_points(row['so_luong'])
+                ids.append(row['id'])
+                verdicts.append(decision['ket_qua'])
+                notes.append(decision['ghi_chu'])
+                points.append(awarded)
+                user_ids.append(row['id_nguoi_nop'])
+            
+            if ids:
+                # Lock the submitters' counters (taken by triggers below) and accounts
+                # in id order, so overlapping bulk actions queue instead of deadlocking.
+                # Counters come first, as in the single-submission paths
+                submitters = sorted(set(user_ids))
+                await conn.execute(
+                    "SELECT 1 FROM user_stats WHERE user_id = ANY($1::uuid[]) ORDER BY user_id FOR UPDATE",
+                    submitters
+                )
+                await conn.execute(
+                    "SELECT 1 FROM users WHERE id = ANY($1::uuid[]) ORDER BY id FOR UPDATE",
+                    submitters
+                )
+                
+                await conn.execute(
+                    """
+                    UPDATE ho_so_xu_ly hs
+                    SET ket_qua = v.ket_qua::submission_status,
+                        ghi_chu = v.ghi_chu,
+                        diem_da_trao = v.diem,
+                        id_nguoi_nhan_duyet = NULL,
+                        han_nhan_duyet = NULL
+                    FROM unnest($1::uuid[], $2::text[], $3::text[], $4::int[])
+                         AS v(id, ket_qua, ghi_chu, diem)
+                    WHERE hs.id = v.id
+                    """,
+                    ids, verdicts, notes, points
+                )
+                
+                await conn.execute(
+                    """
+                    INSERT INTO ket_qua_phan_loai
+                    (id, id_ho_so_xu_ly, ket_qua_tong, nguoi_danh_gia, ghi_chu_chung)
+                    SELECT uuid_generate_v4(), v.id,
+                           CASE WHEN v.ket_qua = 'approved' THEN 'DAT' ELSE 'KHONG_DAT' END,
+                           $4::uuid, v.ghi_chu
+                    FROM unnest($1::uuid[], $2::text[], $3::text[]) AS v(id, ket_qua, ghi_chu)
+                    ON CONFLICT (id_ho_so_xu_ly) DO UPDATE
+                    SET ket_qua_tong = EXCLUDED.ket_qua_tong,
+                        nguoi_danh_gia = EXCLUDED.nguoi_danh_gia,
+                        ghi_chu_chung = EXCLUDED.ghi_chu_chung,
+                        thoi_gian_danh_gia = CURRENT_TIMESTAMP
+                    """,
+                    ids, verdicts, notes, current_user['id']
+                )
+                
+                await conn.execute(
+                    """
+                    INSERT INTO diem_thuong (id, id_nguoi_nop, diem, ly_do, trang_thai)
+                    SELECT uuid_generate_v4(), v.user_id, v.diem,
+                           'Nộp thuốc thành công - Hồ sơ #' || left(v.id::text, 8), 'completed'
+                    FROM unnest($1::uuid[], $2::uuid[], $3::text[], $4::int[])
+                         AS v(id, user_id, ket_qua, diem)
+                    WHERE v.ket_qua = 'approved'
+                    """,
+                    ids, user_ids, verdicts, points
+                )
+                
+                await conn.execute(
+                    """
+                    UPDATE users u
+                    SET diem_tich_luy = u.diem_tich_luy + v.total
+                    FROM (
+                        SELECT user_id, SUM(diem)::int AS total
+                        FROM unnest($1::uuid[], $2::int[]) AS t(user_id, diem)
+                        GROUP BY user_id
+                    ) v
+                    WHERE u.id = v.user_id AND v.total > 0
+                    """,
+                    user_ids, points
+                )
+                for user_id in set(user_ids):
+                    user_cache.invalidate(user_id)
+                
+                await conn.execute(
+                    """
+                    INSERT INTO thong_bao (id, id_nguoi_gui, id_nguoi_nhan, noi_dung, loai_thong_bao)
+                    SELECT uuid_generate_v4(), $5::uuid, v.user_id,
+                           CASE WHEN v.ket_qua = 'approved'
+                                THEN 'Hồ sơ nộp thuốc của bạn đã được duyệt. Bạn nhận được ' || v.diem || ' điểm!'
+                                ELSE 'Hồ sơ nộp thuốc của bạn đã bị từ chối. Lý do: ' || COALESCE(v.ghi_chu, 'Không đạt tiêu chuẩn')
+                           END,
+                           'SUBMISSION'
+                    FROM unnest($1::uuid[], $2::text[], $3::text[], $4::int[])
+                         AS v(user_id, ket_qua, ghi_chu, diem)
+                    """,
+                    user_ids, verdicts, notes, points, current_user['id']
+                )
+    
+    processed = {str(sid): (verdict, awarded) for sid, verdict, awarded in zip(ids, verdicts, points)}
+    report = []
+    for item in items:
+        key = item.submission_id
+        if key in results:
+            report.append({"submission_id": key, **results[key]})
+            continue
+        normalized = str(UUID(key))
+        if normalized in processed:
+            verdict, awarded = processed[normalized]
+            report.append({
+                "submission_id": key,
+                "ok": True,
+                "status": verdict,
+                "points_awarded": awarded,
+            })
+        else:
+            report.append({
+                "submission_id": key,
+                "ok": False,
+                "error": "Hồ sơ không tồn tại, đã được xử lý hoặc đang được người khác duyệt",
+            })
+    
+    return {
+        "message": f"Đã xử lý {len(processed)}/{len(items)} hồ sơ",
+        "processed": len(processed),
+        "results": report,
+    }
+
 @router.get("/statistics/overview")
 async def get_approval_statistics(current_user: dict = Depends(get_current_user)):
     """Get approval statistics (Admin/CTV only)"""
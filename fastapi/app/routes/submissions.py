@@ -1,16 +1,26 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
 from ..models import (
-    Submission, SubmissionCreate, SubmissionUpdate, 
+    Submission, SubmissionCreate, SubmissionUpdate, SubmissionBatchCreate,
     EnrichedSubmission, ClassificationCreate
 )
 from ..database import get_db_connection
 from ..auth import get_current_user, role_rank, require_reviewer
+from ..catalog import catalog
+from ..user_cache import user_cache
 from uuid import uuid4
 from datetime import datetime, date
 from typing import Optional
+import os
+import asyncpg
 
 router = APIRouter()
 
+# Maximum number of items accepted by a single batch intake request
+MAX_BATCH_ITEMS = int(os.getenv("SUBMISSION_BATCH_MAX_ITEMS", "100"))
+
+# Values of the canonical ho_so_xu_ly.trang_thai column
+SUBMISSION_REVIEW_STATUSES = ("PENDING", "APPROVED", "REJECTED")
+
 def serialize_dates(row_dict: dict) -> dict:
     """Convert date objects to strings for JSON serialization"""
     result = dict(row_dict)
@@ -20,6 +30,36 @@ def serialize_dates(row_dict: dict) -> dict:
         result['thoi_gian_xu_ly'] = result['thoi_gian_xu_ly'].isoformat()
     return result
 
+def parse_expiry_date(value) -> Optional[date]:
+    """Parse 'YYYY-MM-DD' expiry date strings into date objects"""
+    if not value:
+        return None
+    if not isinstance(value, str):
+        return value
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        print(f"[SUBMISSIONS] Invalid date format: {value}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid date format. Expected YYYY-MM-DD, got: {value}"
+        )
+
+async def notify_admins(conn, sender: dict, message: str) -> str:
+    """Send one SYSTEM notification to every ADMIN (not CONGTACVIEN) in a single statement"""
+    return await conn.execute(
+        """
+        INSERT INTO thong_bao 
+        (id, id_nguoi_gui, id_nguoi_nhan, noi_dung, loai_thong_bao, ngay_tao, da_xem)
+        SELECT uuid_generate_v4(), $1::uuid, id, $2::text, 'SYSTEM', $3::timestamptz, 0
+        FROM users
+        WHERE role = 'ADMIN'
+        """,
+        sender['id'],
+        message,
+        datetime.utcnow()
+    )
+
 @router.get("", response_model=list[Submission])
 async def list_submissions(
     current_user: dict = Depends(get_current_user)
@@ -47,44 +87,50 @@ async def list_submissions(
 @router.get("/enriched", response_model=list[EnrichedSubmission])
 async def list_enriched_submissions(
     mine: Optional[int] = Query(0),
+    status_filter: Optional[str] = Query(None, alias="status"),
     current_user: dict = Depends(get_current_user)
 ):
     """List enriched submissions with medicine and pharmacy details"""
     print(f"[SUBMISSIONS] list_enriched_submissions called by user: {current_user['ho_ten']}, mine={mine}")
+    
+    conditions = []
+    params = []
+    if status_filter:
+        status_filter = status_filter.upper()
+        if status_filter not in SUBMISSION_REVIEW_STATUSES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid status. Expected one of {', '.join(SUBMISSION_REVIEW_STATUSES)}"
+            )
+        params.append(status_filter)
+        conditions.append(f"hs.trang_thai = ${len(params)}")
+    
     async with get_db_connection() as conn:
         # Determine which submissions to fetch
         if role_rank(current_user['role']) >= 2 and mine != 1:
             # Admin or Collaborator - see all
             print("[SUBMISSIONS] Fetching all enriched submissions (admin/collaborator)")
-            submissions = await conn.fetch(
-                """
-                SELECT hs.*, 
-                       lt.ten_hoat_chat, lt.thuong_hieu, lt.dang_bao_che,
-                       nt.id as pharmacy_id, nt.ten_nha_thuoc as pharmacy_name, 
-                       nt.dia_chi as pharmacy_address, nt.vi_do as lat, nt.kinh_do as lng
-                FROM ho_so_xu_ly hs
-                LEFT JOIN loai_thuoc lt ON hs.id_loai_thuoc = lt.id
-                LEFT JOIN nha_thuoc nt ON hs.id_nha_thuoc = nt.id
-                ORDER BY hs.thoi_gian_xu_ly DESC
-                """
-            )
         else:
             # Regular user or mine=1 - only their own
             print(f"[SUBMISSIONS] Fetching enriched submissions for user: {current_user['id']}")
-            submissions = await conn.fetch(
-                """
-                SELECT hs.*, 
-                       lt.ten_hoat_chat, lt.thuong_hieu, lt.dang_bao_che,
-                       nt.id as pharmacy_id, nt.ten_nha_thuoc as pharmacy_name, 
-                       nt.dia_chi as pharmacy_address, nt.vi_do as lat, nt.kinh_do as lng
-                FROM ho_so_xu_ly hs
-                LEFT JOIN loai_thuoc lt ON hs.id_loai_thuoc = lt.id
-                LEFT JOIN nha_thuoc nt ON hs.id_nha_thuoc = nt.id
-                WHERE hs.id_nguoi_nop = $1
-                ORDER BY hs.thoi_gian_xu_ly DESC
-                """,
-                current_user['id']
-            )
+            params.append(current_user['id'])
+            conditions.append(f"hs.id_nguoi_nop = ${len(params)}")
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        submissions = await conn.fetch(
+            f"""
+            SELECT hs.*, 
+                   lt.ten_hoat_chat, lt.thuong_hieu, lt.dang_bao_che,
+                   nt.id as pharmacy_id, nt.ten_nha_thuoc as pharmacy_name, 
+                   nt.dia_chi as pharmacy_address, nt.vi_do as lat, nt.kinh_do as lng
+            FROM ho_so_xu_ly hs
+            LEFT JOIN loai_thuoc lt ON hs.id_loai_thuoc = lt.id
+            LEFT JOIN nha_thuoc nt ON hs.id_nha_thuoc = nt.id
+            {where}
+            ORDER BY hs.thoi_gian_xu_ly DESC
+            """,
+            *params
+        )
         
         print(f"[SUBMISSIONS] Found {len(submissions)} enriched submissions")
         
@@ -100,14 +146,8 @@ async def list_enriched_submissions(
                 continue
             seen_ids.add(sub['id'])
             
-            # Determine status
-            result_lower = str(sub['ket_qua']).lower()
-            if 'pending' in result_lower or 'cho' in result_lower:
-                status = "PENDING"
-            elif any(x in result_lower for x in ['tai', 'su_dung', 'approved', 'dat']):
-                status = "APPROVED"
-            else:
-                status = "REJECTED"
+            # Canonical status maintained by Postgres from ket_qua
+            status = sub['trang_thai']
             
             # Get points for this submission
             sub_id = str(sub['id'])
@@ -177,97 +217,158 @@ async def create_submission(
     print(f"[SUBMISSIONS] create_submission called by user: {current_user['ho_ten']}")
     print(f"[SUBMISSIONS] Submission data: {submission.dict()}")
     
-    async with get_db_connection() as conn:
-        # Validate foreign keys
-        medicine = await conn.fetchrow(
-            "SELECT id FROM loai_thuoc WHERE id = $1",
-            submission.id_loai_thuoc
+    # Validate foreign keys against the in-memory reference catalog
+    if not await catalog.contains("loai_thuoc", submission.id_loai_thuoc):
+        print(f"[SUBMISSIONS] Medicine type not found: {submission.id_loai_thuoc}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Medicine type not found"
         )
-        if not medicine:
-            print(f"[SUBMISSIONS] Medicine type not found: {submission.id_loai_thuoc}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Medicine type not found"
-            )
-        
-        pharmacy = await conn.fetchrow(
-            "SELECT id FROM nha_thuoc WHERE id = $1",
-            submission.id_nha_thuoc
+    
+    if not await catalog.contains("nha_thuoc", submission.id_nha_thuoc):
+        print(f"[SUBMISSIONS] Pharmacy not found: {submission.id_nha_thuoc}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pharmacy not found"
         )
-        if not pharmacy:
-            print(f"[SUBMISSIONS] Pharmacy not found: {submission.id_nha_thuoc}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Pharmacy not found"
-            )
-        
+    
+    async with get_db_connection() as conn:
         print("[SUBMISSIONS] Validation passed, creating submission...")
         
         # Parse expiry date if provided
-        expiry_date = None
-        if submission.han_dung:
-            try:
-                # Parse string date 'YYYY-MM-DD' to date object
-                if isinstance(submission.han_dung, str):
-                    expiry_date = datetime.strptime(submission.han_dung, '%Y-%m-%d').date()
-                else:
-                    expiry_date = submission.han_dung
-                print(f"[SUBMISSIONS] Parsed expiry date: {expiry_date}")
-            except ValueError as e:
-                print(f"[SUBMISSIONS] Invalid date format: {submission.han_dung}")
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Invalid date format. Expected YYYY-MM-DD, got: {submission.han_dung}"
-                )
+        expiry_date = parse_expiry_date(submission.han_dung)
         
         # Create submission
         submission_id = uuid4()
-        row = await conn.fetchrow(
-            """
-            INSERT INTO ho_so_xu_ly 
-            (id, id_nguoi_nop, id_nha_thuoc, id_loai_thuoc, so_luong, don_vi_tinh, 
-             han_dung, ket_qua, duong_dan_chung_nhan, ghi_chu, thoi_gian_xu_ly)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, 'pending', $8, $9, $10)
-            RETURNING *
-            """,
-            submission_id,
-            current_user['id'],
-            submission.id_nha_thuoc,
-            submission.id_loai_thuoc,
-            submission.so_luong,
-            submission.don_vi_tinh,
-            expiry_date,
-            submission.duong_dan_chung_nhan,
-            submission.ghi_chu,
-            datetime.utcnow()
-        )
-        
-        print(f"[SUBMISSIONS] Submission created with id: {submission_id}")
-        
-        # Notify ADMIN only (not CONGTACVIEN)
-        reviewers = await conn.fetch(
-            "SELECT id FROM users WHERE role = 'ADMIN'"
-        )
-        
-        print(f"[SUBMISSIONS] Notifying {len(reviewers)} admin(s)")
-        
-        for reviewer in reviewers:
-            await conn.execute(
+        try:
+            row = await conn.fetchrow(
                 """
-                INSERT INTO thong_bao 
-                (id, id_nguoi_gui, id_nguoi_nhan, noi_dung, loai_thong_bao, ngay_tao, da_xem)
-                VALUES ($1, $2, $3, $4, 'SYSTEM', $5, 0)
+                INSERT INTO ho_so_xu_ly 
+                (id, id_nguoi_nop, id_nha_thuoc, id_loai_thuoc, so_luong, don_vi_tinh, 
+                 han_dung, ket_qua, duong_dan_chung_nhan, ghi_chu, thoi_gian_xu_ly)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, 'pending', $8, $9, $10)
+                RETURNING *
                 """,
-                uuid4(),
+                submission_id,
                 current_user['id'],
-                reviewer['id'],
-                f"Hồ sơ mới cần duyệt từ {current_user['ho_ten']}",
+                submission.id_nha_thuoc,
+                submission.id_loai_thuoc,
+                submission.so_luong,
+                submission.don_vi_tinh,
+                expiry_date,
+                submission.duong_dan_chung_nhan,
+                submission.ghi_chu,
                 datetime.utcnow()
             )
+        except asyncpg.ForeignKeyViolationError:
+            # Reference row deleted after the catalog check
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Medicine type or pharmacy not found"
+            )
+        
+        print(f"[SUBMISSIONS] Submission created with id: {submission_id}")
+        
+        # Notify ADMIN only (not CONGTACVIEN)
+        result = await notify_admins(
+            conn,
+            current_user,
+            f"Hồ sơ mới cần duyệt từ {current_user['ho_ten']}"
+        )
+        print(f"[SUBMISSIONS] Admin notifications: {result}")
         
         print(f"[SUBMISSIONS] Submission created successfully")
         return serialize_dates(row)
 
+@router.post("/batch", response_model=list[Submission], status_code=status.HTTP_201_CREATED)
+async def create_submissions_batch(
+    batch: SubmissionBatchCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Create many submissions at once (pharmacy drop-off intake)"""
+    items = batch.items
+    print(f"[SUBMISSIONS] create_submissions_batch called by user: {current_user['ho_ten']}, items={len(items)}")
+    
+    if not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch must contain at least one item"
+        )
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch too large. Maximum {MAX_BATCH_ITEMS} items per request"
+        )
+    
+    expiry_dates = [parse_expiry_date(item.han_dung) for item in items]
+    
+    # Validate all foreign keys against the in-memory reference catalog
+    missing_medicines = await catalog.missing("loai_thuoc", (item.id_loai_thuoc for item in items))
+    missing_pharmacies = await catalog.missing("nha_thuoc", (item.id_nha_thuoc for item in items))
+    
+    errors = []
+    for index, item in enumerate(items):
+        if item.id_loai_thuoc in missing_medicines:
+            errors.append({"index": index, "detail": "Medicine type not found"})
+        if item.id_nha_thuoc in missing_pharmacies:
+            errors.append({"index": index, "detail": "Pharmacy not found"})
+    if errors:
+        print(f"[SUBMISSIONS] Batch validation failed: {errors}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=errors
+        )
+    
+    submission_ids = [uuid4() for _ in items]
+    
+    async with get_db_connection() as conn:
+        try:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    """
+                    INSERT INTO ho_so_xu_ly 
+                    (id, id_nguoi_nop, id_nha_thuoc, id_loai_thuoc, so_luong, don_vi_tinh, 
+                     han_dung, ket_qua, duong_dan_chung_nhan, ghi_chu, thoi_gian_xu_ly)
+                    SELECT v.id, $1::uuid, v.id_nha_thuoc, v.id_loai_thuoc, v.so_luong, v.don_vi_tinh,
+                           v.han_dung, 'pending', v.duong_dan_chung_nhan, v.ghi_chu, $10::timestamptz
+                    FROM unnest(
+                        $2::uuid[], $3::uuid[], $4::uuid[], $5::int[],
+                        $6::text[], $7::date[], $8::text[], $9::text[]
+                    ) AS v(id, id_nha_thuoc, id_loai_thuoc, so_luong,
+                           don_vi_tinh, han_dung, duong_dan_chung_nhan, ghi_chu)
+                    RETURNING *
+                    """,
+                    current_user['id'],
+                    submission_ids,
+                    [item.id_nha_thuoc for item in items],
+                    [item.id_loai_thuoc for item in items],
+                    [item.so_luong for item in items],
+                    [item.don_vi_tinh for item in items],
+                    expiry_dates,
+                    [item.duong_dan_chung_nhan for item in items],
+                    [item.ghi_chu for item in items],
+                    datetime.utcnow()
+                )
+            
+                # One aggregated notification per admin for the whole batch
+                await notify_admins(
+                    conn,
+                    current_user,
+                    f"{len(rows)} hồ sơ mới cần duyệt từ {current_user['ho_ten']}"
+                )
+        except asyncpg.ForeignKeyViolationError:
+            # Reference row deleted after the catalog check
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Medicine type or pharmacy not found"
+            )
+        
+        print(f"[SUBMISSIONS] Batch created {len(rows)} submissions")
+        
+        # RETURNING order is not guaranteed, restore request order
+        rows_by_id = {row['id']: row for row in rows}
+        return [serialize_dates(rows_by_id[sid]) for sid in submission_ids]
+
 @router.put("/{submission_id}", response_model=Submission)
 async def update_submission(
     submission_id: str,
@@ -448,6 +549,7 @@ async def classify_submission(
                 points,
                 submission['id_nguoi_nop']
             )
+            user_cache.invalidate(submission['id_nguoi_nop'])
         
         # Notify user
         await conn.execute(
@@ -4,7 +4,8 @@ Stores files locally in /app/uploads directory
 """
 from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
 from fastapi.responses import StreamingResponse, FileResponse
-from ..auth import get_current_user
+from ..auth import get_current_claims
+from ..telemetry import upload_bytes
 from typing import List
 import os
 from uuid import uuid4
@@ -50,6 +51,7 @@ async def save_upload_file(file: UploadFile, folder: str = "images") -> str:
         
         with open(file_path, "wb") as f:
             f.write(content)
+        upload_bytes.inc(folder, amount=len(content))
         
         # Return URL path (relative to API)
         return f"/api/uploads/{folder}/{unique_filename}"
@@ -62,7 +64,7 @@ async def save_upload_file(file: UploadFile, folder: str = "images") -> str:
 @router.post("/images")
 async def upload_images(
     files: List[UploadFile] = File(...),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """
     Upload forum post/comment images
@@ -107,7 +109,7 @@ async def upload_images(
 @router.post("/uploads/certificate")
 async def upload_certificate(
     file: UploadFile = File(...),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """
     Upload certificate for medicine submission
@@ -149,7 +151,7 @@ async def upload_certificate(
 @router.post("/files")
 async def upload_files(
     files: List[UploadFile] = File(...),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_claims)
 ):
     """
     Upload forum post attachments (PDF, Word, Excel)
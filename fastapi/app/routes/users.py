@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, status, Depends, Body
 from ..models import User
 from ..database import get_db_connection
 from ..auth import get_current_user, require_admin
+from ..user_cache import user_cache
 from typing import Optional
 from pydantic import BaseModel
 
@@ -72,6 +73,7 @@ async def update_user(
         """
         
         updated = await conn.fetchrow(query, *params)
+        user_cache.invalidate(user_id)
         return dict(updated)
 
 @router.delete("/{user_id}")
@@ -87,6 +89,7 @@ async def delete_user(
             "DELETE FROM users WHERE id = $1",
             user_id
         )
+        user_cache.invalidate(user_id)
         
         if result == "DELETE 0":
             raise HTTPException(
@@ -165,6 +168,7 @@ async def update_my_profile(
         """
         
         updated = await conn.fetchrow(query, *params)
+        user_cache.invalidate(current_user['id'])
         return dict(updated)
 
 
@@ -178,6 +182,7 @@ async def delete_my_account(current_user: dict = Depends(get_current_user)):
             "DELETE FROM users WHERE id = $1",
             current_user["id"]
         )
+        user_cache.invalidate(current_user["id"])
         
         if result == "DELETE 0":
             raise HTTPException(
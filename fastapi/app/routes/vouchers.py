@@ -2,14 +2,18 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from ..models import Voucher, VoucherCreate
 from ..database import get_db_connection
 from ..auth import get_current_user, require_admin
+from ..user_cache import user_cache
+from ..cache import shared_cache
 from uuid import uuid4
 from datetime import datetime, date
 
 router = APIRouter()
 
-@router.get("", response_model=list[Voucher])
-async def list_vouchers(current_user: dict = Depends(get_current_user)):
-    """List all active vouchers"""
+# Active voucher listing, shared between workers; dropped after every voucher change
+voucher_cache = shared_cache.namespace("vouchers", ttl=60)
+
+
+async def load_active_vouchers() -> list:
     async with get_db_connection() as conn:
         rows = await conn.fetch(
             """
@@ -30,6 +34,11 @@ async def list_vouchers(current_user: dict = Depends(get_current_user)):
         # Pydantic will handle the conversion from date to datetime
         return [dict(row) for row in rows]
 
+@router.get("", response_model=list[Voucher])
+async def list_vouchers(current_user: dict = Depends(get_current_user)):
+    """List all active vouchers"""
+    return await voucher_cache.get_or_load("active", load_active_vouchers)
+
 @router.post("", response_model=Voucher, status_code=status.HTTP_201_CREATED)
 async def create_voucher(
     voucher: VoucherCreate,
@@ -55,6 +64,7 @@ async def create_voucher(
             datetime.utcnow(),
             voucher.ngay_het_han
         )
+        await voucher_cache.invalidate_all()
         return dict(row)
 
 @router.put("/{voucher_id}", response_model=Voucher)
@@ -93,6 +103,7 @@ async def update_voucher(
             voucher.ngay_het_han,
             voucher_id
         )
+        await voucher_cache.invalidate_all()
         return dict(row)
 
 @router.delete("/{voucher_id}")
@@ -115,6 +126,7 @@ async def delete_voucher(
                 detail="Voucher not found"
             )
         
+        await voucher_cache.invalidate_all()
         return {"ok": True}
 
 @router.post("/{voucher_id}/redeem")
@@ -163,6 +175,7 @@ async def redeem_voucher(
                 voucher['diem_can_thiet'],
                 current_user['id']
             )
+            user_cache.invalidate(current_user['id'])
             
             # Decrease voucher quantity
             await conn.execute(
@@ -205,13 +218,17 @@ async def redeem_voucher(
                 current_user['id']
             )
             
-            return {
+            result = {
                 "message": "Đổi voucher thành công",
                 "ok": True,
                 "new_points": updated_user['diem_tich_luy'],
                 "points_deducted": voucher['diem_can_thiet']
             }
 
+    # Remaining quantity changed; invalidate after the transaction has committed
+    await voucher_cache.invalidate_all()
+    return result
+
 @router.get("/stats")
 async def voucher_stats(current_user: dict = Depends(get_current_user)):
     """Get voucher statistics"""
@@ -3,10 +3,14 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 from typing import Dict, Set
 from uuid import UUID
 import json
+import math
+import time
 from datetime import datetime
 
 from ..database import get_db_connection
 from ..jwt_auth import decode_token
+from .chat import chatbot_rate_limit
+from ..telemetry import langgraph_call_duration, langgraph_call_errors
 
 router = APIRouter()
 
@@ -315,6 +319,16 @@ async def handle_chatbot_message(message_data: dict, user_id: str, user):
     if not content:
         return
     
+    wait = await chatbot_rate_limit.take(f"user:{user_id}")
+    if wait > 0:
+        await manager.send_personal_message({
+            "type": "error",
+            "code": "rate_limited",
+            "message": "Quá nhiều yêu cầu, vui lòng thử lại sau",
+            "retry_after": max(1, math.ceil(wait)),
+        }, user_id)
+        return
+    
     LANGGRAPH_URL = os.getenv("LANGGRAPH_URL", "http://langgraph:8000")
     
     async with get_db_connection() as conn:
@@ -335,6 +349,7 @@ async def handle_chatbot_message(message_data: dict, user_id: str, user):
         )
         
         # Call LangGraph
+        started = time.perf_counter()
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.post(
@@ -351,7 +366,11 @@ async def handle_chatbot_message(message_data: dict, user_id: str, user):
                 bot_text = bot_response_data.get("response", "Xin lỗi, tôi không thể trả lời lúc này.")
         except Exception as e:
             print(f"[WS] Error calling LangGraph: {e}")
+            reason = "timeout" if isinstance(e, httpx.TimeoutException) else "error"
+            langgraph_call_errors.inc("invoke", reason)
             bot_text = "Xin lỗi, dịch vụ chatbot tạm thời không khả dụng."
+        finally:
+            langgraph_call_duration.observe(time.perf_counter() - started, "invoke")
         
         # Save bot response
         bot_msg_row = await conn.fetchrow(
@@ -0,0 +1,121 @@
+"""
+Session housekeeping.
+
+Session-authenticated requests used to write `last_activity` on every call.
+They now only record the time in memory; a background task writes all touched
+sessions in one `UPDATE ... FROM unnest(...)` every
+SESSION_ACTIVITY_FLUSH_SECONDS. A second task periodically deletes expired and
+deactivated sessions in small batches.
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from uuid import UUID
+
+from .database import get_db_connection
+
+FLUSH_INTERVAL = float(os.getenv("SESSION_ACTIVITY_FLUSH_SECONDS", "5"))
+PURGE_INTERVAL = float(os.getenv("SESSION_PURGE_INTERVAL_SECONDS", "3600"))
+PURGE_BATCH_SIZE = int(os.getenv("SESSION_PURGE_BATCH_SIZE", "1000"))
+
+
+class SessionActivity:
+    """Coalesces last_activity updates per session between flushes"""
+
+    def __init__(self):
+        self._seen: Dict[UUID, datetime] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._purger: Optional[asyncio.Task] = None
+
+    def touch(self, session_id: UUID):
+        self._seen[session_id] = datetime.now(timezone.utc)
+
+    async def flush(self) -> int:
+        """Write the buffered activity times; returns the number of sessions written"""
+        if not self._seen:
+            return 0
+        batch, self._seen = self._seen, {}
+        # Sorted so concurrent flushes from other workers lock rows in the same order
+        ids = sorted(batch)
+        try:
+            async with get_db_connection() as conn:
+                await conn.execute(
+                    """
+                    UPDATE user_sessions s
+                    SET last_activity = GREATEST(s.last_activity, v.seen_at)
+                    FROM unnest($1::uuid[], $2::timestamptz[]) AS v(id, seen_at)
+                    WHERE s.id = v.id
+                    """,
+                    ids, [batch[session_id] for session_id in ids]
+                )
+        except Exception:
+            # Keep the newer of the unsaved and the freshly buffered times for the next flush
+            for session_id, seen_at in batch.items():
+                if self._seen.get(session_id, seen_at) <= seen_at:
+                    self._seen[session_id] = seen_at
+            raise
+        return len(ids)
+
+    async def purge(self) -> int:
+        """Delete expired and deactivated sessions in batches; returns the number deleted"""
+        deleted = 0
+        while True:
+            async with get_db_connection() as conn:
+                result = await conn.execute(
+                    """
+                    DELETE FROM user_sessions
+                    WHERE id IN (
+                        SELECT id FROM user_sessions
+                        WHERE expires_at < NOW() OR is_active = false
+                        LIMIT $1
+                    )
+                    """,
+                    PURGE_BATCH_SIZE
+                )
+            count = int(result.split()[-1])
+            deleted += count
+            if count < PURGE_BATCH_SIZE:
+                return deleted
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[SESSIONS] Activity flush failed: {e}")
+
+    async def _purge_loop(self):
+        while True:
+            try:
+                deleted = await self.purge()
+                if deleted:
+                    print(f"[SESSIONS] Purged {deleted} expired/inactive sessions")
+            except Exception as e:
+                print(f"[SESSIONS] Session purge failed: {e}")
+            await asyncio.sleep(PURGE_INTERVAL)
+
+    def start(self):
+        loop = asyncio.get_event_loop()
+        if self._flusher is None:
+            self._flusher = loop.create_task(self._flush_loop())
+        if self._purger is None and PURGE_INTERVAL > 0:
+            self._purger = loop.create_task(self._purge_loop())
+
+    async def stop(self):
+        for task in (self._flusher, self._purger):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._flusher = self._purger = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"[SESSIONS] Final activity flush failed: {e}")
+
+
+session_activity = SessionActivity()
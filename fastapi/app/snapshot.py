@@ -0,0 +1,108 @@
+"""
+Stale-while-revalidate snapshots of expensive read-only computations.
+
+A background task recomputes the value periodically and publishes it as an
+immutable snapshot. Readers get the last snapshot immediately; a snapshot older
+than `max_age` triggers one recompute in the background (single-flight) while
+the old value is still served. Readers only wait when nothing has been computed
+yet or the snapshot is older than `max_stale`.
+"""
+import asyncio
+import time
+from types import MappingProxyType
+from typing import Awaitable, Callable, Mapping, Optional
+
+
+class Snapshot:
+    """One published value with the time it was computed"""
+
+    __slots__ = ("value", "computed_at", "version")
+
+    def __init__(self, value: dict, version: int):
+        self.value: Mapping = MappingProxyType(dict(value))
+        self.computed_at = time.monotonic()
+        self.version = version
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.computed_at
+
+
+class SnapshotCache:
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], Awaitable[dict]],
+        refresh_interval: float,
+        max_age: float,
+        max_stale: float,
+    ):
+        self.name = name
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.max_stale = max_stale
+        self.snapshot: Optional[Snapshot] = None
+        self._version = 0
+        self._inflight: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def get(self) -> Snapshot:
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.age > self.max_stale:
+            return await self.refresh()
+        if snapshot.age > self.max_age:
+            self._start_refresh()
+        return snapshot
+
+    async def refresh(self) -> Snapshot:
+        """Recompute now, joining a recompute that is already running"""
+        task = self._start_refresh()
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            if self.snapshot is None:
+                raise
+            return self.snapshot
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.get_event_loop().create_task(self._load())
+            self._inflight.add_done_callback(self._on_loaded)
+        return self._inflight
+
+    def _on_loaded(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            print(f"[SNAPSHOT] {self.name}: refresh failed: {task.exception()}")
+
+    async def _load(self) -> Snapshot:
+        started = time.monotonic()
+        value = await self.loader()
+        self._version += 1
+        self.snapshot = Snapshot(value, self._version)
+        print(f"[SNAPSHOT] {self.name}: computed v{self._version} in {(time.monotonic() - started) * 1000:.0f}ms")
+        return self.snapshot
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                pass  # Already logged by _on_loaded
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Start the background refresher (computes the first snapshot right away)"""
+        if self._refresher is None:
+            self._refresher = asyncio.get_event_loop().create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in (self._refresher, self._inflight):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._refresher = None
+        self._inflight = None
@@ -0,0 +1,335 @@
+"""
+Process-local metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain in-memory structures updated on the
+event loop (no locks needed); `render()` turns the registry into the text
+served by `GET /internal/metrics`. Every uvicorn worker keeps its own registry,
+so scrape each worker (or run one worker per container) and aggregate in
+Prometheus.
+"""
+import math
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; covers fast cached reads up to slow chatbot calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Tuple) -> LabelValues:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        return tuple(str(label) for label in labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Settable gauge, or a callback gauge read at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        collect: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.collect = collect
+
+    def set(self, value: float, *labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, *labels, amount: float = 1):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self) -> List[str]:
+        values = self.values
+        if self.collect:
+            try:
+                values = self.collect()
+            except Exception as e:
+                print(f"[TELEMETRY] Gauge {self.name} collection failed: {e}")
+                values = {}
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self.values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels):
+        key = self._key(labels)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        bounds = self.buckets + (math.inf,)
+        for key, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}"
+                )
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labels))
+
+
+def gauge(name: str, documentation: str, labels: Iterable[str] = (), collect=None) -> Gauge:
+    return registry.register(Gauge(name, documentation, labels, collect=collect))
+
+
+def histogram(name: str, documentation: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labels, buckets=buckets))
+
+
+# ============================================
+# APPLICATION METRICS
+# ============================================
+
+http_request_duration = histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+http_requests_in_flight = gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served",
+)
+db_pool_acquire_wait = histogram(
+    "db_pool_acquire_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+langgraph_call_duration = histogram(
+    "langgraph_call_duration_seconds",
+    "Latency of calls to the LangGraph chatbot service",
+    ("endpoint",),
+)
+langgraph_call_errors = counter(
+    "langgraph_call_errors_total",
+    "Failed calls to the LangGraph chatbot service",
+    ("endpoint", "reason"),
+)
+upload_bytes = counter(
+    "upload_bytes_total",
+    "Bytes of uploaded files stored, by folder",
+    ("folder",),
+)
+
+
+def _pool_stats() -> Dict[LabelValues, float]:
+    from .database import _pool
+
+    if _pool is None:
+        return {}
+    return {
+        ("size",): _pool.get_size(),
+        ("idle",): _pool.get_idle_size(),
+        ("max",): _pool.get_max_size(),
+    }
+
+
+def _websocket_stats() -> Dict[LabelValues, float]:
+    from .routes.websocket import manager
+
+    connections = manager.active_connections
+    return {
+        ("connections",): sum(len(sockets) for sockets in connections.values()),
+        ("users",): len(connections),
+    }
+
+
+db_pool_connections = gauge(
+    "db_pool_connections",
+    "asyncpg pool connections (size, idle, max)",
+    ("state",),
+    collect=_pool_stats,
+)
+websocket_connections = gauge(
+    "websocket_connections",
+    "Open chat WebSocket connections and distinct connected users",
+    ("kind",),
+    collect=_websocket_stats,
+)
+
+
+def route_template(scope) -> str:
+    """Full path template of the matched route (e.g. /api/users/{user_id}), or 'unmatched'"""
+    # Routes from include_router() only know their own path; FastAPI records the
+    # prefixed template in the per-request route context
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    if context is not None and getattr(context, "path", None):
+        return context.path
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+# ASGI scope of the request being served, for attributing work to its route
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def current_scope() -> Optional[dict]:
+    """ASGI scope of the current request, or None outside a request"""
+    return _request_scope.get()
+
+
+def current_route() -> str:
+    """Route template of the current request, or 'background' outside a request"""
+    scope = _request_scope.get()
+    return route_template(scope) if scope is not None else "background"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording in-flight requests and latency per route template.
+    Also publishes the request scope so work done for it can name its route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.app(scope, receive, send)
+            return
+        scope_token = _request_scope.set(scope)
+        try:
+            if scope["type"] == "http":
+                await self._observe_http(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(scope_token)
+
+    async def _observe_http(self, scope, receive, send):
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            # Label by template, not raw path, so ids don't explode cardinality
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                route_template(scope),
+                str(status_code),
+            )
@@ -0,0 +1,132 @@
+"""
+Per-route-class statement timeouts and cancellation of abandoned requests.
+
+Connections acquired while serving a request run with the statement timeout of
+the request's route class (see admission.route_class), so a runaway query is
+stopped by Postgres instead of holding a pool connection until the client-side
+command_timeout. Pool connections open with the reads timeout, so only other
+classes, and background work (no timeout), need a `SET` on acquire; the pool
+runs RESET ALL on release, which restores the reads timeout for the next user.
+A query stopped this way returns 504 and is counted.
+
+DisconnectCancellationMiddleware cancels GET/HEAD handlers whose client has
+disconnected before the response was complete; asyncpg then cancels the
+statement in flight on the server. Writes are always run to completion.
+"""
+import asyncio
+import os
+
+import asyncpg
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from .admission import route_class
+from .telemetry import counter, current_scope
+
+# Route class -> statement timeout in ms (0 keeps the server default)
+DEFAULT_STATEMENT_TIMEOUTS = {
+    "auth": 5000,
+    "reads": 10000,
+    "writes": 15000,
+    "chatbot": 10000,
+    "admin_analytics": 30000,
+}
+
+STATEMENT_TIMEOUTS = {
+    name: int(os.getenv(f"DB_STATEMENT_TIMEOUT_{name.upper()}_MS", default))
+    for name, default in DEFAULT_STATEMENT_TIMEOUTS.items()
+}
+
+# Session default of pool connections: most requests are reads
+POOL_STATEMENT_TIMEOUT = STATEMENT_TIMEOUTS["reads"]
+
+statement_timeouts = counter(
+    "db_statement_timeouts_total",
+    "Statements stopped by the route class statement timeout",
+    ("route_class",),
+)
+requests_cancelled = counter(
+    "http_requests_cancelled_total",
+    "Requests cancelled because the client disconnected",
+    ("route_class",),
+)
+
+
+def statement_timeout_ms() -> int:
+    """Statement timeout for the current request; 0 (none) outside a request"""
+    scope = current_scope()
+    name = route_class(scope) if scope is not None else None
+    return STATEMENT_TIMEOUTS.get(name) or 0
+
+
+async def apply_statement_timeout(connection: asyncpg.Connection):
+    """Pool `setup` hook: adjust the timeout when it differs from the session default"""
+    timeout = statement_timeout_ms()
+    if timeout != POOL_STATEMENT_TIMEOUT:
+        await connection.execute(f"SET statement_timeout = {int(timeout)}")
+
+
+async def statement_timeout_handler(request: Request, exc: asyncpg.QueryCanceledError):
+    """Exception handler turning a statement timeout into 504"""
+    if "statement timeout" not in str(exc):
+        raise exc
+    name = route_class(request.scope) or "other"
+    statement_timeouts.inc(name)
+    print(f"[DB] Statement timeout ({name}) on {request.method} {request.url.path}")
+    return JSONResponse(
+        {"detail": "Yêu cầu xử lý quá lâu, vui lòng thử lại sau"},
+        status_code=504,
+    )
+
+
+class DisconnectCancellationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        messages: asyncio.Queue = asyncio.Queue()
+        response_started = response_complete = False
+
+        async def send_wrapper(message):
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                response_complete = True
+            await send(message)
+
+        async def watch_disconnect():
+            # The handler reads its messages from the queue; we keep reading so a
+            # disconnect is seen while it is still working
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        handler = asyncio.ensure_future(self.app(scope, messages.get, send_wrapper))
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await asyncio.wait({handler, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if handler.done() or response_complete or watcher.exception() is not None:
+                await handler
+                return
+
+            requests_cancelled.inc(route_class(scope) or "other")
+            handler.cancel()
+            try:
+                await handler
+            except asyncio.CancelledError:
+                pass
+            if not response_started:
+                # Nobody receives this; it records the request as 499 in the access metrics
+                await send({"type": "http.response.start", "status": 499, "headers": []})
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+            if not handler.done():
+                handler.cancel()
@@ -0,0 +1,72 @@
+"""
+Short-lived cache of authenticated users for get_current_user / get_current_user_jwt.
+
+Entries live for USER_CACHE_TTL_SECONDS at most (0 disables the cache), so a
+missed invalidation can only serve a stale profile for that long. Handlers
+that change a user call `invalidate()` for an immediate local drop; a trigger
+on `users` publishes every committed change as a `user` event on the
+invalidation bus so that every worker (including this one, after commit) drops
+its copy too.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .invalidation import invalidation_bus
+
+USER_NAMESPACE = "user"
+
+TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+
+class UserCache:
+    def __init__(self, ttl: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Bumped on every invalidation; a load that raced one is not stored
+        self.generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return dict(user)
+
+    def put(self, user_id: str, user: dict, generation: int):
+        """Store a user loaded while `generation` was current"""
+        if not self.enabled or generation != self.generation:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl, dict(user))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id) -> None:
+        self.generation += 1
+        self._entries.pop(str(user_id), None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+
+    def on_event(self, user_id: Optional[str]):
+        if user_id is None:
+            self.clear()
+        else:
+            self.invalidate(user_id)
+
+
+user_cache = UserCache()
+invalidation_bus.subscribe(USER_NAMESPACE, user_cache.on_event)
@@ -0,0 +1,83 @@
+"""
+Per-user dashboard counters.
+
+`user_stats` is maintained by triggers on ho_so_xu_ly, voucher_usage and
+diem_thuong inside the writing transaction. A periodic reconciliation job
+recomputes the counters from the source tables and fixes any drift (e.g. rows
+changed while the triggers were disabled for a bulk load). It locks only the
+rows of drifted users, and runs in one session at a time: workers whose turn
+overlaps a run in progress skip it.
+
+Run a reconciliation by hand with:
+
+    python -m app.user_stats reconcile
+"""
+import asyncio
+import os
+import sys
+from typing import Optional
+
+import asyncpg
+
+from .database import DATABASE_URL, get_db_connection
+
+RECONCILE_INTERVAL = float(os.getenv("USER_STATS_RECONCILE_SECONDS", "3600"))
+
+_reconciler: Optional[asyncio.Task] = None
+
+
+async def reconcile(conn) -> Optional[int]:
+    """Fix drifted counters; returns the number of users corrected, or None if already running"""
+    async with conn.transaction():
+        return await conn.fetchval("SELECT reconcile_user_stats()")
+
+
+async def _reconcile_loop():
+    while True:
+        await asyncio.sleep(RECONCILE_INTERVAL)
+        try:
+            async with get_db_connection() as conn:
+                changed = await reconcile(conn)
+            if changed is None:
+                print("[USER_STATS] Reconciliation already running elsewhere, skipped")
+            elif changed:
+                print(f"[USER_STATS] Reconciled counters for {changed} users")
+        except Exception as e:
+            print(f"[USER_STATS] Reconciliation failed: {e}")
+
+
+def start_reconciler():
+    global _reconciler
+    if _reconciler is None and RECONCILE_INTERVAL > 0:
+        _reconciler = asyncio.get_event_loop().create_task(_reconcile_loop())
+
+
+async def stop_reconciler():
+    global _reconciler
+    if _reconciler:
+        _reconciler.cancel()
+        try:
+            await _reconciler
+        except asyncio.CancelledError:
+            pass
+        _reconciler = None
+
+
+async def main(argv) -> int:
+    if argv[1:] != ["reconcile"]:
+        print("Usage: python -m app.user_stats reconcile")
+        return 2
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        changed = await reconcile(conn)
+    finally:
+        await conn.close()
+    if changed is None:
+        print("[USER_STATS] Reconciliation already running elsewhere")
+        return 1
+    print(f"[USER_STATS] Reconciled counters for {changed} users")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv)))
@@ -1,12 +1,32 @@
 """
 Password hashing utilities using bcrypt
+
+bcrypt is deliberately slow, so request handlers use the async variants, which
+run it on a small dedicated thread pool (bcrypt releases the GIL) instead of
+blocking the event loop. The number of hashes running or queued is capped;
+beyond PASSWORD_HASH_QUEUE_LIMIT callers get a 503 right away rather than
+piling up behind a login burst.
 """
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
+from fastapi import HTTPException, status
+
+# Work factor for new hashes; existing hashes with another cost are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
 
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -14,3 +34,49 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     """Verify a password against a hash"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True if the hash was made with a different cost than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+async def _run(func, *args):
+    global _pending
+    if _pending >= HASH_QUEUE_LIMIT:
+        print(f"[PASSWORD] Hash queue full ({_pending} pending), rejecting request")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Máy chủ đang bận, vui lòng thử lại sau",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run(verify_password, password, hashed)
+
+
+async def benchmark() -> float:
+    """Time one hash at the configured cost and log the resulting login capacity"""
+    started = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(_executor, hash_password, "benchmark-password")
+    elapsed = time.perf_counter() - started
+    print(
+        f"[PASSWORD] bcrypt cost {BCRYPT_ROUNDS}: {elapsed * 1000:.0f}ms per hash, "
+        f"{HASH_WORKERS} workers -> ~{HASH_WORKERS / elapsed:.0f} logins/s per process"
+    )
+    if elapsed > 1.0:
+        print(f"[PASSWORD] Warning: bcrypt cost {BCRYPT_ROUNDS} is slow on this host, consider lowering BCRYPT_ROUNDS")
+    return elapsed
@@ -12,6 +12,7 @@ CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
 CREATE TYPE user_role AS ENUM ('ADMIN', 'CONGTACVIEN', 'USER');
 CREATE TYPE submission_status AS ENUM ('pending', 'approved', 'rejected', 'returned_to_pharmacy', 'recalled');
+CREATE TYPE submission_review_status AS ENUM ('PENDING', 'APPROVED', 'REJECTED');
 CREATE TYPE notification_type AS ENUM ('SYSTEM', 'SUBMISSION', 'VOUCHER', 'USER', 'FORUM', 'FORUM_COMMENT');
 CREATE TYPE voucher_status AS ENUM ('active', 'inactive', 'expired');
 
@@ -114,15 +115,30 @@ CREATE TABLE ho_so_xu_ly (
     don_vi_tinh VARCHAR(50) NOT NULL,
     han_dung DATE,
     ket_qua submission_status NOT NULL DEFAULT 'pending',
+    -- Canonical review outcome derived from ket_qua
+    trang_thai submission_review_status GENERATED ALWAYS AS (
+        CASE ket_qua
+            WHEN 'pending' THEN 'PENDING'::submission_review_status
+            WHEN 'approved' THEN 'APPROVED'::submission_review_status
+            ELSE 'REJECTED'::submission_review_status
+        END
+    ) STORED,
     duong_dan_chung_nhan TEXT,
     diem_da_trao INTEGER DEFAULT 0,
     ghi_chu TEXT,
-    thoi_gian_xu_ly TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+    thoi_gian_xu_ly TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- Review lease: reviewer currently holding the pending submission and until when
+    id_nguoi_nhan_duyet UUID REFERENCES users(id) ON DELETE SET NULL,
+    han_nhan_duyet TIMESTAMP WITH TIME ZONE
 );
 
 CREATE INDEX idx_ho_so_xu_ly_user ON ho_so_xu_ly(id_nguoi_nop);
 CREATE INDEX idx_ho_so_xu_ly_status ON ho_so_xu_ly(ket_qua);
+CREATE INDEX idx_ho_so_xu_ly_trang_thai ON ho_so_xu_ly(trang_thai);
+CREATE INDEX idx_ho_so_xu_ly_user_status ON ho_so_xu_ly(id_nguoi_nop, ket_qua);
 CREATE INDEX idx_ho_so_xu_ly_date ON ho_so_xu_ly(thoi_gian_xu_ly);
+CREATE INDEX idx_ho_so_xu_ly_pending_queue ON ho_so_xu_ly(thoi_gian_xu_ly DESC, id DESC) WHERE ket_qua = 'pending';
+CREATE INDEX idx_ho_so_xu_ly_lease ON ho_so_xu_ly(id_nguoi_nhan_duyet) WHERE ket_qua = 'pending' AND id_nguoi_nhan_duyet IS NOT NULL;
 
 -- ============================================================
 -- TABLE: thong_bao (Notifications)
@@ -222,6 +238,7 @@ CREATE TABLE ket_qua_phan_loai (
 
 CREATE INDEX idx_ket_qua_ho_so ON ket_qua_phan_loai(id_ho_so_xu_ly);
 CREATE INDEX idx_ket_qua_tong ON ket_qua_phan_loai(ket_qua_tong);
+CREATE INDEX idx_ket_qua_thoi_gian ON ket_qua_phan_loai(thoi_gian_danh_gia DESC, id DESC);
 
 -- ============================================================
 -- TABLE: chi_tiet_danh_gia (Classification Criteria Details)
@@ -361,6 +378,379 @@ CREATE TRIGGER trigger_update_message_detail_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_message_updated_at();
 
+-- ============================================================
+-- TABLE: monthly_rollups (Monthly Aggregates for Trends)
+-- ============================================================
+
+-- Rows per (dimension, subject, month), kept current by the triggers below.
+-- subject_id is the nil UUID for global series and the user id for per-user series.
+-- Global series are spread over 16 shard rows (by backend pid) so concurrent
+-- writers don't queue on one row lock; readers sum the shards.
+CREATE TABLE monthly_rollups (
+    dimension VARCHAR(50) NOT NULL,
+    subject_id UUID NOT NULL DEFAULT '00000000-0000-0000-0000-000000000000',
+    month DATE NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, subject_id, month, shard)
+);
+
+-- Months are bucketed in UTC, like the dashboard's month series
+CREATE OR REPLACE FUNCTION rollup_month(ts TIMESTAMP WITH TIME ZONE)
+RETURNS DATE AS $$
+    SELECT date_trunc('month', ts AT TIME ZONE 'UTC')::date;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION bump_monthly_rollup(p_dimension TEXT, p_subject UUID, p_ts TIMESTAMP WITH TIME ZONE, p_delta BIGINT)
+RETURNS void AS $$
+BEGIN
+    IF p_ts IS NULL OR p_delta IS NULL OR p_delta = 0 THEN
+        RETURN;
+    END IF;
+    INSERT INTO monthly_rollups (dimension, subject_id, month, shard, total)
+    VALUES (
+        p_dimension, p_subject, rollup_month(p_ts),
+        CASE WHEN p_subject = '00000000-0000-0000-0000-000000000000' THEN pg_backend_pid() % 16 ELSE 0 END,
+        p_delta
+    )
+    ON CONFLICT (dimension, subject_id, month, shard)
+    DO UPDATE SET total = monthly_rollups.total + EXCLUDED.total;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Submissions per month (global)
+CREATE OR REPLACE FUNCTION rollup_submissions()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_monthly_rollup('submissions', '00000000-0000-0000-0000-000000000000', OLD.thoi_gian_xu_ly, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_monthly_rollup('submissions', '00000000-0000-0000-0000-000000000000', NEW.thoi_gian_xu_ly, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_rollup_submissions
+    AFTER INSERT OR DELETE OR UPDATE OF thoi_gian_xu_ly ON ho_so_xu_ly
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_submissions();
+
+-- Voucher redemptions per month (global)
+CREATE OR REPLACE FUNCTION rollup_voucher_redemptions()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_monthly_rollup('voucher_redemptions', '00000000-0000-0000-0000-000000000000', OLD.redeemed_at, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_monthly_rollup('voucher_redemptions', '00000000-0000-0000-0000-000000000000', NEW.redeemed_at, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_rollup_voucher_redemptions
+    AFTER INSERT OR DELETE OR UPDATE OF redeemed_at ON voucher_usage
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_voucher_redemptions();
+
+-- Points earned per month (per user)
+CREATE OR REPLACE FUNCTION rollup_points()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_monthly_rollup('points', OLD.id_nguoi_nop, OLD.ngay_cong, -OLD.diem);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_monthly_rollup('points', NEW.id_nguoi_nop, NEW.ngay_cong, NEW.diem);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_rollup_points
+    AFTER INSERT OR DELETE OR UPDATE OF diem, ngay_cong, id_nguoi_nop ON diem_thuong
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_points();
+
+-- Recompute every rollup from the source tables.
+-- Writers wait on the table lock and apply their deltas after the rebuild commits.
+CREATE OR REPLACE FUNCTION rebuild_monthly_rollups()
+RETURNS void AS $$
+BEGIN
+    LOCK TABLE monthly_rollups IN EXCLUSIVE MODE;
+    DELETE FROM monthly_rollups;
+
+    INSERT INTO monthly_rollups (dimension, subject_id, month, total)
+    SELECT 'submissions', '00000000-0000-0000-0000-000000000000', rollup_month(thoi_gian_xu_ly), COUNT(*)
+    FROM ho_so_xu_ly
+    GROUP BY 3;
+
+    INSERT INTO monthly_rollups (dimension, subject_id, month, total)
+    SELECT 'voucher_redemptions', '00000000-0000-0000-0000-000000000000', rollup_month(redeemed_at), COUNT(*)
+    FROM voucher_usage
+    GROUP BY 3;
+
+    INSERT INTO monthly_rollups (dimension, subject_id, month, total)
+    SELECT 'points', id_nguoi_nop, rollup_month(ngay_cong), SUM(diem)
+    FROM diem_thuong
+    GROUP BY 2, 3
+    HAVING SUM(diem) <> 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- TABLE: user_stats (Per-User Dashboard Counters)
+-- ============================================================
+
+-- Kept current by the triggers below, in the same transaction as the write
+CREATE TABLE user_stats (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    pending INTEGER NOT NULL DEFAULT 0,
+    approved INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    returned INTEGER NOT NULL DEFAULT 0,
+    recalled INTEGER NOT NULL DEFAULT 0,
+    vouchers_used INTEGER NOT NULL DEFAULT 0,
+    lifetime_points BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION bump_user_stats(
+    p_user UUID,
+    p_status submission_status,
+    p_submissions INTEGER,
+    p_vouchers INTEGER,
+    p_points BIGINT
+)
+RETURNS void AS $$
+BEGIN
+    -- Skip users deleted in the same statement (cascading deletes)
+    INSERT INTO user_stats (user_id, pending, approved, rejected, returned, recalled, vouchers_used, lifetime_points)
+    SELECT p_user,
+           CASE WHEN p_status = 'pending' THEN p_submissions ELSE 0 END,
+           CASE WHEN p_status = 'approved' THEN p_submissions ELSE 0 END,
+           CASE WHEN p_status = 'rejected' THEN p_submissions ELSE 0 END,
+           CASE WHEN p_status = 'returned_to_pharmacy' THEN p_submissions ELSE 0 END,
+           CASE WHEN p_status = 'recalled' THEN p_submissions ELSE 0 END,
+           p_vouchers,
+           p_points
+    WHERE EXISTS (SELECT 1 FROM users WHERE id = p_user)
+    ON CONFLICT (user_id) DO UPDATE
+    SET pending = user_stats.pending + EXCLUDED.pending,
+        approved = user_stats.approved + EXCLUDED.approved,
+        rejected = user_stats.rejected + EXCLUDED.rejected,
+        returned = user_stats.returned + EXCLUDED.returned,
+        recalled = user_stats.recalled + EXCLUDED.recalled,
+        vouchers_used = user_stats.vouchers_used + EXCLUDED.vouchers_used,
+        lifetime_points = user_stats.lifetime_points + EXCLUDED.lifetime_points,
+        updated_at = CURRENT_TIMESTAMP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_submissions()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_stats(OLD.id_nguoi_nop, OLD.ket_qua, -1, 0, 0);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_stats(NEW.id_nguoi_nop, NEW.ket_qua, 1, 0, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_user_stats_submissions
+    AFTER INSERT OR DELETE OR UPDATE OF ket_qua, id_nguoi_nop ON ho_so_xu_ly
+    FOR EACH ROW
+    EXECUTE FUNCTION user_stats_submissions();
+
+CREATE OR REPLACE FUNCTION user_stats_vouchers()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_stats(OLD.user_id, NULL, 0, -1, 0);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_stats(NEW.user_id, NULL, 0, 1, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_user_stats_vouchers
+    AFTER INSERT OR DELETE OR UPDATE OF user_id ON voucher_usage
+    FOR EACH ROW
+    EXECUTE FUNCTION user_stats_vouchers();
+
+CREATE OR REPLACE FUNCTION user_stats_points()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_stats(OLD.id_nguoi_nop, NULL, 0, 0, -OLD.diem);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_stats(NEW.id_nguoi_nop, NULL, 0, 0, NEW.diem);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_user_stats_points
+    AFTER INSERT OR DELETE OR UPDATE OF diem, id_nguoi_nop ON diem_thuong
+    FOR EACH ROW
+    EXECUTE FUNCTION user_stats_points();
+
+-- Fix one user's counters. The user's row is locked before recounting: trigger
+-- deltas committed before the lock is granted are visible to the recount (each
+-- statement takes a new snapshot), later ones are applied on top of the fix.
+-- Returns whether the counters changed.
+CREATE OR REPLACE FUNCTION reconcile_user_stats_for(p_user UUID)
+RETURNS BOOLEAN AS $$
+DECLARE
+    stored user_stats%ROWTYPE;
+    actual RECORD;
+BEGIN
+    INSERT INTO user_stats (user_id)
+    SELECT p_user
+    WHERE EXISTS (SELECT 1 FROM users WHERE id = p_user)
+    ON CONFLICT (user_id) DO NOTHING;
+
+    SELECT * INTO stored FROM user_stats WHERE user_id = p_user FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN false;
+    END IF;
+
+    SELECT s.pending, s.approved, s.rejected, s.returned, s.recalled,
+           (SELECT COUNT(*) FROM voucher_usage WHERE user_id = p_user) AS vouchers_used,
+           (SELECT COALESCE(SUM(diem), 0) FROM diem_thuong WHERE id_nguoi_nop = p_user) AS lifetime_points
+    INTO actual
+    FROM (
+        SELECT COUNT(*) FILTER (WHERE ket_qua = 'pending') AS pending,
+               COUNT(*) FILTER (WHERE ket_qua = 'approved') AS approved,
+               COUNT(*) FILTER (WHERE ket_qua = 'rejected') AS rejected,
+               COUNT(*) FILTER (WHERE ket_qua = 'returned_to_pharmacy') AS returned,
+               COUNT(*) FILTER (WHERE ket_qua = 'recalled') AS recalled
+        FROM ho_so_xu_ly
+        WHERE id_nguoi_nop = p_user
+    ) s;
+
+    IF (stored.pending, stored.approved, stored.rejected, stored.returned, stored.recalled,
+        stored.vouchers_used, stored.lifetime_points)
+       IS NOT DISTINCT FROM
+       (actual.pending, actual.approved, actual.rejected, actual.returned, actual.recalled,
+        actual.vouchers_used, actual.lifetime_points) THEN
+        RETURN false;
+    END IF;
+
+    UPDATE user_stats
+    SET pending = actual.pending,
+        approved = actual.approved,
+        rejected = actual.rejected,
+        returned = actual.returned,
+        recalled = actual.recalled,
+        vouchers_used = actual.vouchers_used,
+        lifetime_points = actual.lifetime_points,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = p_user;
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recompute counters from the source tables and fix rows that drifted.
+-- A lock-free scan finds candidates; each is then fixed by reconcile_user_stats_for,
+-- so only drifted users' rows are locked. Returns the number of users whose
+-- counters changed, or NULL when another session is already reconciling.
+CREATE OR REPLACE FUNCTION reconcile_user_stats()
+RETURNS INTEGER AS $$
+DECLARE
+    changed INTEGER := 0;
+    candidate RECORD;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('reconcile_user_stats')) THEN
+        RETURN NULL;
+    END IF;
+
+    FOR candidate IN
+        WITH actual AS (
+            SELECT u.id AS user_id,
+                   COALESCE(s.pending, 0) AS pending,
+                   COALESCE(s.approved, 0) AS approved,
+                   COALESCE(s.rejected, 0) AS rejected,
+                   COALESCE(s.returned, 0) AS returned,
+                   COALESCE(s.recalled, 0) AS recalled,
+                   COALESCE(v.vouchers_used, 0) AS vouchers_used,
+                   COALESCE(p.lifetime_points, 0) AS lifetime_points
+            FROM users u
+            LEFT JOIN (
+                SELECT id_nguoi_nop,
+                       COUNT(*) FILTER (WHERE ket_qua = 'pending') AS pending,
+                       COUNT(*) FILTER (WHERE ket_qua = 'approved') AS approved,
+                       COUNT(*) FILTER (WHERE ket_qua = 'rejected') AS rejected,
+                       COUNT(*) FILTER (WHERE ket_qua = 'returned_to_pharmacy') AS returned,
+                       COUNT(*) FILTER (WHERE ket_qua = 'recalled') AS recalled
+                FROM ho_so_xu_ly
+                GROUP BY id_nguoi_nop
+            ) s ON s.id_nguoi_nop = u.id
+            LEFT JOIN (
+                SELECT user_id, COUNT(*) AS vouchers_used
+                FROM voucher_usage
+                GROUP BY user_id
+            ) v ON v.user_id = u.id
+            LEFT JOIN (
+                SELECT id_nguoi_nop, SUM(diem) AS lifetime_points
+                FROM diem_thuong
+                GROUP BY id_nguoi_nop
+            ) p ON p.id_nguoi_nop = u.id
+        )
+        SELECT a.user_id
+        FROM actual a
+        LEFT JOIN user_stats us ON us.user_id = a.user_id
+        WHERE (us.pending, us.approved, us.rejected, us.returned, us.recalled, us.vouchers_used, us.lifetime_points)
+              IS DISTINCT FROM
+              (a.pending, a.approved, a.rejected, a.returned, a.recalled, a.vouchers_used, a.lifetime_points)
+        ORDER BY a.user_id
+    LOOP
+        IF reconcile_user_stats_for(candidate.user_id) THEN
+            changed := changed + 1;
+        END IF;
+    END LOOP;
+
+    RETURN changed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- USER CHANGE NOTIFICATIONS (Auth Cache Invalidation)
+-- ============================================================
+
+-- API workers cache authenticated users; any committed change to a cached
+-- column (including every diem_tich_luy update) is published as a 'user'
+-- event on the cache invalidation channel
+CREATE OR REPLACE FUNCTION notify_user_changed()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND (NEW.ho_ten, NEW.email, NEW.so_dien_thoai, NEW.dia_chi, NEW.role, NEW.diem_tich_luy)
+           IS NOT DISTINCT FROM
+           (OLD.ho_ten, OLD.email, OLD.so_dien_thoai, OLD.dia_chi, OLD.role, OLD.diem_tich_luy) THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify(
+        'cache_invalidate',
+        json_build_object('ns', 'user', 'key', OLD.id::text)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_users_notify_changed
+AFTER UPDATE OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION notify_user_changed();
+
 -- ============================================================
 -- INSERT SAMPLE DATA
 -- ============================================================
@@ -0,0 +1,11 @@
+-- Migration: Indexes for keyset pagination of the review queue and classification results
+-- Created: 2026
+
+-- Pending review queue, newest first: (thoi_gian_xu_ly, id) < cursor
+CREATE INDEX IF NOT EXISTS idx_ho_so_xu_ly_pending_queue
+    ON ho_so_xu_ly(thoi_gian_xu_ly DESC, id DESC)
+    WHERE ket_qua = 'pending';
+
+-- Classification results listing, newest first: (thoi_gian_danh_gia, id) < cursor
+CREATE INDEX IF NOT EXISTS idx_ket_qua_thoi_gian
+    ON ket_qua_phan_loai(thoi_gian_danh_gia DESC, id DESC);
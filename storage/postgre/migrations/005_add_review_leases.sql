@@ -0,0 +1,11 @@
+-- Migration: Lease-based reviewer assignment for pending submissions
+-- Created: 2026
+
+-- Reviewer currently holding the submission and lease expiry
+ALTER TABLE ho_so_xu_ly ADD COLUMN IF NOT EXISTS id_nguoi_nhan_duyet UUID REFERENCES users(id) ON DELETE SET NULL;
+ALTER TABLE ho_so_xu_ly ADD COLUMN IF NOT EXISTS han_nhan_duyet TIMESTAMP WITH TIME ZONE;
+
+-- Open-lease counts per reviewer
+CREATE INDEX IF NOT EXISTS idx_ho_so_xu_ly_lease
+    ON ho_so_xu_ly(id_nguoi_nhan_duyet)
+    WHERE ket_qua = 'pending' AND id_nguoi_nhan_duyet IS NOT NULL;
@@ -0,0 +1,51 @@
+-- Migration: Canonical submission status column
+-- Created: 2026
+
+-- Older databases stored ho_so_xu_ly.ket_qua as free text (TAI_SU_DUNG, TIEU_HUY, ...).
+-- Normalize those values and convert the column to the submission_status enum.
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'ho_so_xu_ly' AND column_name = 'ket_qua') <> 'USER-DEFINED' THEN
+        -- Partial indexes from 004/005 reference ket_qua and are rebuilt below
+        DROP INDEX IF EXISTS idx_ho_so_xu_ly_pending_queue;
+        DROP INDEX IF EXISTS idx_ho_so_xu_ly_lease;
+        ALTER TABLE ho_so_xu_ly ALTER COLUMN ket_qua DROP DEFAULT;
+        ALTER TABLE ho_so_xu_ly ALTER COLUMN ket_qua TYPE submission_status USING (
+            CASE
+                WHEN lower(ket_qua) IN ('pending', 'approved', 'rejected', 'returned_to_pharmacy', 'recalled')
+                    THEN lower(ket_qua)
+                WHEN upper(ket_qua) IN ('TAI_SU_DUNG', 'DAT') THEN 'approved'
+                WHEN upper(ket_qua) IN ('TIEU_HUY', 'KHONG_DAT') THEN 'rejected'
+                ELSE 'pending'
+            END
+        )::submission_status;
+        ALTER TABLE ho_so_xu_ly ALTER COLUMN ket_qua SET DEFAULT 'pending';
+        CREATE INDEX idx_ho_so_xu_ly_pending_queue
+            ON ho_so_xu_ly(thoi_gian_xu_ly DESC, id DESC)
+            WHERE ket_qua = 'pending';
+        CREATE INDEX idx_ho_so_xu_ly_lease
+            ON ho_so_xu_ly(id_nguoi_nhan_duyet)
+            WHERE ket_qua = 'pending' AND id_nguoi_nhan_duyet IS NOT NULL;
+    END IF;
+END $$;
+
+DO $$
+BEGIN
+    CREATE TYPE submission_review_status AS ENUM ('PENDING', 'APPROVED', 'REJECTED');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
+
+-- Canonical review outcome, maintained by Postgres from ket_qua
+ALTER TABLE ho_so_xu_ly ADD COLUMN IF NOT EXISTS trang_thai submission_review_status
+    GENERATED ALWAYS AS (
+        CASE ket_qua
+            WHEN 'pending' THEN 'PENDING'::submission_review_status
+            WHEN 'approved' THEN 'APPROVED'::submission_review_status
+            ELSE 'REJECTED'::submission_review_status
+        END
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_ho_so_xu_ly_trang_thai ON ho_so_xu_ly(trang_thai);
+CREATE INDEX IF NOT EXISTS idx_ho_so_xu_ly_user_status ON ho_so_xu_ly(id_nguoi_nop, ket_qua);
@@ -0,0 +1,121 @@
+-- Migration: Monthly rollup tables for dashboard trends
+-- Created: 2026
+
+-- ============================================================
+-- TABLE: monthly_rollups (Monthly Aggregates for Trends)
+-- ============================================================
+
+-- One row per (dimension, subject, month), kept current by the triggers below.
+-- subject_id is the nil UUID for global series and the user id for per-user series.
+CREATE TABLE IF NOT EXISTS monthly_rollups (
+    dimension VARCHAR(50) NOT NULL,
+    subject_id UUID NOT NULL DEFAULT '00000000-0000-0000-0000-000000000000',
+    month DATE NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, subject_id, month)
+);
+
+-- Months are bucketed in UTC, like the dashboard's month series
+CREATE OR REPLACE FUNCTION rollup_month(ts TIMESTAMP WITH TIME ZONE)
+RETURNS DATE AS $$
+    SELECT date_trunc('month', ts AT TIME ZONE 'UTC')::date;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION bump_monthly_rollup(p_dimension TEXT, p_subject UUID, p_ts TIMESTAMP WITH TIME ZONE, p_delta BIGINT)
+RETURNS void AS $$
+BEGIN
+    IF p_ts IS NULL OR p_delta IS NULL OR p_delta = 0 THEN
+        RETURN;
+    END IF;
+    INSERT INTO monthly_rollups (dimension, subject_id, month, total)
+    VALUES (p_dimension, p_subject, rollup_month(p_ts), p_delta)
+    ON CONFLICT (dimension, subject_id, month)
+    DO UPDATE SET total = monthly_rollups.total + EXCLUDED.total;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Submissions per month (global)
+CREATE OR REPLACE FUNCTION rollup_submissions()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_monthly_rollup('submissions', '00000000-0000-0000-0000-000000000000', OLD.thoi_gian_xu_ly, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_monthly_rollup('submissions', '00000000-0000-0000-0000-000000000000', NEW.thoi_gian_xu_ly, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trigger_rollup_submissions
+    AFTER INSERT OR DELETE OR UPDATE OF thoi_gian_xu_ly ON ho_so_xu_ly
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_submissions();
+
+-- Voucher redemptions per month (global)
+CREATE OR REPLACE FUNCTION rollup_voucher_redemptions()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_monthly_rollup('voucher_redemptions', '00000000-0000-0000-0000-000000000000', OLD.redeemed_at, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_monthly_rollup('voucher_redemptions', '00000000-0000-0000-0000-000000000000', NEW.redeemed_at, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trigger_rollup_voucher_redemptions
+    AFTER INSERT OR DELETE OR UPDATE OF redeemed_at ON voucher_usage
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_voucher_redemptions();
+
+-- Points earned per month (per user)
+CREATE OR REPLACE FUNCTION rollup_points()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_monthly_rollup('points', OLD.id_nguoi_nop, OLD.ngay_cong, -OLD.diem);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_monthly_rollup('points', NEW.id_nguoi_nop, NEW.ngay_cong, NEW.diem);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trigger_rollup_points
+    AFTER INSERT OR DELETE OR UPDATE OF diem, ngay_cong, id_nguoi_nop ON diem_thuong
+    FOR EACH ROW
+    EXECUTE FUNCTION rollup_points();
+
+-- Recompute every rollup from the source tables.
+-- Writers wait on the table lock and apply their deltas after the rebuild commits.
+CREATE OR REPLACE FUNCTION rebuild_monthly_rollups()
+RETURNS void AS $$
+BEGIN
+    LOCK TABLE monthly_rollups IN EXCLUSIVE MODE;
+    DELETE FROM monthly_rollups;
+
+    INSERT INTO monthly_rollups (dimension, subject_id, month, total)
+    SELECT 'submissions', '00000000-0000-0000-0000-000000000000', rollup_month(thoi_gian_xu_ly), COUNT(*)
+    FROM ho_so_xu_ly
+    GROUP BY 3;
+
+    INSERT INTO monthly_rollups (dimension, subject_id, month, total)
+    SELECT 'voucher_redemptions', '00000000-0000-0000-0000-000000000000', rollup_month(redeemed_at), COUNT(*)
+    FROM voucher_usage
+    GROUP BY 3;
+
+    INSERT INTO monthly_rollups (dimension, subject_id, month, total)
+    SELECT 'points', id_nguoi_nop, rollup_month(ngay_cong), SUM(diem)
+    FROM diem_thuong
+    GROUP BY 2, 3
+    HAVING SUM(diem) <> 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill from existing data
+SELECT rebuild_monthly_rollups();
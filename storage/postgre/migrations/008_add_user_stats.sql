@@ -0,0 +1,173 @@
+-- Migration: Per-user dashboard counters
+-- Created: 2026
+
+-- ============================================================
+-- TABLE: user_stats (Per-User Dashboard Counters)
+-- ============================================================
+
+-- Kept current by the triggers below, in the same transaction as the write
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    pending INTEGER NOT NULL DEFAULT 0,
+    approved INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    returned INTEGER NOT NULL DEFAULT 0,
+    recalled INTEGER NOT NULL DEFAULT 0,
+    vouchers_used INTEGER NOT NULL DEFAULT 0,
+    lifetime_points BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION bump_user_stats(
+    p_user UUID,
+    p_status submission_status,
+    p_submissions INTEGER,
+    p_vouchers INTEGER,
+    p_points BIGINT
+)
+RETURNS void AS $$
+BEGIN
+    -- Skip users deleted in the same statement (cascading deletes)
+    INSERT INTO user_stats (user_id, pending, approved, rejected, returned, recalled, vouchers_used, lifetime_points)
+    SELECT p_user,
+           CASE WHEN p_status = 'pending' THEN p_submissions ELSE 0 END,
+           CASE WHEN p_status = 'approved' THEN p_submissions ELSE 0 END,
+           CASE WHEN p_status = 'rejected' THEN p_submissions ELSE 0 END,
+           CASE WHEN p_status = 'returned_to_pharmacy' THEN p_submissions ELSE 0 END,
+           CASE WHEN p_status = 'recalled' THEN p_submissions ELSE 0 END,
+           p_vouchers,
+           p_points
+    WHERE EXISTS (SELECT 1 FROM users WHERE id = p_user)
+    ON CONFLICT (user_id) DO UPDATE
+    SET pending = user_stats.pending + EXCLUDED.pending,
+        approved = user_stats.approved + EXCLUDED.approved,
+        rejected = user_stats.rejected + EXCLUDED.rejected,
+        returned = user_stats.returned + EXCLUDED.returned,
+        recalled = user_stats.recalled + EXCLUDED.recalled,
+        vouchers_used = user_stats.vouchers_used + EXCLUDED.vouchers_used,
+        lifetime_points = user_stats.lifetime_points + EXCLUDED.lifetime_points,
+        updated_at = CURRENT_TIMESTAMP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_stats_submissions()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_stats(OLD.id_nguoi_nop, OLD.ket_qua, -1, 0, 0);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_stats(NEW.id_nguoi_nop, NEW.ket_qua, 1, 0, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trigger_user_stats_submissions
+    AFTER INSERT OR DELETE OR UPDATE OF ket_qua, id_nguoi_nop ON ho_so_xu_ly
+    FOR EACH ROW
+    EXECUTE FUNCTION user_stats_submissions();
+
+CREATE OR REPLACE FUNCTION user_stats_vouchers()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_stats(OLD.user_id, NULL, 0, -1, 0);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_stats(NEW.user_id, NULL, 0, 1, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trigger_user_stats_vouchers
+    AFTER INSERT OR DELETE OR UPDATE OF user_id ON voucher_usage
+    FOR EACH ROW
+    EXECUTE FUNCTION user_stats_vouchers();
+
+CREATE OR REPLACE FUNCTION user_stats_points()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_stats(OLD.id_nguoi_nop, NULL, 0, 0, -OLD.diem);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_stats(NEW.id_nguoi_nop, NULL, 0, 0, NEW.diem);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trigger_user_stats_points
+    AFTER INSERT OR DELETE OR UPDATE OF diem, id_nguoi_nop ON diem_thuong
+    FOR EACH ROW
+    EXECUTE FUNCTION user_stats_points();
+
+-- Recompute counters from the source tables and fix rows that drifted.
+-- Returns the number of users whose counters changed.
+CREATE OR REPLACE FUNCTION reconcile_user_stats()
+RETURNS INTEGER AS $$
+DECLARE
+    changed INTEGER;
+BEGIN
+    LOCK TABLE user_stats IN EXCLUSIVE MODE;
+
+    WITH actual AS (
+        SELECT u.id AS user_id,
+               COALESCE(s.pending, 0) AS pending,
+               COALESCE(s.approved, 0) AS approved,
+               COALESCE(s.rejected, 0) AS rejected,
+               COALESCE(s.returned, 0) AS returned,
+               COALESCE(s.recalled, 0) AS recalled,
+               COALESCE(v.vouchers_used, 0) AS vouchers_used,
+               COALESCE(p.lifetime_points, 0) AS lifetime_points
+        FROM users u
+        LEFT JOIN (
+            SELECT id_nguoi_nop,
+                   COUNT(*) FILTER (WHERE ket_qua = 'pending') AS pending,
+                   COUNT(*) FILTER (WHERE ket_qua = 'approved') AS approved,
+                   COUNT(*) FILTER (WHERE ket_qua = 'rejected') AS rejected,
+                   COUNT(*) FILTER (WHERE ket_qua = 'returned_to_pharmacy') AS returned,
+                   COUNT(*) FILTER (WHERE ket_qua = 'recalled') AS recalled
+            FROM ho_so_xu_ly
+            GROUP BY id_nguoi_nop
+        ) s ON s.id_nguoi_nop = u.id
+        LEFT JOIN (
+            SELECT user_id, COUNT(*) AS vouchers_used
+            FROM voucher_usage
+            GROUP BY user_id
+        ) v ON v.user_id = u.id
+        LEFT JOIN (
+            SELECT id_nguoi_nop, SUM(diem) AS lifetime_points
+            FROM diem_thuong
+            GROUP BY id_nguoi_nop
+        ) p ON p.id_nguoi_nop = u.id
+    ),
+    fixed AS (
+        INSERT INTO user_stats (user_id, pending, approved, rejected, returned, recalled, vouchers_used, lifetime_points)
+        SELECT a.user_id, a.pending, a.approved, a.rejected, a.returned, a.recalled, a.vouchers_used, a.lifetime_points
+        FROM actual a
+        LEFT JOIN user_stats us ON us.user_id = a.user_id
+        WHERE (us.pending, us.approved, us.rejected, us.returned, us.recalled, us.vouchers_used, us.lifetime_points)
+              IS DISTINCT FROM
+              (a.pending, a.approved, a.rejected, a.returned, a.recalled, a.vouchers_used, a.lifetime_points)
+        ON CONFLICT (user_id) DO UPDATE
+        SET pending = EXCLUDED.pending,
+            approved = EXCLUDED.approved,
+            rejected = EXCLUDED.rejected,
+            returned = EXCLUDED.returned,
+            recalled = EXCLUDED.recalled,
+            vouchers_used = EXCLUDED.vouchers_used,
+            lifetime_points = EXCLUDED.lifetime_points,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING 1
+    )
+    SELECT COUNT(*) INTO changed FROM fixed;
+
+    RETURN changed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill from existing data
+SELECT reconcile_user_stats();
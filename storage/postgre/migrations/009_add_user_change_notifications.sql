@@ -0,0 +1,26 @@
+-- Migration: Publish user changes for auth cache invalidation
+-- Created: 2026
+
+-- ============================================================
+-- USER CHANGE NOTIFICATIONS (Auth Cache Invalidation)
+-- ============================================================
+
+-- API workers cache authenticated users; any committed change to a cached
+-- column (including every diem_tich_luy update) is published on this channel
+CREATE OR REPLACE FUNCTION notify_user_changed()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND (NEW.ho_ten, NEW.email, NEW.so_dien_thoai, NEW.dia_chi, NEW.role, NEW.diem_tich_luy)
+           IS NOT DISTINCT FROM
+           (OLD.ho_ten, OLD.email, OLD.so_dien_thoai, OLD.dia_chi, OLD.role, OLD.diem_tich_luy) THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify('user_invalidate', OLD.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_users_notify_changed
+AFTER UPDATE OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION notify_user_changed();
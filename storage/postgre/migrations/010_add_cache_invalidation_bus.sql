@@ -0,0 +1,25 @@
+-- Migration: Publish user changes on the shared cache invalidation channel
+-- Created: 2026
+
+-- ============================================================
+-- CACHE INVALIDATION BUS
+-- ============================================================
+
+-- API workers listen on one channel for (namespace, key) events; user changes
+-- are published there as the 'user' namespace instead of 'user_invalidate'
+CREATE OR REPLACE FUNCTION notify_user_changed()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND (NEW.ho_ten, NEW.email, NEW.so_dien_thoai, NEW.dia_chi, NEW.role, NEW.diem_tich_luy)
+           IS NOT DISTINCT FROM
+           (OLD.ho_ten, OLD.email, OLD.so_dien_thoai, OLD.dia_chi, OLD.role, OLD.diem_tich_luy) THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify(
+        'cache_invalidate',
+        json_build_object('ns', 'user', 'key', OLD.id::text)::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,33 @@
+-- Migration: Spread global monthly rollups over several rows
+-- Created: 2026
+
+-- ============================================================
+-- TABLE: monthly_rollups (Sharded Global Series)
+-- ============================================================
+
+-- Every submission used to update the one global row for its month, so concurrent
+-- submission transactions queued on that row lock until each one committed.
+-- Global series are now split over 16 shard rows picked by backend pid (a
+-- transaction always uses the same shard, so shards cannot deadlock each other);
+-- readers sum the shards. Per-user series stay on shard 0.
+ALTER TABLE monthly_rollups ADD COLUMN IF NOT EXISTS shard SMALLINT NOT NULL DEFAULT 0;
+
+ALTER TABLE monthly_rollups DROP CONSTRAINT IF EXISTS monthly_rollups_pkey;
+ALTER TABLE monthly_rollups ADD PRIMARY KEY (dimension, subject_id, month, shard);
+
+CREATE OR REPLACE FUNCTION bump_monthly_rollup(p_dimension TEXT, p_subject UUID, p_ts TIMESTAMP WITH TIME ZONE, p_delta BIGINT)
+RETURNS void AS $$
+BEGIN
+    IF p_ts IS NULL OR p_delta IS NULL OR p_delta = 0 THEN
+        RETURN;
+    END IF;
+    INSERT INTO monthly_rollups (dimension, subject_id, month, shard, total)
+    VALUES (
+        p_dimension, p_subject, rollup_month(p_ts),
+        CASE WHEN p_subject = '00000000-0000-0000-0000-000000000000' THEN pg_backend_pid() % 16 ELSE 0 END,
+        p_delta
+    )
+    ON CONFLICT (dimension, subject_id, month, shard)
+    DO UPDATE SET total = monthly_rollups.total + EXCLUDED.total;
+END;
+$$ LANGUAGE plpgsql;
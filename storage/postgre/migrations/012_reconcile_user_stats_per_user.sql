@@ -0,0 +1,129 @@
+-- Migration: Reconcile user_stats per user, without a table lock
+-- Created: 2026
+
+-- ============================================================
+-- USER_STATS RECONCILIATION
+-- ============================================================
+
+-- reconcile_user_stats() used to hold an EXCLUSIVE lock on user_stats for the
+-- whole recount, blocking every submit, approve and redeem (their triggers
+-- update user_stats) while it ran, once an hour on every API worker.
+
+-- Fix one user's counters. The user's row is locked before recounting: trigger
+-- deltas committed before the lock is granted are visible to the recount (each
+-- statement takes a new snapshot), later ones are applied on top of the fix.
+-- Returns whether the counters changed.
+CREATE OR REPLACE FUNCTION reconcile_user_stats_for(p_user UUID)
+RETURNS BOOLEAN AS $$
+DECLARE
+    stored user_stats%ROWTYPE;
+    actual RECORD;
+BEGIN
+    INSERT INTO user_stats (user_id)
+    SELECT p_user
+    WHERE EXISTS (SELECT 1 FROM users WHERE id = p_user)
+    ON CONFLICT (user_id) DO NOTHING;
+
+    SELECT * INTO stored FROM user_stats WHERE user_id = p_user FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN false;
+    END IF;
+
+    SELECT s.pending, s.approved, s.rejected, s.returned, s.recalled,
+           (SELECT COUNT(*) FROM voucher_usage WHERE user_id = p_user) AS vouchers_used,
+           (SELECT COALESCE(SUM(diem), 0) FROM diem_thuong WHERE id_nguoi_nop = p_user) AS lifetime_points
+    INTO actual
+    FROM (
+        SELECT COUNT(*) FILTER (WHERE ket_qua = 'pending') AS pending,
+               COUNT(*) FILTER (WHERE ket_qua = 'approved') AS approved,
+               COUNT(*) FILTER (WHERE ket_qua = 'rejected') AS rejected,
+               COUNT(*) FILTER (WHERE ket_qua = 'returned_to_pharmacy') AS returned,
+               COUNT(*) FILTER (WHERE ket_qua = 'recalled') AS recalled
+        FROM ho_so_xu_ly
+        WHERE id_nguoi_nop = p_user
+    ) s;
+
+    IF (stored.pending, stored.approved, stored.rejected, stored.returned, stored.recalled,
+        stored.vouchers_used, stored.lifetime_points)
+       IS NOT DISTINCT FROM
+       (actual.pending, actual.approved, actual.rejected, actual.returned, actual.recalled,
+        actual.vouchers_used, actual.lifetime_points) THEN
+        RETURN false;
+    END IF;
+
+    UPDATE user_stats
+    SET pending = actual.pending,
+        approved = actual.approved,
+        rejected = actual.rejected,
+        returned = actual.returned,
+        recalled = actual.recalled,
+        vouchers_used = actual.vouchers_used,
+        lifetime_points = actual.lifetime_points,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = p_user;
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recompute counters from the source tables and fix rows that drifted.
+-- A lock-free scan finds candidates; each is then fixed by reconcile_user_stats_for,
+-- so only drifted users' rows are locked. Returns the number of users whose
+-- counters changed, or NULL when another session is already reconciling.
+CREATE OR REPLACE FUNCTION reconcile_user_stats()
+RETURNS INTEGER AS $$
+DECLARE
+    changed INTEGER := 0;
+    candidate RECORD;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('reconcile_user_stats')) THEN
+        RETURN NULL;
+    END IF;
+
+    FOR candidate IN
+        WITH actual AS (
+            SELECT u.id AS user_id,
+                   COALESCE(s.pending, 0) AS pending,
+                   COALESCE(s.approved, 0) AS approved,
+                   COALESCE(s.rejected, 0) AS rejected,
+                   COALESCE(s.returned, 0) AS returned,
+                   COALESCE(s.recalled, 0) AS recalled,
+                   COALESCE(v.vouchers_used, 0) AS vouchers_used,
+                   COALESCE(p.lifetime_points, 0) AS lifetime_points
+            FROM users u
+            LEFT JOIN (
+                SELECT id_nguoi_nop,
+                       COUNT(*) FILTER (WHERE ket_qua = 'pending') AS pending,
+                       COUNT(*) FILTER (WHERE ket_qua = 'approved') AS approved,
+                       COUNT(*) FILTER (WHERE ket_qua = 'rejected') AS rejected,
+                       COUNT(*) FILTER (WHERE ket_qua = 'returned_to_pharmacy') AS returned,
+                       COUNT(*) FILTER (WHERE ket_qua = 'recalled') AS recalled
+                FROM ho_so_xu_ly
+                GROUP BY id_nguoi_nop
+            ) s ON s.id_nguoi_nop = u.id
+            LEFT JOIN (
+                SELECT user_id, COUNT(*) AS vouchers_used
+                FROM voucher_usage
+                GROUP BY user_id
+            ) v ON v.user_id = u.id
+            LEFT JOIN (
+                SELECT id_nguoi_nop, SUM(diem) AS lifetime_points
+                FROM diem_thuong
+                GROUP BY id_nguoi_nop
+            ) p ON p.id_nguoi_nop = u.id
+        )
+        SELECT a.user_id
+        FROM actual a
+        LEFT JOIN user_stats us ON us.user_id = a.user_id
+        WHERE (us.pending, us.approved, us.rejected, us.returned, us.recalled, us.vouchers_used, us.lifetime_points)
+              IS DISTINCT FROM
+              (a.pending, a.approved, a.rejected, a.returned, a.recalled, a.vouchers_used, a.lifetime_points)
+        ORDER BY a.user_id
+    LOOP
+        IF reconcile_user_stats_for(candidate.user_id) THEN
+            changed := changed + 1;
+        END IF;
+    END LOOP;
+
+    RETURN changed;
+END;
+$$ LANGUAGE plpgsql;